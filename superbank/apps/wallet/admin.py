@@ -1,23 +1,171 @@
-from django.contrib import admin
+from uuid import UUID
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Q, Sum
-from django.utils import timezone
+from django.db.models import Sum
+from django.http import HttpResponseRedirect, QueryDict
 
-from .models import Transaction, Wallet
+from . import money
+from .api.exceptions import WalletBusyException
+from .db import shards
+from .db.replicas import read_from_replica
+from .models import APIKey, SlowRequest, Transaction, Wallet
 
 
-def update_wallet_balance(wallet):
+def lock_wallet(wallet):
     """
-    Обновляет баланс кошелька.
+    Блокирует кошелек до изменения его транзакций.
+
+    Контрольная точка баланса создается под той же блокировкой,
+    поэтому она не учтет незафиксированные изменения транзакций.
+    Кошелек переносимого слота не блокируется (shards.check_writable).
     """
-    tnx_sum = wallet.transactions.aggregate(
-        deposits=Sum("amount", filter=Q(operation_type=Transaction.DEPOSIT)),
-        withdraws=Sum("amount", filter=Q(operation_type=Transaction.WITHDRAW)),
+    shards.check_writable(wallet.pk)
+    wallet.bucket_count = (
+        Wallet.objects.db_manager(wallet._state.db)
+        .select_for_update()
+        .values_list("bucket_count", flat=True)
+        .get(pk=wallet.pk)
     )
-    new_balance = (tnx_sum["deposits"] or 0) - (tnx_sum["withdraws"] or 0)
-    wallet.balance = new_balance
-    wallet.date_updated = timezone.now()
-    wallet.save()
+
+
+def update_wallet_balance(wallet):
+    """
+    Обновляет баланс кошелька, заблокированного lock_wallet.
+
+    Суммируются только транзакции после ближайшей контрольной точки баланса.
+    В режиме корзин баланс распределяется по корзинам кошелька.
+    """
+    using = wallet._state.db
+    new_balance = wallet.get_ledger_balance(using=using)
+    buckets = wallet._lock_buckets(using) if wallet.bucket_count else []
+    wallet._spread_balance(money.to_minor(new_balance), buckets, using=using)
+
+
+class ReplicaChangeListMixin:
+    """
+    Список объектов читается с реплики (apps.wallet.db.replicas).
+
+    Запросы списка выполняются и при отрисовке шаблона (страница, иерархия дат),
+    поэтому ответ отрисовывается внутри read_from_replica. Действия над выбранными
+    объектами (POST) работают с основной базой.
+    """
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != "GET":
+            return super().changelist_view(request, extra_context)
+        with read_from_replica():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, "render"):
+                response.render()
+        return response
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """
+    Шард, объекты которого показывает список (apps.wallet.db.shards).
+
+    Строки кошельков хранятся в своих шардах, поэтому список с постраничным выводом
+    строится по одному шарду; по умолчанию — первому. С show_shard_counts у шарда
+    показывается число объектов, посчитанное по всем шардам параллельно.
+    """
+
+    title = "Шард"
+    parameter_name = "shard"
+
+    def __init__(self, request, params, model, model_admin):
+        self.selected = model_admin.get_shard(request)
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        if not shards.is_enabled():
+            return []
+        aliases = shards.get_shards()
+        if not model_admin.show_shard_counts:
+            return [(alias, alias) for alias in aliases]
+        counts = shards.scatter(lambda alias: model_admin.model.objects.using(alias).count())
+        return [(alias, f"{alias} ({count})") for alias, count in zip(aliases, counts)]
+
+    def queryset(self, request, queryset):
+        # Шард выбирает ShardedAdminMixin.get_queryset: он нужен и странице объекта.
+        return queryset
+
+    def choices(self, changelist):
+        # Варианта «Все» нет: без параметра список показывает первый шард.
+        for lookup, title in self.lookup_choices:
+            yield {
+                "selected": lookup == self.selected,
+                "query_string": changelist.get_query_string({self.parameter_name: lookup}),
+                "display": title,
+            }
+
+
+class ShardedAdminMixin:
+    """
+    Список и страницы объектов, хранящихся в шардах кошельков.
+
+    Изменение кошелька переносимого слота отменяется с сообщением, как операция API
+    получает 503.
+    """
+
+    show_shard_counts = False
+
+    def changeform_view(self, request, *args, **kwargs):
+        return self.reject_moving(request, super().changeform_view, *args, **kwargs)
+
+    def delete_view(self, request, *args, **kwargs):
+        return self.reject_moving(request, super().delete_view, *args, **kwargs)
+
+    def changelist_view(self, request, *args, **kwargs):
+        return self.reject_moving(request, super().changelist_view, *args, **kwargs)
+
+    def reject_moving(self, request, view, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except WalletBusyException:
+            self.message_user(
+                request, "Кошелек переносится в другой шард, повторите позже", messages.ERROR
+            )
+            return HttpResponseRedirect(request.get_full_path())
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if not shards.is_enabled():
+            return list_filter
+        return (ShardListFilter, *list_filter)
+
+    def get_shard(self, request):
+        """Шард из фильтра списка, в том числе сохраненного фильтра страницы объекта."""
+        parameter = ShardListFilter.parameter_name
+        shard = request.GET.get(parameter) or QueryDict(
+            request.GET.get("_changelist_filters", "")
+        ).get(parameter)
+        aliases = shards.get_shards()
+        return shard if shard in aliases else aliases[0]
+
+    def get_object_shard(self, request, object_id):
+        return self.get_shard(request)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not shards.is_enabled():
+            return queryset
+        return queryset.using(self.get_shard(request))
+
+    def get_object(self, request, object_id, from_field=None):
+        if not shards.is_enabled():
+            return super().get_object(request, object_id, from_field)
+        queryset = self.get_queryset(request).using(self.get_object_shard(request, object_id))
+        field = (
+            self.model._meta.pk if from_field is None else self.model._meta.get_field(from_field)
+        )
+        try:
+            return queryset.get(**{field.name: field.to_python(object_id)})
+        except (self.model.DoesNotExist, ValidationError, ValueError):
+            return None
 
 
 class TransactionInline(admin.TabularInline):
@@ -31,42 +179,88 @@ class TransactionInline(admin.TabularInline):
         return True
 
 
-class WalletAdmin(admin.ModelAdmin):
+class WalletChangeList(ChangeList):
+    """Список кошельков с суммой корзин, посчитанной тем же запросом."""
+
+    def get_queryset(self, request, *args, **kwargs):
+        queryset = super().get_queryset(request, *args, **kwargs)
+        return queryset.annotate(buckets_balance=Sum("buckets__balance"))
+
+
+class WalletAdmin(ShardedAdminMixin, ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = (
         "uuid",
-        "balance",
+        "total_balance",
+        "bucket_count",
         "date_created",
         "date_updated",
     )
     readonly_fields = (
         "uuid",
-        "balance",
+        "total_balance",
+        "bucket_count",
         "date_created",
         "date_updated",
     )
     inlines = [TransactionInline]
+    actions = ["enable_buckets", "disable_buckets"]
+    show_shard_counts = True
+
+    def get_object_shard(self, request, object_id):
+        try:
+            return shards.shard_for(UUID(object_id))
+        except ValueError:
+            return self.get_shard(request)
+
+    def get_formset_kwargs(self, request, obj, inline, prefix):
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        # Транзакции кошелька читаются из его шарда.
+        if obj._state.db is not None:
+            kwargs["queryset"] = inline.get_queryset(request).using(obj._state.db)
+        return kwargs
+
+    def get_changelist(self, request, **kwargs):
+        return WalletChangeList
+
+    @admin.display(description="Баланс")
+    def total_balance(self, obj):
+        if hasattr(obj, "buckets_balance"):
+            return obj.balance + (obj.buckets_balance or 0)
+        return obj.get_balance()
+
+    @admin.action(description="Включить корзины баланса")
+    def enable_buckets(self, request, queryset):
+        for wallet in queryset:
+            wallet.set_bucket_count(settings.WALLET_BUCKET_COUNT)
+
+    @admin.action(description="Выключить корзины баланса")
+    def disable_buckets(self, request, queryset):
+        for wallet in queryset:
+            wallet.set_bucket_count(0)
 
     def save_formset(self, request, form, formset, change):
         """
         После сохранения транзакции пересчитываем баланс кошелька.
-        Здесь валидация не выполняется.
-        То есть, балан может быть отрицательным.
+        Здесь валидация не выполняется, но отрицательный баланс
+        не пропустит ограничение wallet_balance_non_negative в базе данных.
         """
         instances = formset.save(commit=False)
         deleted_instances = formset.deleted_objects
 
-        with transaction.atomic():
+        wallet = form.instance
+        with transaction.atomic(using=wallet._state.db):
+            lock_wallet(wallet)
+
             for obj in deleted_instances:
                 obj.delete()
 
             for obj in instances:
                 obj.save()
 
-            wallet = form.instance
             update_wallet_balance(wallet)
 
 
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(ShardedAdminMixin, ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "wallet",
@@ -75,16 +269,80 @@ class TransactionAdmin(admin.ModelAdmin):
         "date_created",
     )
     readonly_fields = ("id", "wallet", "date_created")
+    # Отбор по дате читает только партиции нужных месяцев, а полный подсчет строк
+    # обошел бы все партиции.
+    date_hierarchy = "date_created"
+    show_full_result_count = False
 
     def save_model(self, request, obj, form, change):
         """
         После сохранения транзакции пересчитываем баланс кошелька.
         """
-        with transaction.atomic():
+        wallet = obj.wallet
+        with transaction.atomic(using=wallet._state.db):
+            lock_wallet(wallet)
             obj.save()
-            wallet = obj.wallet
             update_wallet_balance(wallet)
 
+    def delete_model(self, request, obj):
+        """
+        После удаления транзакции пересчитываем баланс кошелька.
+        """
+        wallet = obj.wallet
+        with transaction.atomic(using=wallet._state.db):
+            lock_wallet(wallet)
+            obj.delete()
+            update_wallet_balance(wallet)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic(using=queryset.db):
+            for obj in queryset.select_related("wallet").order_by("wallet_id"):
+                self.delete_model(request, obj)
+
+
+class SlowRequestAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = (
+        "date_created",
+        "method",
+        "path",
+        "status",
+        "duration",
+        "query_count",
+        "timings",
+    )
+    list_filter = ("endpoint", "status")
+    readonly_fields = (
+        "method",
+        "path",
+        "endpoint",
+        "status",
+        "duration",
+        "timings",
+        "query_count",
+        "queries",
+        "profile",
+        "date_created",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class APIKeyAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    """Ключи создаются командой create_api_key; здесь их можно отозвать."""
+
+    list_display = ("prefix", "user", "name", "is_active", "date_created")
+    list_filter = ("is_active",)
+    readonly_fields = ("prefix", "user", "date_created")
+
+    def has_add_permission(self, request):
+        return False
+
 
 admin.site.register(Wallet, WalletAdmin)
 admin.site.register(Transaction, TransactionAdmin)
+admin.site.register(SlowRequest, SlowRequestAdmin)
+admin.site.register(APIKey, APIKeyAdmin)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .async_views import AsyncCreateTransactionView, AsyncGetWalletBalanceView
+
+urlpatterns = [
+    path("<str:wallet_uuid>/operation/", AsyncCreateTransactionView.as_view(), name="async-create-transaction"),
+    path("<str:wallet_uuid>/", AsyncGetWalletBalanceView.as_view(), name="async-wallet-balance"),
+]
@@ -0,0 +1,182 @@
+import logging
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+
+from apps.wallet.api.authentication import APIKeyAuthentication, BasicAuthentication
+from apps.wallet.api.exceptions import RestApiException
+from apps.wallet.api import parsers, renderers
+from apps.wallet.api.serializers import transaction_validator
+from apps.wallet.api.views import balance_response_data, transaction_response_data
+from apps.wallet.db import async_pool
+from apps.wallet.models import Wallet
+
+logger = logging.getLogger("apps.wallet")
+
+
+class APIResponse(HttpResponse):
+    """Ответ с данными, которые AsyncAPIView.dispatch кодирует в JSON или MessagePack."""
+
+    def __init__(self, data, status=status.HTTP_200_OK, **kwargs):
+        super().__init__(status=status, **kwargs)
+        self.data = data
+
+    def encode(self, request):
+        if renderers.accepts_msgpack(request):
+            self.content = renderers.msgpack_encoder.encode(self.data)
+            self["Content-Type"] = renderers.MSGPACK_MEDIA_TYPE
+        else:
+            self.content = renderers.json_encoder.encode(self.data)
+            self["Content-Type"] = "application/json"
+        return self
+
+
+def wallet_not_found(wallet_uuid):
+    """Ответ 404 для несуществующего кошелька."""
+    logger.warning(f"Кошелек не найден: {wallet_uuid}")
+    return APIResponse({"error": "Кошелек не найден"}, status=status.HTTP_404_NOT_FOUND)
+
+
+class AsyncAPIView(View):
+    """
+    Базовое асинхронное представление API кошелька.
+
+    APIView из DRF синхронные, и под ASGI каждый запрос к ним уходит в поток через
+    sync_to_async. Асинхронные представления обрабатывают запрос в цикле событий,
+    а запросы к PostgreSQL выполняют через пул асинхронных соединений.
+
+    Поведение повторяет синхронные представления: те же проверки, ошибки и тело ответа,
+    тело запроса и ответа — JSON или MessagePack (apps.wallet.api.renderers).
+    Учетные данные (BasicAuthentication, APIKeyAuthentication) проверяются, только если
+    они переданы в запросе.
+
+    """
+
+    authentication_classes = [BasicAuthentication, APIKeyAuthentication]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Как и APIView, API не использует сессии, поэтому CSRF не проверяется.
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Вне ASGI цикл событий создается на каждый запрос, и пул соединений не нужен.
+        async_pool.use_pool(isinstance(request, ASGIRequest))
+
+        try:
+            await self.perform_authentication(request)
+        except AuthenticationFailed as e:
+            response = APIResponse(
+                {"detail": e.detail},
+                status=status.HTTP_401_UNAUTHORIZED,
+                headers={"WWW-Authenticate": 'Basic realm="api"'},
+            )
+        else:
+            response = await super().dispatch(request, *args, **kwargs)
+
+        if isinstance(response, APIResponse):
+            response.encode(request)
+        return response
+
+    async def perform_authentication(self, request):
+        if "HTTP_AUTHORIZATION" not in request.META:
+            return
+
+        for authentication_class in self.authentication_classes:
+            user_auth = await sync_to_async(authentication_class().authenticate)(
+                request
+            )
+            if user_auth is not None:
+                request.user, request.auth = user_auth
+                return
+
+    def get_data(self, request):
+        if request.content_type == "application/json":
+            return parsers.json_decoder.decode(request.body) if request.body else {}
+        if request.content_type == renderers.MSGPACK_MEDIA_TYPE:
+            return parsers.msgpack_decoder.decode(request.body) if request.body else {}
+        return request.POST
+
+
+class AsyncCreateTransactionView(AsyncAPIView):
+    """
+
+    Асинхронная версия CreateTransactionView.
+
+    Запрос:
+    POST api/v1/async/wallets/<WALLET_UUID>/operation/
+        {
+            operation_type: “DEPOSIT” or “WITHDRAW”,
+            amount: 1000
+        }
+
+    """
+
+    validator = transaction_validator
+    http_method_names = ["post"]
+
+    async def post(self, request, wallet_uuid, *args, **kwargs):
+        try:
+            data = self.get_data(request)
+        except ValueError:
+            return APIResponse(
+                {"error": "Некорректный JSON"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        validated_data, errors = self.validator.validate(data)
+        if errors:
+            logger.warning(f"Некорректный запрос: {errors}")
+            return APIResponse({"error": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            wallet = Wallet(uuid=UUID(wallet_uuid))
+        except ValueError:
+            return wallet_not_found(wallet_uuid)
+
+        operation_type = validated_data["operation_type"]
+        amount = validated_data["amount"]
+        try:
+            await wallet.atransaction(amount=amount, tnx_type=operation_type)
+        except Wallet.DoesNotExist:
+            return wallet_not_found(wallet_uuid)
+        except RestApiException as e:
+            headers = {"Retry-After": str(e.wait)} if getattr(e, "wait", None) else None
+            return APIResponse(e.detail, status=e.status_code, headers=headers)
+        except ValueError as e:
+            logger.error(f"Ошибка при создании транзакции: {str(e)}")
+            return APIResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        balance = await wallet.aget_balance() if wallet.bucket_count else wallet.balance
+        return APIResponse(
+            transaction_response_data(wallet, balance, amount, operation_type),
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class AsyncGetWalletBalanceView(AsyncAPIView):
+    """
+
+    Асинхронная версия GetWalletBalanceView.
+
+    Запрос:
+    GET api/v1/async/wallets/{WALLET_UUID}/
+
+    """
+
+    http_method_names = ["get"]
+
+    async def get(self, request, wallet_uuid, *args, **kwargs):
+        try:
+            wallet = Wallet(uuid=UUID(wallet_uuid))
+            balance = await wallet.aget_balance()
+        except (ValueError, Wallet.DoesNotExist):
+            return wallet_not_found(wallet_uuid)
+
+        return APIResponse(balance_response_data(wallet, balance))
@@ -0,0 +1,135 @@
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework import authentication, exceptions
+
+from apps.wallet import profiling
+from apps.wallet.models import APIKey
+
+
+class CredentialCache:
+    """
+    Успешные проверки пароля Basic-аутентификации в памяти процесса.
+
+    Ключ записи — HMAC имени пользователя и пароля со случайной солью процесса: пароль
+    в памяти не хранится. Значение — pk пользователя, хеш его пароля из базы на момент
+    проверки и срок жизни записи. Запись действует, пока пароль пользователя в базе
+    не изменился: смена пароля в любом воркере сбрасывает ее при следующем запросе.
+
+    Хранится не больше WALLET_AUTH_CACHE_SIZE записей (лишними вытесняются давно
+    использованные), каждая не дольше WALLET_AUTH_CACHE_TTL секунд. 0 — кеш выключен.
+
+    """
+
+    def __init__(self):
+        self._salt = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def make_key(self, username, password):
+        message = f"{len(username)}:{username}:{password}".encode()
+        return hmac.new(self._salt, message, hashlib.sha256).digest()
+
+    @staticmethod
+    def password_digest(user):
+        return hashlib.sha256(user.password.encode()).digest()
+
+    def get(self, key):
+        """(pk пользователя, хеш пароля) или None, если записи нет или она устарела."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user_pk, password_digest, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user_pk, password_digest
+
+    def set(self, key, user):
+        size, ttl = settings.WALLET_AUTH_CACHE_SIZE, settings.WALLET_AUTH_CACHE_TTL
+        if not size or not ttl:
+            return
+        entry = (user.pk, self.password_digest(user), time.monotonic() + ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+credential_cache = CredentialCache()
+
+
+class BasicAuthentication(authentication.BasicAuthentication):
+    """
+    Basic-аутентификация API кошелька с учетом времени в этапе auth (Server-Timing).
+
+    Повторная проверка тех же имени и пароля берет результат из credential_cache:
+    одно чтение пользователя по pk вместо хеширования пароля (PBKDF2).
+
+    """
+
+    def authenticate(self, request):
+        with profiling.phase("auth"):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, userid, password, request=None):
+        key = credential_cache.make_key(userid, password)
+        cached = credential_cache.get(key)
+        if cached is not None:
+            user_pk, password_digest = cached
+            user = get_user_model()._default_manager.filter(pk=user_pk).first()
+            if (
+                user is not None
+                and user.is_active
+                and user.get_username() == userid
+                and hmac.compare_digest(credential_cache.password_digest(user), password_digest)
+            ):
+                return user, None
+            credential_cache.discard(key)
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        credential_cache.set(key, user)
+        return user, auth
+
+
+class APIKeyAuthentication(authentication.BaseAuthentication):
+    """Аутентификация ключом API (APIKey): заголовок Authorization: Api-Key <ключ>."""
+
+    keyword = "Api-Key"
+
+    def authenticate(self, request):
+        with profiling.phase("auth"):
+            auth = authentication.get_authorization_header(request).split()
+            if not auth or auth[0].lower() != self.keyword.lower().encode():
+                return None
+            if len(auth) != 2:
+                raise exceptions.AuthenticationFailed("Некорректный заголовок Api-Key")
+            try:
+                key = auth[1].decode()
+            except UnicodeError:
+                raise exceptions.AuthenticationFailed("Некорректный заголовок Api-Key")
+
+            user = APIKey.get_user(key)
+            if user is None:
+                raise exceptions.AuthenticationFailed("Неверный ключ API")
+            return user, key
+
+    def authenticate_header(self, request):
+        return self.keyword
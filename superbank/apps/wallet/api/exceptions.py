@@ -24,3 +24,23 @@ class InvalidAmountException(RestApiException):
 
 class InvalidTypeException(RestApiException):
     default_detail = "Некорректный тип транзации"
+
+
+class InvalidTransferException(RestApiException):
+    default_detail = "Некорректный перевод"
+
+
+class IdempotencyKeyMismatch(RestApiException):
+    status_code = 422
+    default_detail = "Ключ идемпотентности уже использован для другого запроса"
+
+
+class WalletBusyException(RestApiException):
+    """Кошелек заблокирован другими операциями; wait — секунды для Retry-After."""
+
+    status_code = 503
+    default_detail = "Кошелек занят другими операциями, повторите запрос позже"
+
+    def __init__(self, msg=None, wait=None, *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+        self.wait = wait
@@ -0,0 +1,28 @@
+"""Разбор тела запроса через msgspec: JSON и MessagePack (apps.wallet.api.renderers)."""
+
+import msgspec
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from apps.wallet.api.renderers import MSGPACK_MEDIA_TYPE
+
+json_decoder = msgspec.json.Decoder()
+msgpack_decoder = msgspec.msgpack.Decoder()
+
+
+class JSONParser(parsers.JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return json_decoder.decode(stream.read())
+        except msgspec.DecodeError as e:
+            raise ParseError(f"JSON parse error - {e}")
+
+
+class MessagePackParser(parsers.BaseParser):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack_decoder.decode(stream.read())
+        except msgspec.DecodeError as e:
+            raise ParseError(f"MessagePack parse error - {e}")
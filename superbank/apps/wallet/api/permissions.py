@@ -0,0 +1,18 @@
+import ipaddress
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+class InternalAddress(BasePermission):
+    """Запрос с адреса из сетей WALLET_METRICS_ALLOWED_NETWORKS."""
+
+    def has_permission(self, request, view):
+        try:
+            address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+        except ValueError:
+            return False
+        return any(
+            address in ipaddress.ip_network(network)
+            for network in settings.WALLET_METRICS_ALLOWED_NETWORKS
+        )
@@ -0,0 +1,65 @@
+"""
+Отрисовка ответов API через msgspec: JSON и MessagePack.
+
+JSONRenderer отдает тот же JSON, что и JSONRenderer DRF, но кодирует его msgspec без
+обхода данных на Python. Отличия: Decimal остается числом без перевода во float,
+datetime и timedelta записываются в формате RFC 3339 (ответы API передают их строками).
+
+MessagePackRenderer выбирается по заголовку Accept: application/msgpack — для
+клиентов с большим потоком запросов. Decimal в MessagePack записывается строкой.
+
+"""
+
+import msgspec
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework import renderers
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def enc_hook(obj):
+    """Типы, которые msgspec не кодирует сам: ErrorDetail, ленивые строки, QuerySet."""
+    if isinstance(obj, str):
+        return str(obj)
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if hasattr(obj, "__iter__"):
+        return tuple(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+json_encoder = msgspec.json.Encoder(enc_hook=enc_hook, decimal_format="number")
+msgpack_encoder = msgspec.msgpack.Encoder(enc_hook=enc_hook)
+
+
+def accepts_msgpack(request):
+    """Клиент явно запросил MessagePack в заголовке Accept."""
+    return any(
+        media_type.main_type == "application" and media_type.sub_type == "msgpack"
+        for media_type in request.accepted_types
+    )
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        content = json_encoder.encode(data)
+        indent = self.get_indent(accepted_media_type or "", renderer_context or {})
+        if indent:
+            return msgspec.json.format(content, indent=indent)
+        return content
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = MSGPACK_MEDIA_TYPE
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack_encoder.encode(data)
@@ -1,9 +1,26 @@
+import base64
+from collections.abc import Mapping
+from datetime import datetime
+
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.fields import empty
+from rest_framework.settings import api_settings
 
+from apps.wallet import export, money, profiling
 from apps.wallet.models import Transaction
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class ProfiledValidationMixin:
+    """Учет времени проверки данных в этапе validation (Server-Timing)."""
+
+    def is_valid(self, *, raise_exception=False):
+        with profiling.phase("validation"):
+            return super().is_valid(raise_exception=raise_exception)
+
+
+class TransactionSerializer(ProfiledValidationMixin, serializers.ModelSerializer):
     """Сериализатор для транзакций."""
 
     operation_type = serializers.ChoiceField(
@@ -16,8 +33,8 @@ class TransactionSerializer(serializers.ModelSerializer):
     )
     amount = serializers.DecimalField(
         required=True,
-        max_digits=12,
-        decimal_places=2,
+        max_digits=money.MAX_DIGITS,
+        decimal_places=money.get_exponent(),
         error_messages={
             "required": "Необходимо указать сумму транзакции",
             "invalid": "Некорректная сумма",
@@ -27,7 +44,7 @@ class TransactionSerializer(serializers.ModelSerializer):
     def to_internal_value(self, data):
         data = dict(data.items())
 
-        if "operation_type" in data:
+        if isinstance(data.get("operation_type"), str):
             data["operation_type"] = data["operation_type"].lower()
 
         return super().to_internal_value(data)
@@ -38,3 +55,152 @@ class TransactionSerializer(serializers.ModelSerializer):
             "operation_type",
             "amount",
         )
+
+
+class BatchOperationSerializer(TransactionSerializer):
+    """Сериализатор операции из пакета операций по нескольким кошелькам."""
+
+    wallet_uuid = serializers.UUIDField(
+        required=True,
+        error_messages={
+            "required": "Необходимо указать UUID кошелька",
+            "invalid": "Некорректный UUID кошелька",
+        },
+    )
+
+    class Meta(TransactionSerializer.Meta):
+        fields = TransactionSerializer.Meta.fields + ("wallet_uuid",)
+
+
+class OperationValidator:
+    """
+    Проверка операции полями сериализатора без его создания на каждый запрос.
+
+    Поля сериализатора создаются один раз, и каждое поле проверяет свое значение
+    само: без копирования полей и данных запроса, которое выполняет сериализатор.
+    Ошибки и проверенные значения совпадают с ошибками и validated_data сериализатора.
+
+    """
+
+    def __init__(self, serializer_class):
+        self.fields = tuple(serializer_class().fields.items())
+
+    def validate(self, data):
+        """Проверенные данные и ошибки по полям; при ошибках данные равны None."""
+        with profiling.phase("validation"):
+            if not isinstance(data, Mapping):
+                message = serializers.Serializer.default_error_messages["invalid"]
+                return None, {
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        ErrorDetail(
+                            message.format(datatype=type(data).__name__), code="invalid"
+                        )
+                    ]
+                }
+
+            validated_data, errors = {}, {}
+            for name, field in self.fields:
+                value = data.get(name, empty)
+                if name == "operation_type" and isinstance(value, str):
+                    value = value.lower()
+                try:
+                    validated_data[name] = field.run_validation(value)
+                except serializers.ValidationError as e:
+                    errors[name] = e.detail
+            if errors:
+                return None, errors
+            return validated_data, None
+
+
+class TransferSerializer(ProfiledValidationMixin, serializers.Serializer):
+    """Сериализатор перевода между кошельками."""
+
+    source_wallet_uuid = serializers.UUIDField(
+        required=True,
+        error_messages={
+            "required": "Необходимо указать UUID кошелька списания",
+            "invalid": "Некорректный UUID кошелька",
+        },
+    )
+    target_wallet_uuid = serializers.UUIDField(
+        required=True,
+        error_messages={
+            "required": "Необходимо указать UUID кошелька зачисления",
+            "invalid": "Некорректный UUID кошелька",
+        },
+    )
+    amount = serializers.DecimalField(
+        required=True,
+        max_digits=money.MAX_DIGITS,
+        decimal_places=money.get_exponent(),
+        error_messages={
+            "required": "Необходимо указать сумму перевода",
+            "invalid": "Некорректная сумма",
+        },
+    )
+
+
+transaction_validator = OperationValidator(TransactionSerializer)
+batch_operation_validator = OperationValidator(BatchOperationSerializer)
+
+
+class TransactionFilterSerializer(ProfiledValidationMixin, serializers.Serializer):
+    """Сериализатор фильтров транзакций кошелька по типу и дате."""
+
+    operation_type = serializers.ChoiceField(
+        choices=Transaction.TYPE_CHOICES,
+        required=False,
+        error_messages={"invalid_choice": "Некорректный тип транзакции"},
+    )
+    date_from = serializers.DateTimeField(
+        required=False, error_messages={"invalid": "Некорректная дата"}
+    )
+    date_to = serializers.DateTimeField(
+        required=False, error_messages={"invalid": "Некорректная дата"}
+    )
+
+    def to_internal_value(self, data):
+        data = dict(data.items())
+
+        if "operation_type" in data:
+            data["operation_type"] = data["operation_type"].lower()
+
+        return super().to_internal_value(data)
+
+
+class TransactionHistorySerializer(TransactionFilterSerializer):
+    """Сериализатор параметров запроса истории транзакций кошелька."""
+
+    limit = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=settings.WALLET_HISTORY_MAX_LIMIT,
+        default=settings.WALLET_HISTORY_DEFAULT_LIMIT,
+    )
+    cursor = serializers.CharField(required=False)
+
+    def validate_cursor(self, value):
+        try:
+            date_created, pk = (
+                base64.urlsafe_b64decode(value.encode()).decode().split("|")
+            )
+            return datetime.fromisoformat(date_created), int(pk)
+        except ValueError:
+            raise serializers.ValidationError("Некорректный курсор")
+
+    @staticmethod
+    def make_cursor(txn):
+        return base64.urlsafe_b64encode(
+            f"{txn.date_created.isoformat()}|{txn.pk}".encode()
+        ).decode()
+
+
+class TransactionExportSerializer(TransactionFilterSerializer):
+    """Сериализатор параметров выгрузки транзакций."""
+
+    output = serializers.ChoiceField(
+        choices=list(export.FORMATS),
+        required=False,
+        default="ndjson",
+        error_messages={"invalid_choice": "Некорректный формат выгрузки"},
+    )
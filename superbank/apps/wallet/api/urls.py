@@ -1,8 +1,19 @@
 from django.urls import path
 
-from .views import CreateTransactionView, GetWalletBalanceView
+from .views import (
+    BatchOperationsView,
+    CreateTransactionView,
+    GetWalletBalanceView,
+    TransactionExportView,
+    TransactionHistoryView,
+    TransactionRangeExportView,
+)
 
 urlpatterns = [
+    path("batch/operations/", BatchOperationsView.as_view(), name="batch-operations"),
+    path("transactions/export/", TransactionRangeExportView.as_view(), name="transaction-range-export"),
     path("<str:wallet_uuid>/operation/", CreateTransactionView.as_view(), name="create-transaction"),
+    path("<str:wallet_uuid>/transactions/export/", TransactionExportView.as_view(), name="transaction-export"),
+    path("<str:wallet_uuid>/transactions/", TransactionHistoryView.as_view(), name="transaction-history"),
     path("<str:wallet_uuid>/", GetWalletBalanceView.as_view(), name="wallet-balance"),
 ]
@@ -1,19 +1,120 @@
 import logging
+import re
+from uuid import UUID
 
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.dateparse import parse_datetime
 from rest_framework import status
-from rest_framework.authentication import BasicAuthentication
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.wallet.api.serializers import TransactionSerializer
-from apps.wallet.models import Wallet
+from apps.wallet import export, metrics
+from apps.wallet.api.authentication import APIKeyAuthentication, BasicAuthentication
+from apps.wallet.api.exceptions import RestApiException, WalletBusyException
+from apps.wallet.api.permissions import InternalAddress
+from apps.wallet.api.serializers import (
+    TransactionExportSerializer,
+    TransactionHistorySerializer,
+    TransactionSerializer,
+    TransferSerializer,
+    batch_operation_validator,
+    transaction_validator,
+)
+from apps.wallet.db import pool
+from apps.wallet.db.replicas import read_from_replica
+from apps.wallet.models import IdempotencyKey, Transaction, Wallet
 
 logger = logging.getLogger("apps.wallet")
 
+IDEMPOTENCY_KEY_MAX_LENGTH = IdempotencyKey._meta.get_field("key").max_length
+GZIP_RE = re.compile(r"\bgzip\b")
 
-class CreateTransactionView(APIView):
+
+def wallet_not_found(wallet_uuid):
+    """Ответ 404 для несуществующего кошелька."""
+    logger.warning(f"Кошелек не найден: {wallet_uuid}")
+    return Response({"error": "Кошелек не найден"}, status=status.HTTP_404_NOT_FOUND)
+
+
+def balance_response_data(wallet, balance):
+    """Тело ответа с балансом кошелька."""
+    return {
+        "status": "success",
+        "wallet": {
+            "uuid": str(wallet.uuid),
+            "balance": str(balance),
+        },
+    }
+
+
+def transaction_response_data(wallet, balance, amount, operation_type):
+    """Тело ответа о проведенной транзакции."""
+    response_data = balance_response_data(wallet, balance)
+    response_data["transaction"] = {
+        "uuid": str(wallet.last_transaction_uuid),
+        "amount": str(amount),
+        "type": operation_type,
+        "timestamp": wallet.date_updated.isoformat(),
+    }
+    return response_data
+
+
+class IdempotentRequestMixin:
+    """
+    Проведение запроса один раз на заголовок Idempotency-Key (IdempotencyKey).
+
+    Повтор с тем же ключом получает сохраненный ответ с заголовком
+    Idempotent-Replayed, повтор с другими данными — IdempotencyKeyMismatch.
+    """
+
+    def idempotent_response(self, request, process, request_hash_parts, wallet_uuid):
+        """
+        Ответ process() с учетом Idempotency-Key.
+
+        request_hash_parts — данные запроса для IdempotencyKey.make_request_hash,
+        wallet_uuid определяет шард ключа.
+        """
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key is None:
+            return process()
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {"error": "Некорректный заголовок Idempotency-Key"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        def handler():
+            try:
+                response = process()
+            except WalletBusyException:
+                # Ключ не сохраняется, ответ с Retry-After формирует DRF.
+                raise
+            except RestApiException as e:
+                return e.status_code, e.detail
+            return response.status_code, response.data
+
+        status_code, response_data, replayed = IdempotencyKey.execute(
+            idempotency_key,
+            IdempotencyKey.make_request_hash(*request_hash_parts),
+            handler,
+            wallet_uuid=wallet_uuid,
+        )
+
+        response = Response(response_data, status=status_code)
+        if replayed:
+            response["Idempotent-Replayed"] = "true"
+        return response
+
+
+class CreateTransactionView(IdempotentRequestMixin, APIView):
     """
 
     1. Для создания транзакции кошелек должен быть создан.
@@ -25,10 +126,12 @@ class CreateTransactionView(APIView):
         - amount: сумма транзакции
     3. При успешном создании транзакции возвращается статус 201.
     4. При некорректном запросе возвращается ошибка 400.
+    5. Запрос можно повторять с тем же заголовком Idempotency-Key: операция будет
+    проведена один раз, а повтор получит сохраненный ответ с заголовком
+    Idempotent-Replayed (см. IdempotencyKey).
 
-    Использование сериализатора для валидации данных в данном примере излишне, но при большем количестве
-    полей в запросе, а также при необходимости валидации данных, использование сериализатора является
-    более предпочтительным.
+    Данные проверяет OperationValidator полями TransactionSerializer: ошибки те же,
+    что у сериализатора, но поля не создаются заново на каждый запрос.
 
     Запрос:
     POST api/v1/wallets/<WALLET_UUID>/operation
@@ -40,28 +143,35 @@ class CreateTransactionView(APIView):
     """
 
     permission_classes = [AllowAny]
-    authentication_classes = [BasicAuthentication]
-    serializer_class = TransactionSerializer
+    authentication_classes = [BasicAuthentication, APIKeyAuthentication]
+    validator = transaction_validator
     http_method_names = ["post"]
 
     def post(self, request, wallet_uuid, *args, **kwargs):
+        validated_data, errors = self.validator.validate(request.data)
+        if errors:
+            logger.warning(f"Некорректный запрос: {errors}")
+            return Response({"error": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Кошелек заранее не читаем: его существование и баланс проверяет
+        # условный UPDATE при проведении транзакции.
         try:
-            wallet = Wallet.objects.get(uuid=wallet_uuid)
-        except Wallet.DoesNotExist:
-            logger.warning(f"Кошелек не найден: {wallet_uuid}")
-            return Response(
-                {"error": "Кошелек не найден"}, status=status.HTTP_404_NOT_FOUND
-            )
+            wallet = Wallet(uuid=UUID(wallet_uuid))
+        except ValueError:
+            return wallet_not_found(wallet_uuid)
 
-        serializer = self.serializer_class(data=request.data)
-        if not serializer.is_valid():
-            logger.warning(f"Некорректный запрос: {serializer.errors}")
-            return Response(
-                {"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST
-            )
+        return self.idempotent_response(
+            request,
+            lambda: self._handle_transaction(wallet, wallet_uuid, validated_data),
+            (wallet.uuid, validated_data["operation_type"], validated_data["amount"]),
+            wallet.uuid,
+        )
 
+    def _handle_transaction(self, wallet, wallet_uuid, validated_data):
         try:
-            return self._process_transaction(wallet, serializer.validated_data)
+            return self._process_transaction(wallet, validated_data)
+        except Wallet.DoesNotExist:
+            return wallet_not_found(wallet_uuid)
         except ValueError as e:
             logger.error(f"Ошибка при создании транзакции: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -71,23 +181,161 @@ class CreateTransactionView(APIView):
         operation_type = validated_data["operation_type"]
         amount = validated_data["amount"]
 
-        # Выполняем транзакцию
+        # Выполняем транзакцию. Баланс и время изменения приходят из RETURNING.
         wallet.transaction(amount=amount, tnx_type=operation_type)
 
         # Формируем ответ
+        response_data = transaction_response_data(
+            wallet, wallet.get_balance(), amount, operation_type
+        )
+
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+
+class BatchOperationsView(APIView):
+    """
+
+    Проведение пакета операций по нескольким кошелькам одним запросом.
+
+    Все операции проводятся в одной транзакции базы данных (при шардировании —
+    в одной транзакции каждого шарда). Некорректные операции,
+    операции по несуществующим кошелькам и операции, для которых недостаточно средств,
+    отклоняются, остальные проводятся. Результат возвращается для каждой операции
+    в порядке их следования в запросе.
+
+    Запрос:
+    POST api/v1/wallets/batch/operations/
+        {
+            operations: [
+                {wallet_uuid: <WALLET_UUID>, operation_type: “DEPOSIT” or “WITHDRAW”, amount: 1000},
+                ...
+            ]
+        }
+
+    """
+
+    permission_classes = [AllowAny]
+    authentication_classes = [BasicAuthentication, APIKeyAuthentication]
+    validator = batch_operation_validator
+    http_method_names = ["post"]
+
+    def post(self, request, *args, **kwargs):
+        items = request.data.get("operations") if hasattr(request.data, "get") else None
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "Необходимо передать непустой список операций"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > settings.WALLET_BATCH_MAX_OPERATIONS:
+            return Response(
+                {
+                    "error": "Превышено количество операций в запросе: {limit}".format(
+                        limit=settings.WALLET_BATCH_MAX_OPERATIONS
+                    )
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = [None] * len(items)
+        operations, positions = [], []
+        for index, item in enumerate(items):
+            validated_data, errors = self.validator.validate(item)
+            if errors:
+                results[index] = {"status": "error", "error": errors}
+            else:
+                operations.append(validated_data)
+                positions.append(index)
+
+        if operations:
+            for index, result in zip(positions, Wallet.batch_transactions(operations)):
+                results[index] = result
+
         response_data = {
             "status": "success",
-            "wallet": {
-                "uuid": str(wallet.uuid),
-                "balance": str(wallet.balance),
-            },
-            "transaction": {
-                "amount": str(amount),
-                "type": operation_type,
-                "timestamp": timezone.now().isoformat(),
-            },
+            "succeeded": 0,
+            "failed": 0,
+            "results": [],
+        }
+        for index, result in enumerate(results):
+            response_data["succeeded" if result["status"] == "success" else "failed"] += 1
+            if "wallet_uuid" in result:
+                result["wallet_uuid"] = str(result["wallet_uuid"])
+            if "balance" in result:
+                result["balance"] = str(result["balance"])
+            if "transaction_uuid" in result:
+                result["transaction_uuid"] = str(result["transaction_uuid"])
+            response_data["results"].append({"index": index, **result})
+
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+class TransferView(IdempotentRequestMixin, APIView):
+    """
+
+    Перевод средств между кошельками.
+
+    Снятие с одного кошелька и внесение на другой проводятся в одной транзакции
+    базы данных (Wallet.transfer): либо обе операции, либо ни одной. Запрос, как и
+    операцию, можно повторять с заголовком Idempotency-Key. Перевод между кошельками
+    разных шардов (apps.wallet.db.shards) отклоняется с ошибкой 400.
+
+    Запрос:
+    POST api/v1/transfers/
+        {
+            source_wallet_uuid: <WALLET_UUID>,
+            target_wallet_uuid: <WALLET_UUID>,
+            amount: 1000
         }
 
+    """
+
+    permission_classes = [AllowAny]
+    authentication_classes = [BasicAuthentication, APIKeyAuthentication]
+    serializer_class = TransferSerializer
+    http_method_names = ["post"]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            logger.warning(f"Некорректный запрос: {serializer.errors}")
+            return Response(
+                {"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+        data = serializer.validated_data
+
+        return self.idempotent_response(
+            request,
+            lambda: self._process_transfer(data),
+            (
+                Transaction.TRANSFER,
+                data["source_wallet_uuid"],
+                data["target_wallet_uuid"],
+                data["amount"],
+            ),
+            data["source_wallet_uuid"],
+        )
+
+    def _process_transfer(self, data):
+        source = Wallet(uuid=data["source_wallet_uuid"])
+        try:
+            withdraw, deposit = source.transfer(data["target_wallet_uuid"], data["amount"])
+        except Wallet.DoesNotExist:
+            logger.warning(
+                "Кошелек перевода не найден: {source} -> {target}".format(
+                    source=data["source_wallet_uuid"], target=data["target_wallet_uuid"]
+                )
+            )
+            return Response({"error": "Кошелек не найден"}, status=status.HTTP_404_NOT_FOUND)
+
+        response_data = balance_response_data(source, source.balance)
+        response_data["transfer"] = {
+            "uuid": str(withdraw.transfer_uuid),
+            "amount": str(data["amount"]),
+            "target_wallet_uuid": str(deposit.wallet_id),
+            "withdraw_transaction_uuid": str(withdraw.uuid),
+            "deposit_transaction_uuid": str(deposit.uuid),
+            "timestamp": source.date_updated.isoformat(),
+        }
         return Response(response_data, status=status.HTTP_201_CREATED)
 
 
@@ -97,31 +345,257 @@ class GetWalletBalanceView(APIView):
     Возвращает текущий баланс кошелька.
     Если кошелек не найден, возвращается ошибка 404.
 
+    Баланс читается через кеш балансов (apps.wallet.cache). Ответ содержит ETag
+    по балансу и времени его изменения: на запрос с совпадающим If-None-Match
+    возвращается 304 без тела.
+
+    С параметром as_of возвращается баланс по транзакциям на этот момент
+    (Wallet.get_ledger_balance).
+
+    Чтения могут идти на реплику (apps.wallet.db.replicas); баланс для кеша читается
+    из основной базы.
+
     Запрос:
     GET api/v1/wallets/{WALLET_UUID}
+    GET api/v1/wallets/{WALLET_UUID}?as_of=2025-01-01T00:00:00Z
 
     """
 
     permission_classes = [AllowAny]
-    authentication_classes = [BasicAuthentication]
+    authentication_classes = [BasicAuthentication, APIKeyAuthentication]
     serializer_class = TransactionSerializer
     http_method_names = ["get"]
 
+    @read_from_replica()
     def get(self, request, wallet_uuid, *args, **kwargs):
+        if "as_of" in request.query_params:
+            return self._get_ledger_balance(request, wallet_uuid)
+
         try:
-            wallet = Wallet.objects.get(uuid=wallet_uuid)
-        except Wallet.DoesNotExist:
-            logger.warning(f"Кошелек не найден: {wallet_uuid}")
+            wallet = Wallet(uuid=UUID(wallet_uuid))
+            balance, wallet.date_updated = Wallet.get_cached_balance(wallet.uuid)
+        except (ValueError, Wallet.DoesNotExist):
+            return wallet_not_found(wallet_uuid)
+
+        etag = f'"{int(wallet.date_updated.timestamp() * 1000000)}-{balance}"'
+        response = Response(balance_response_data(wallet, balance))
+        response["ETag"] = etag
+        # Клиент может хранить ответ, но должен проверять его актуальность.
+        patch_cache_control(response, private=True, no_cache=True)
+        return get_conditional_response(request, etag=etag, response=response)
+
+    def _get_ledger_balance(self, request, wallet_uuid):
+        """Баланс кошелька на момент as_of"""
+        try:
+            as_of = parse_datetime(request.query_params["as_of"])
+        except ValueError:
+            as_of = None
+        if as_of is None:
+            return Response(
+                {"error": {"as_of": ["Некорректная дата"]}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if timezone.is_naive(as_of):
+            as_of = timezone.make_aware(as_of)
+
+        try:
+            wallet_uuid = UUID(wallet_uuid)
+            wallet = Wallet.objects.for_wallet(wallet_uuid).get(uuid=wallet_uuid)
+        except (ValueError, Wallet.DoesNotExist):
+            return wallet_not_found(wallet_uuid)
+
+        response_data = balance_response_data(wallet, wallet.get_ledger_balance(as_of))
+        response_data["wallet"]["as_of"] = as_of.isoformat()
+        return Response(response_data)
+
+
+class TransactionHistoryView(APIView):
+    """
+
+    Возвращает историю транзакций кошелька, от новых к старым.
+    Если кошелек не найден, возвращается ошибка 404.
+
+    Страницы выдаются по курсору: next_cursor из ответа передается в параметре cursor
+    следующего запроса, на последней странице next_cursor равен null.
+    История читается с реплики, если она есть (apps.wallet.db.replicas).
+
+    Запрос:
+    GET api/v1/wallets/{WALLET_UUID}/transactions/
+        ?operation_type=deposit&date_from=...&date_to=...&limit=50&cursor=...
+
+    """
+
+    permission_classes = [AllowAny]
+    authentication_classes = [BasicAuthentication, APIKeyAuthentication]
+    serializer_class = TransactionHistorySerializer
+    http_method_names = ["get"]
+
+    @read_from_replica()
+    def get(self, request, wallet_uuid, *args, **kwargs):
+        serializer = self.serializer_class(data=request.query_params)
+        if not serializer.is_valid():
+            logger.warning(f"Некорректный запрос: {serializer.errors}")
             return Response(
-                {"error": "Кошелек не найден"}, status=status.HTTP_404_NOT_FOUND
+                {"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST
             )
 
+        try:
+            wallet_uuid = UUID(wallet_uuid)
+        except ValueError:
+            return wallet_not_found(wallet_uuid)
+
+        params = serializer.validated_data
+        limit = params["limit"]
+        # Лишняя транзакция показывает, есть ли следующая страница.
+        transactions = Transaction.get_history(
+            wallet_uuid,
+            limit + 1,
+            before=params.get("cursor"),
+            operation_type=params.get("operation_type"),
+            date_from=params.get("date_from"),
+            date_to=params.get("date_to"),
+        )
+        if (
+            not transactions
+            and not Wallet.objects.for_wallet(wallet_uuid).filter(pk=wallet_uuid).exists()
+        ):
+            return wallet_not_found(wallet_uuid)
+
+        next_cursor = None
+        if len(transactions) > limit:
+            transactions = transactions[:limit]
+            next_cursor = self.serializer_class.make_cursor(transactions[-1])
+
         return Response(
             {
                 "status": "success",
-                "wallet": {
-                    "uuid": str(wallet.uuid),
-                    "balance": str(wallet.balance),
-                },
+                "transactions": [
+                    {
+                        "uuid": str(txn.uuid) if txn.uuid else None,
+                        "type": txn.operation_type,
+                        "amount": str(txn.amount),
+                        "timestamp": txn.date_created.isoformat(),
+                    }
+                    for txn in transactions
+                ],
+                "next_cursor": next_cursor,
             }
         )
+
+
+class TransactionExportView(APIView):
+    """
+
+    Потоковая выгрузка транзакций кошелька в NDJSON (по умолчанию) или CSV.
+    Если кошелек не найден, возвращается ошибка 404.
+
+    Ответ формируется по мере чтения транзакций из базы и не собирается в памяти.
+    Если клиент принимает gzip (Accept-Encoding), ответ сжимается на лету.
+
+    Запрос:
+    GET api/v1/wallets/{WALLET_UUID}/transactions/export/
+        ?output=csv&operation_type=deposit&date_from=...&date_to=...
+
+    """
+
+    permission_classes = [AllowAny]
+    authentication_classes = [BasicAuthentication, APIKeyAuthentication]
+    serializer_class = TransactionExportSerializer
+    http_method_names = ["get"]
+
+    def get(self, request, wallet_uuid=None, *args, **kwargs):
+        serializer = self.serializer_class(data=request.query_params)
+        if not serializer.is_valid():
+            logger.warning(f"Некорректный запрос: {serializer.errors}")
+            return Response(
+                {"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if wallet_uuid is not None:
+            try:
+                wallet_uuid = UUID(wallet_uuid)
+            except ValueError:
+                return wallet_not_found(wallet_uuid)
+            if not Wallet.objects.for_wallet(wallet_uuid).filter(pk=wallet_uuid).exists():
+                return wallet_not_found(wallet_uuid)
+
+        params = serializer.validated_data
+        output = params["output"]
+        rows = Transaction.export_rows(
+            wallet_uuid,
+            operation_type=params.get("operation_type"),
+            date_from=params.get("date_from"),
+            date_to=params.get("date_to"),
+        )
+        content = export.blocks(output, rows)
+        compressed = GZIP_RE.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if compressed:
+            content = export.compress(content)
+
+        response = StreamingHttpResponse(
+            content, content_type=export.CONTENT_TYPES[output]
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="transactions-{wallet_uuid or "all"}.{output}"'
+        )
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if compressed:
+            response["Content-Encoding"] = "gzip"
+        return response
+
+
+class TransactionRangeExportView(TransactionExportView):
+    """
+
+    Потоковая выгрузка транзакций всех кошельков за период.
+    Доступно только администраторам.
+
+    Запрос:
+    GET api/v1/wallets/transactions/export/?date_from=...&date_to=...&output=csv
+
+    """
+
+    permission_classes = [IsAdminUser]
+
+
+class DatabasePoolStatsView(APIView):
+    """
+
+    Метрики пулов соединений с базой воркера, обработавшего запрос.
+    Доступно только администраторам.
+
+    Запрос:
+    GET api/v1/db-pool/
+
+    """
+
+    permission_classes = [IsAdminUser]
+    authentication_classes = [BasicAuthentication, APIKeyAuthentication]
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        return Response({"status": "success", "pools": pool.get_stats()})
+
+
+class MetricsView(APIView):
+    """
+
+    Метрики Prometheus (apps.wallet.metrics). Доступно администраторам и запросам
+    с адресов из WALLET_METRICS_ALLOWED_NETWORKS (сервер Prometheus).
+
+    Запрос:
+    GET metrics
+
+    """
+
+    permission_classes = [IsAdminUser | InternalAddress]
+    authentication_classes = [BasicAuthentication, APIKeyAuthentication]
+    http_method_names = ["get"]
+
+    def perform_content_negotiation(self, request, force=False):
+        # Prometheus принимает только текст; метрики отдаются мимо рендереров DRF,
+        # а рендерер по умолчанию нужен только для ответов об ошибках.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+        return metrics.metrics_response()
@@ -9,9 +9,26 @@ class WalletConfig(AppConfig):
 
     namespace = "wallet"
 
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from apps.wallet.middleware import install_query_observer
+
+        connection_created.connect(install_query_observer)
+
     def get_urls(self):
+        from apps.wallet.api.views import DatabasePoolStatsView, MetricsView, TransferView
+
         return [
             path(
                 "api/v1/wallets/", include("apps.wallet.api.urls"), name="wallet-api-v1"
-            )
+            ),
+            path(
+                "api/v1/async/wallets/",
+                include("apps.wallet.api.async_urls"),
+                name="wallet-async-api-v1",
+            ),
+            path("api/v1/transfers/", TransferView.as_view(), name="transfer"),
+            path("api/v1/db-pool/", DatabasePoolStatsView.as_view(), name="db-pool-stats"),
+            path("metrics", MetricsView.as_view(), name="metrics"),
         ]
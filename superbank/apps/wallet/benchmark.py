@@ -0,0 +1,422 @@
+"""
+Нагрузочный тест API кошелька внутри процесса (команда benchmark_wallets).
+
+Потоки вызывают CreateTransactionView и GetWalletBalanceView через тестовый клиент
+Django: запрос проходит middleware, представление и базу данных, но не сеть и
+не сервер приложений. Поэтому результаты разных коммитов на одной базе можно
+сравнивать между собой; для сравнения серверов (WSGI и ASGI) есть benchmark_api.
+
+Операции распределяются по кошелькам с перекосом: доля hot_share операций идет
+в hot_wallets «горячих» кошельков, что воспроизводит конкуренцию за строку кошелька.
+Доля transfer_share операций — встречные переводы между двумя первыми кошельками:
+они проверяют, что переводы не приводят к взаимной блокировке (deadlocks в результатах).
+
+SerializationBenchmark (команда benchmark_serialization) сравнивает процессорное время
+проверки, разбора и отрисовки операции: сериализатор и JSONRenderer DRF против
+OperationValidator и msgspec (apps.wallet.api.renderers).
+MiddlewareBenchmark (команда benchmark_middleware) сравнивает время запроса баланса
+через полный MIDDLEWARE и через облегченный конвейер API (apps.wallet.handlers).
+MoneyBenchmark (команда benchmark_money) сравнивает суммы в Decimal и в минимальных
+единицах валюты (apps.wallet.money): время арифметики проведения операции и размер
+индекса по столбцу numeric(12, 2) и bigint.
+
+"""
+
+import io
+import random
+import statistics
+import threading
+import time
+import timeit
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal as D
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.test import Client, RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import parsers, renderers
+
+from apps.wallet import money
+from apps.wallet.api import parsers as wallet_parsers
+from apps.wallet.api import renderers as wallet_renderers
+from apps.wallet.api.serializers import TransactionSerializer, transaction_validator
+from apps.wallet.contention import DEADLOCK_DETECTED, get_sqlstate
+from apps.wallet.handlers import APIWSGIHandler
+from apps.wallet.models import Transaction, Wallet
+from apps.wallet.signals import transaction_retried
+
+INITIAL_BALANCE = D("1000.00")
+
+
+def percentiles(latencies):
+    """p50, p95, p99 и максимум задержки в миллисекундах."""
+    if len(latencies) < 2:
+        value = latencies[0] * 1000 if latencies else 0
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "p50": quantiles[49] * 1000,
+        "p95": quantiles[94] * 1000,
+        "p99": quantiles[98] * 1000,
+        "max": max(latencies) * 1000,
+    }
+
+
+def microseconds_per_call(func, iterations, repeat):
+    """Лучшее из repeat измерений: меньше всего зависит от соседних процессов."""
+    timings = timeit.repeat(func, number=iterations, repeat=repeat)
+    return min(timings) / iterations * 1_000_000
+
+
+class WalletBenchmark:
+    def __init__(
+        self,
+        wallets=100,
+        hot_wallets=1,
+        hot_share=0.5,
+        read_share=0.5,
+        withdraw_share=0.3,
+        transfer_share=0.0,
+        concurrency=8,
+        operations=2000,
+        seed=None,
+    ):
+        self.wallets = wallets
+        self.hot_wallets = min(hot_wallets, wallets)
+        self.hot_share = hot_share
+        self.read_share = read_share
+        self.withdraw_share = withdraw_share
+        self.transfer_share = transfer_share
+        self.concurrency = concurrency
+        self.operations = operations
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._retries = 0
+        self._deadlocks = 0
+
+    def run(self, keep=False):
+        """Нагрузка и проверка балансов. Возвращает результаты в виде словаря."""
+        wallet_uuids = self.create_wallets()
+        transaction_retried.connect(self._count_retry, sender=Wallet)
+        try:
+            result = self.load(wallet_uuids)
+        finally:
+            transaction_retried.disconnect(self._count_retry, sender=Wallet)
+            connections.close_all()
+
+        result["lock_retries"] = self._retries
+        result["deadlocks"] = self._deadlocks
+        result["correctness"] = self.check_balances(wallet_uuids, result.pop("expected"))
+        if not keep:
+            Wallet.objects.filter(pk__in=wallet_uuids).delete()
+        return result
+
+    def create_wallets(self):
+        wallet_uuids = []
+        for _ in range(self.wallets):
+            wallet = Wallet.objects.create()
+            wallet.deposit(INITIAL_BALANCE)
+            wallet_uuids.append(wallet.pk)
+        return wallet_uuids
+
+    def load(self, wallet_uuids):
+        rng = random.Random(self.seed)
+        hot, cold = wallet_uuids[: self.hot_wallets], wallet_uuids[self.hot_wallets :]
+        plan = []
+        for _ in range(self.operations):
+            if len(wallet_uuids) > 1 and rng.random() < self.transfer_share:
+                pair = wallet_uuids[:2] if rng.random() < 0.5 else wallet_uuids[1::-1]
+                amount = D(rng.randint(1, 1000)) / 100
+                plan.append(("transfer", pair[0], pair[1], amount))
+                continue
+            pool = hot if not cold or rng.random() < self.hot_share else cold
+            wallet_uuid = rng.choice(pool)
+            if rng.random() < self.read_share:
+                plan.append(("read", wallet_uuid, None, None))
+            else:
+                operation_type = (
+                    Transaction.WITHDRAW
+                    if rng.random() < self.withdraw_share
+                    else Transaction.DEPOSIT
+                )
+                amount = D(rng.randint(1, 1000)) / 100
+                plan.append(("write", wallet_uuid, operation_type, amount))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(self.perform, plan))
+        elapsed = time.perf_counter() - started
+
+        latencies = {"read": [], "write": [], "transfer": []}
+        statuses = Counter()
+        expected = {wallet_uuid: INITIAL_BALANCE for wallet_uuid in wallet_uuids}
+        for (kind, wallet_uuid, operation_type, amount), (status, latency) in zip(
+            plan, results
+        ):
+            latencies[kind].append(latency)
+            statuses[f"{kind} {status}"] += 1
+            if kind == "write" and status == 201:
+                expected[wallet_uuid] += (
+                    amount if operation_type == Transaction.DEPOSIT else -amount
+                )
+            elif kind == "transfer" and status == 201:
+                # Для перевода в плане вместо типа операции — кошелек зачисления.
+                expected[wallet_uuid] -= amount
+                expected[operation_type] += amount
+
+        return {
+            "config": {
+                "wallets": self.wallets,
+                "hot_wallets": self.hot_wallets,
+                "hot_share": self.hot_share,
+                "read_share": self.read_share,
+                "withdraw_share": self.withdraw_share,
+                "transfer_share": self.transfer_share,
+                "concurrency": self.concurrency,
+                "operations": self.operations,
+                "seed": self.seed,
+            },
+            "elapsed": elapsed,
+            "throughput": len(plan) / elapsed if elapsed else 0,
+            "latency_ms": {
+                "all": percentiles(sum(latencies.values(), [])),
+                **{kind: percentiles(values) for kind, values in latencies.items()},
+            },
+            "statuses": dict(sorted(statuses.items())),
+            "expected": expected,
+        }
+
+    def perform(self, operation):
+        kind, wallet_uuid, operation_type, amount = operation
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = Client(raise_request_exception=False)
+
+        started = time.perf_counter()
+        if kind == "read":
+            response = client.get(reverse("wallet-balance", args=[wallet_uuid]))
+        elif kind == "transfer":
+            response = client.post(
+                reverse("transfer"),
+                {
+                    "source_wallet_uuid": str(wallet_uuid),
+                    "target_wallet_uuid": str(operation_type),
+                    "amount": str(amount),
+                },
+                content_type="application/json",
+            )
+        else:
+            response = client.post(
+                reverse("create-transaction", args=[wallet_uuid]),
+                {"operation_type": operation_type, "amount": str(amount)},
+                content_type="application/json",
+            )
+        return response.status_code, time.perf_counter() - started
+
+    def check_balances(self, wallet_uuids, expected):
+        """Итоговые балансы против суммы успешных операций и против транзакций."""
+        wrong = []
+        for wallet in Wallet.objects.filter(pk__in=wallet_uuids):
+            balance = wallet.get_balance()
+            if balance != expected[wallet.pk] or balance != wallet.get_ledger_balance():
+                wrong.append(str(wallet.pk))
+        return {"correct": not wrong, "wrong_wallets": wrong}
+
+    def _count_retry(self, error=None, **kwargs):
+        with self._lock:
+            self._retries += 1
+            self._deadlocks += get_sqlstate(error) == DEADLOCK_DETECTED
+
+
+class SerializationBenchmark:
+    """Время проверки, разбора и отрисовки одной операции в микросекундах."""
+
+    def __init__(self, iterations=10000, repeat=5):
+        self.iterations = iterations
+        self.repeat = repeat
+
+    def run(self):
+        data = {"operation_type": "DEPOSIT", "amount": "1000.50"}
+        body = renderers.JSONRenderer().render(data)
+        response_data = {
+            "status": "success",
+            "wallet": {"uuid": str(uuid.uuid4()), "balance": "12345.67"},
+            "transaction": {
+                "uuid": str(uuid.uuid4()),
+                "amount": "1000.50",
+                "type": "deposit",
+                "timestamp": timezone.now().isoformat(),
+            },
+        }
+        drf_parser, parser = parsers.JSONParser(), wallet_parsers.JSONParser()
+        drf_renderer = renderers.JSONRenderer()
+        renderer = wallet_renderers.JSONRenderer()
+        msgpack_renderer = wallet_renderers.MessagePackRenderer()
+
+        cases = {
+            "validation": (
+                lambda: TransactionSerializer(data=data).is_valid(),
+                lambda: transaction_validator.validate(data),
+            ),
+            "parsing": (
+                lambda: drf_parser.parse(io.BytesIO(body)),
+                lambda: parser.parse(io.BytesIO(body)),
+            ),
+            "rendering": (
+                lambda: drf_renderer.render(response_data),
+                lambda: renderer.render(response_data),
+            ),
+            "rendering_msgpack": (
+                lambda: drf_renderer.render(response_data),
+                lambda: msgpack_renderer.render(response_data),
+            ),
+        }
+        result = {
+            "config": {"iterations": self.iterations, "repeat": self.repeat},
+            "us_per_call": {},
+        }
+        for name, (baseline, lean) in cases.items():
+            result["us_per_call"][name] = self.compare(baseline, lean)
+
+        total = {"baseline": 0.0, "lean": 0.0}
+        for name in ("validation", "parsing", "rendering"):
+            for key in total:
+                total[key] += result["us_per_call"][name][key]
+        result["us_per_call"]["request"] = {
+            **total,
+            "saved": total["baseline"] - total["lean"],
+        }
+        return result
+
+    def compare(self, baseline, lean):
+        baseline_us = microseconds_per_call(baseline, self.iterations, self.repeat)
+        lean_us = microseconds_per_call(lean, self.iterations, self.repeat)
+        return {
+            "baseline": baseline_us,
+            "lean": lean_us,
+            "saved": baseline_us - lean_us,
+            "speedup": baseline_us / lean_us if lean_us else 0,
+        }
+
+
+class MiddlewareBenchmark:
+    """Время запроса баланса через полный MIDDLEWARE и WALLET_API_MIDDLEWARE, мкс."""
+
+    def __init__(self, iterations=2000, repeat=5):
+        self.iterations = iterations
+        self.repeat = repeat
+
+    def run(self):
+        wallet = Wallet.objects.create(balance=INITIAL_BALANCE)
+        try:
+            path = reverse("wallet-balance", args=[wallet.pk])
+            factory = RequestFactory()
+            full, api = WSGIHandler(), APIWSGIHandler()
+            full_us = microseconds_per_call(
+                lambda: full.get_response(factory.get(path)), self.iterations, self.repeat
+            )
+            api_us = microseconds_per_call(
+                lambda: api.get_response(factory.get(path)), self.iterations, self.repeat
+            )
+        finally:
+            wallet.delete()
+
+        return {
+            "config": {"iterations": self.iterations, "repeat": self.repeat},
+            "us_per_request": {
+                "full": full_us,
+                "api": api_us,
+                "saved": full_us - api_us,
+            },
+        }
+
+
+class MoneyBenchmark:
+    """Арифметика сумм в Decimal и в минимальных единицах, размер индекса по сумме."""
+
+    NUMERIC_TABLE = "wallet_benchmark_numeric"
+    BIGINT_TABLE = "wallet_benchmark_bigint"
+
+    def __init__(self, iterations=10000, repeat=5, rows=10000, using="default"):
+        self.iterations = iterations
+        self.repeat = repeat
+        self.rows = rows
+        self.using = using
+
+    def run(self):
+        return {
+            "config": {
+                "iterations": self.iterations,
+                "repeat": self.repeat,
+                "rows": self.rows,
+            },
+            "us_per_call": self.arithmetic(),
+            "index_bytes": self.index_size(),
+        }
+
+    def arithmetic(self):
+        """Проверка, сравнение с балансом и изменение баланса, затем сумма 100 операций."""
+        balance, amount = D("12345.67"), D("1000.50")
+        balance_units, amount_units = money.to_minor(balance), money.to_minor(amount)
+        amounts = [D(random.randint(1, 10**7)).scaleb(-2) for _ in range(100)]
+        amounts_units = [money.to_minor(value) for value in amounts]
+
+        def withdraw(balance, amount):
+            if amount <= 0 or balance < amount:
+                return balance
+            return balance - amount
+
+        cases = {
+            "withdraw": (
+                lambda: withdraw(balance, amount),
+                lambda: withdraw(balance_units, amount_units),
+            ),
+            "sum": (lambda: sum(amounts), lambda: sum(amounts_units)),
+        }
+        result = {}
+        for name, (decimal_case, minor_case) in cases.items():
+            decimal_us = microseconds_per_call(decimal_case, self.iterations, self.repeat)
+            minor_us = microseconds_per_call(minor_case, self.iterations, self.repeat)
+            result[name] = {
+                "decimal": decimal_us,
+                "minor_units": minor_us,
+                "speedup": decimal_us / minor_us if minor_us else 0,
+            }
+        return result
+
+    def index_size(self):
+        """Размер индекса по сумме для rows строк в столбце numeric(12, 2) и bigint."""
+        connection = connections[self.using]
+        units = [random.randint(1, 10**7) for _ in range(self.rows)]
+        tables = {
+            self.NUMERIC_TABLE: ("numeric(12, 2)", [(money.from_minor(u),) for u in units]),
+            self.BIGINT_TABLE: ("bigint", [(u,) for u in units]),
+        }
+        result = {}
+        with connection.cursor() as cursor:
+            try:
+                for table, (column_type, rows) in tables.items():
+                    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                    cursor.execute(f"CREATE TABLE {table} (amount {column_type} NOT NULL)")
+                    cursor.executemany(f"INSERT INTO {table} (amount) VALUES (%s)", rows)
+                    cursor.execute(f"CREATE INDEX {table}_idx ON {table} (amount)")
+                    result[column_type] = self.relation_size(cursor, f"{table}_idx")
+            finally:
+                for table in tables:
+                    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        result["saved"] = result["numeric(12, 2)"] - result["bigint"]
+        return result
+
+    def relation_size(self, cursor, name):
+        if cursor.db.vendor == "postgresql":
+            cursor.execute("SELECT pg_relation_size(%s)", [name])
+        else:
+            # SQLite: страницы индекса из виртуальной таблицы dbstat.
+            cursor.execute("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = %s", [name])
+        return cursor.fetchone()[0]
@@ -0,0 +1,135 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from apps.wallet.db import replicas
+
+
+class _Load:
+    """Загрузка значения, которую ждут одновременные промахи по тому же ключу."""
+
+    __slots__ = ("value", "error", "done")
+
+    def __init__(self):
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BalanceCache:
+    """
+    Кеш балансов кошельков для чтения баланса.
+
+    Хранит пару (баланс, время изменения) по uuid кошелька в кеше Django с псевдонимом
+    WALLET_BALANCE_CACHE. Общий кеш (например, Redis) видит сбросы всех воркеров.
+    Кеш в памяти процесса (LocMemCache, псевдоним wallet_balance в conf.settings)
+    сбрасывается только изменениями своего процесса, поэтому хранит значения
+    не дольше TIMEOUT (1 секунда): баланс, измененный другим воркером, может
+    отставать на это время, как и чтение с реплики. Клиент, закрепленный за основной
+    базой после изменяющего запроса (ReplicaPinMiddleware), такой кеш не читает.
+    Без WALLET_BALANCE_CACHE кеш выключен.
+
+    Кошелек сбрасывает свой баланс из кеша после фиксации транзакции БД,
+    в которой баланс изменился (transaction.on_commit). Значение помечается поколением
+    кошелька, прочитанным до загрузки, а сброс удаляет поколение. Поэтому загрузка,
+    которая прочитала баланс до сброса, не записывается в кеш либо записывается
+    со старым поколением и не читается. Одновременные промахи по одному кошельку
+    в процессе загружают баланс одним запросом.
+
+    """
+
+    key_prefix = "wallet-balance"
+    generation_prefix = "wallet-balance-generation"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    @property
+    def cache(self):
+        alias = settings.WALLET_BALANCE_CACHE
+        return caches[alias] if alias else None
+
+    @property
+    def is_local(self):
+        """Кеш в памяти процесса: сбросы других воркеров в нем не видны."""
+        return isinstance(self.cache, LocMemCache)
+
+    def make_key(self, wallet_uuid):
+        return f"{self.key_prefix}:{wallet_uuid}"
+
+    def make_generation_key(self, wallet_uuid):
+        return f"{self.generation_prefix}:{wallet_uuid}"
+
+    def get(self, wallet_uuid, loader):
+        """Значение из кеша либо результат loader(), записанный в кеш."""
+        cache = self.cache
+        if cache is None or (replicas.is_pinned() and isinstance(cache, LocMemCache)):
+            return loader()
+
+        key = self.make_key(wallet_uuid)
+        generation_key = self.make_generation_key(wallet_uuid)
+        values = cache.get_many([key, generation_key])
+        generation = values.get(generation_key)
+        entry = values.get(key)
+        if generation is not None and entry is not None and entry[0] == generation:
+            return entry[1]
+
+        with self._lock:
+            load = self._loading.get(key)
+            is_loader = load is None
+            if is_loader:
+                load = self._loading[key] = _Load()
+
+        if not is_loader:
+            load.done.wait()
+            if load.error is not None:
+                raise load.error
+            return load.value
+
+        try:
+            if generation is None:
+                # Новое поколение не совпадает ни с одним из записанных ранее.
+                cache.add(generation_key, uuid.uuid4().hex)
+                generation = cache.get(generation_key)
+            load.value = loader()
+            # Если баланс сбросили во время загрузки, значение может быть устаревшим.
+            if generation is not None and cache.get(generation_key) == generation:
+                cache.set(key, (generation, load.value))
+        except Exception as e:
+            load.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._loading.get(key) is load:
+                    del self._loading[key]
+            load.done.set()
+        return load.value
+
+    def forget_loads(self, wallet_uuids):
+        """Промахи после сброса не ждут загрузки, начатой до него."""
+        with self._lock:
+            for wallet_uuid in wallet_uuids:
+                self._loading.pop(self.make_key(wallet_uuid), None)
+
+    def delete_many(self, wallet_uuids):
+        self.forget_loads(wallet_uuids)
+        cache = self.cache
+        if cache is not None:
+            cache.delete_many(
+                [self.make_generation_key(wallet_uuid) for wallet_uuid in wallet_uuids]
+            )
+
+    async def adelete_many(self, wallet_uuids):
+        self.forget_loads(wallet_uuids)
+        cache = self.cache
+        if cache is not None:
+            await cache.adelete_many(
+                [self.make_generation_key(wallet_uuid) for wallet_uuid in wallet_uuids]
+            )
+
+
+balance_cache = BalanceCache()
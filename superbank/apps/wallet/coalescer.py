@@ -0,0 +1,122 @@
+import threading
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db.utils import DatabaseError
+
+from apps.wallet import contention
+from apps.wallet.api.exceptions import WalletBusyException
+
+
+class _Operation:
+    """Операция, ожидающая группового проведения."""
+
+    __slots__ = ("data", "result", "done")
+
+    def __init__(self, wallet_uuid, amount, txn_type):
+        self.data = {
+            "wallet_uuid": wallet_uuid,
+            "operation_type": txn_type,
+            "amount": amount,
+        }
+        self.result = None
+        self.done = threading.Event()
+
+
+class _Group:
+    """Операции одного кошелька, собранные за окно ожидания."""
+
+    def __init__(self):
+        self.operations = []
+        self.full = threading.Event()
+
+
+class WalletOperationCoalescer:
+    """
+    Групповое проведение одновременных операций одного кошелька.
+
+    Первая операция кошелька становится ведущей: она ждет WALLET_COALESCE_WINDOW секунд
+    (или пока не наберется WALLET_COALESCE_MAX_OPERATIONS операций), забирает все
+    операции, пришедшие за это время из других потоков, и проводит их через
+    Wallet._apply_operations — под одной блокировкой кошелька, одним INSERT транзакций
+    и одним UPDATE баланса. Остальные потоки ждут результата своей операции.
+
+    Каждый поток получает свой результат: операции, для которых недостаточно средств,
+    отклоняются по отдельности и не влияют на остальные операции группы.
+
+    Группы собираются в пределах одного процесса, поэтому выигрыш зависит от количества
+    потоков воркера, обслуживающих один и тот же кошелек.
+
+    Место в очереди операций кошелька (contention.wallet_queue) занимает только ведущая
+    операция: группа проводится одним обращением к базе, а присоединившиеся операции
+    лишь ждут результата. Поэтому WALLET_LOCK_QUEUE_SIZE ограничивает число групп,
+    а не их размер.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def submit(self, wallet, amount, txn_type, using):
+        """
+        Проведение операции в составе группы.
+
+        Возвращает (баланс, время изменения, UUID транзакции) или объект исключения:
+        причину отказа в операции либо DatabaseError, если группа не была проведена.
+
+        """
+        key = (using, wallet.pk)
+        operation = _Operation(wallet.pk, amount, txn_type)
+        queue = ExitStack()
+
+        with self._lock:
+            group = self._groups.get(key)
+            is_leader = group is None
+            if is_leader:
+                # Если очередь кошелька заполнена, группа не создается.
+                queue.enter_context(contention.wallet_queue(wallet.pk))
+                group = self._groups[key] = _Group()
+            group.operations.append(operation)
+            if len(group.operations) >= settings.WALLET_COALESCE_MAX_OPERATIONS:
+                # Группа заполнена, следующие операции соберутся в новую.
+                del self._groups[key]
+                group.full.set()
+
+        if not is_leader:
+            operation.done.wait()
+            return operation.result
+
+        with queue:
+            return self._apply(wallet, key, group, operation, using)
+
+    def _apply(self, wallet, key, group, operation, using):
+        """Проведение группы ведущей операцией."""
+        group.full.wait(settings.WALLET_COALESCE_WINDOW)
+        with self._lock:
+            if self._groups.get(key) is group:
+                del self._groups[key]
+
+        results = None
+        try:
+            results = wallet.__class__._apply_operations(
+                [grouped_operation.data for grouped_operation in group.operations],
+                using=using,
+            )
+        except (DatabaseError, WalletBusyException) as e:
+            results = [e] * len(group.operations)
+        finally:
+            if results is None:
+                # Ведущий поток упал с неожиданной ошибкой: остальные операции
+                # группы не проведены и будут проведены по отдельности.
+                results = [DatabaseError("Групповое проведение операций прервано")] * len(
+                    group.operations
+                )
+            for grouped_operation, result in zip(group.operations, results):
+                grouped_operation.result = result
+                grouped_operation.done.set()
+
+        return operation.result
+
+
+coalescer = WalletOperationCoalescer()
@@ -0,0 +1,106 @@
+"""
+Политика конкуренции за строку кошелька.
+
+Операция не ждет блокировку дольше WALLET_LOCK_TIMEOUT секунд (lock_timeout PostgreSQL
+до конца транзакции БД). Не дождавшись блокировки, она не повторяется, а отклоняется
+WalletBusyException: ответ 503 с заголовком Retry-After, и поток воркера свободен.
+
+Повторяются только ошибки, после которых повтор может пройти без ожидания чужой
+транзакции: ошибка сериализации и взаимоблокировка. Остальные DatabaseError
+передаются вызывающему коду сразу.
+
+Кроме того, процесс проводит или ждет не больше WALLET_LOCK_QUEUE_SIZE операций одного
+кошелька одновременно (wallet_queue): несколько горячих кошельков не займут все потоки
+воркера.
+
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from apps.wallet.api.exceptions import WalletBusyException
+
+SERIALIZATION_FAILURE = "40001"
+DEADLOCK_DETECTED = "40P01"
+LOCK_NOT_AVAILABLE = "55P03"
+RETRYABLE_SQLSTATES = {SERIALIZATION_FAILURE, DEADLOCK_DETECTED}
+
+# Наименьший lock_timeout PostgreSQL: 0 отключает ограничение, а у UPDATE нет NOWAIT.
+NOWAIT_LOCK_TIMEOUT_MS = 1
+
+
+def get_sqlstate(error):
+    """Код SQLSTATE ошибки psycopg или ошибки Django, которая ее оборачивает."""
+    while error is not None:
+        sqlstate = getattr(error, "sqlstate", None) or getattr(error, "pgcode", None)
+        if sqlstate:
+            return sqlstate
+        error = error.__cause__
+    return None
+
+
+def is_retryable(error):
+    if get_sqlstate(error) in RETRYABLE_SQLSTATES:
+        return True
+    # SQLite отвечает так и на взаимную блокировку двух транзакций, читавших базу
+    # перед записью; ожидание освобождения базы ограничивает его параметр timeout.
+    return "database is locked" in str(error)
+
+
+def is_lock_timeout(error):
+    return get_sqlstate(error) == LOCK_NOT_AVAILABLE
+
+
+def busy():
+    return WalletBusyException(wait=settings.WALLET_LOCK_RETRY_AFTER)
+
+
+def lock_timeout_ms():
+    """lock_timeout PostgreSQL в миллисекундах или None, если ожидание не ограничено."""
+    timeout = settings.WALLET_LOCK_TIMEOUT
+    if timeout is None:
+        return None
+    return max(round(timeout * 1000), NOWAIT_LOCK_TIMEOUT_MS)
+
+
+def set_lock_timeout(using):
+    """Ограничение ожидания блокировок до конца текущей транзакции БД (PostgreSQL)."""
+    connection = connections[using]
+    timeout = lock_timeout_ms()
+    if connection.vendor != "postgresql" or timeout is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('lock_timeout', %s, true)", [f"{timeout}ms"])
+
+
+class WalletQueue:
+    """Количество операций каждого кошелька, которые процесс проводит или ждет."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._depth = {}
+
+    @contextmanager
+    def __call__(self, wallet_uuid):
+        limit = settings.WALLET_LOCK_QUEUE_SIZE
+        with self._lock:
+            depth = self._depth.get(wallet_uuid, 0)
+            if limit and depth >= limit:
+                raise busy()
+            self._depth[wallet_uuid] = depth + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                depth = self._depth.pop(wallet_uuid) - 1
+                if depth:
+                    self._depth[wallet_uuid] = depth
+
+    def depth(self, wallet_uuid):
+        return self._depth.get(wallet_uuid, 0)
+
+
+wallet_queue = WalletQueue()
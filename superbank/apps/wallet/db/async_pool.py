@@ -0,0 +1,110 @@
+"""
+Пул асинхронных соединений PostgreSQL для асинхронных эндпоинтов кошелька.
+
+ORM Django 4.2 не умеет выполнять запросы асинхронно: каждый запрос из асинхронного
+представления уходит в поток через sync_to_async. Горячие запросы асинхронных эндпоинтов
+выполняются напрямую через psycopg.AsyncConnection из пула psycopg_pool.
+
+Пул создается для каждого цикла событий: под ASGI это один долгоживущий цикл воркера.
+Вне ASGI (например, асинхронное представление под WSGI) цикл создается на каждый запрос,
+поэтому пул отключается через use_pool(False) и используется отдельное соединение.
+
+"""
+
+import asyncio
+import contextvars
+import weakref
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from apps.wallet import contention
+
+try:
+    import psycopg
+    from psycopg import DatabaseError
+    from psycopg.conninfo import make_conninfo
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    psycopg = None
+    DatabaseError = ()
+
+_pools = weakref.WeakKeyDictionary()
+_pooled = contextvars.ContextVar("wallet_async_pooled", default=True)
+
+
+def is_available(using):
+    """Можно ли выполнять запросы к базе using через асинхронный драйвер."""
+    return psycopg is not None and connections[using].vendor == "postgresql"
+
+
+def use_pool(enabled):
+    """Включение пула для запросов текущего контекста."""
+    _pooled.set(enabled)
+
+
+def _conninfo(using):
+    settings_dict = connections[using].settings_dict
+    # OPTIONS["pool"] — настройки синхронного пула, а не параметр соединения.
+    options = {
+        key: value for key, value in settings_dict.get("OPTIONS", {}).items() if key != "pool"
+    }
+    # Соединения асинхронного пула проводят только операции кошелька, поэтому
+    # lock_timeout задается на все соединение (см. apps.wallet.contention).
+    lock_timeout = contention.lock_timeout_ms()
+    if lock_timeout is not None:
+        options["options"] = " ".join(
+            filter(None, [options.get("options"), f"-c lock_timeout={lock_timeout}"])
+        )
+    return make_conninfo(
+        dbname=settings_dict["NAME"],
+        user=settings_dict["USER"] or None,
+        password=settings_dict["PASSWORD"] or None,
+        host=settings_dict["HOST"] or None,
+        port=settings_dict["PORT"] or None,
+        **options,
+    )
+
+
+async def get_pool(using):
+    """Пул соединений базы using для текущего цикла событий."""
+    loop = asyncio.get_running_loop()
+    pools, lock = _pools.setdefault(loop, ({}, asyncio.Lock()))
+    async with lock:
+        pool = pools.get(using)
+        if pool is None:
+            pool = AsyncConnectionPool(
+                _conninfo(using),
+                min_size=settings.WALLET_ASYNC_POOL_MIN_SIZE,
+                max_size=settings.WALLET_ASYNC_POOL_MAX_SIZE,
+                timeout=settings.WALLET_ASYNC_POOL_TIMEOUT,
+                kwargs={"autocommit": True},
+                open=False,
+            )
+            await pool.open()
+            pools[using] = pool
+    return pool
+
+
+@asynccontextmanager
+async def connection(using):
+    """Асинхронное соединение с базой using в режиме autocommit."""
+    if _pooled.get():
+        pool = await get_pool(using)
+        async with pool.connection() as conn:
+            yield conn
+        return
+
+    conn = await psycopg.AsyncConnection.connect(_conninfo(using), autocommit=True)
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+async def fetchone(using, sql, params):
+    """Выполнение одного запроса и получение первой строки результата."""
+    async with connection(using) as conn:
+        cursor = await conn.execute(sql, params)
+        return await cursor.fetchone()
@@ -0,0 +1,121 @@
+"""
+Бэкенд PostgreSQL с пулом соединений psycopg_pool.
+
+Стандартный бэкенд Django 4.2 открывает соединение на каждый запрос (CONN_MAX_AGE = 0)
+либо держит одно постоянное соединение на поток без ограничения их общего числа.
+Этот бэкенд берет соединения из пула процесса и возвращает их в пул при закрытии,
+поэтому запрос не тратит время на установку соединения, а число соединений воркера
+ограничено max_size.
+
+Настройки пула задаются в OPTIONS["pool"] (как в Django 5.1):
+
+    "ENGINE": "apps.wallet.db.backends.postgresql",
+    "CONN_HEALTH_CHECKS": True,
+    "OPTIONS": {"pool": {"min_size": 2, "max_size": 10, "timeout": 5}},
+
+Параметры pool передаются в psycopg_pool.ConnectionPool. При CONN_HEALTH_CHECKS
+соединение проверяется пулом перед выдачей. Пул открывается при первом обращении
+или заранее через apps.wallet.db.pool.warm_up.
+
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as BaseCreation
+from psycopg_pool import ConnectionPool
+
+
+class DatabaseCreation(BaseCreation):
+    def create_test_db(self, *args, **kwargs):
+        # Пул открыт с соединениями к основной базе, а не к тестовой.
+        self.connection.close_pool()
+        return super().create_test_db(*args, **kwargs)
+
+    def destroy_test_db(self, *args, **kwargs):
+        self.connection.close_pool()
+        return super().destroy_test_db(*args, **kwargs)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    # Пулы процесса по псевдонимам баз, общие для всех потоков.
+    _connection_pools = {}
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict["OPTIONS"].get("pool")
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+
+        if self.alias not in self._connection_pools:
+            if self.settings_dict["CONN_MAX_AGE"] != 0:
+                raise ImproperlyConfigured(
+                    "Пул соединений не поддерживает постоянные соединения: "
+                    "CONN_MAX_AGE должен быть равен 0."
+                )
+            if pool_options is True:
+                pool_options = {}
+
+            connect_kwargs = self.get_connection_params()
+            # Режим autocommit выставит Django после выдачи соединения.
+            connect_kwargs["autocommit"] = True
+            pool = ConnectionPool(
+                kwargs=connect_kwargs,
+                open=False,
+                check=(
+                    ConnectionPool.check_connection
+                    if self.settings_dict["CONN_HEALTH_CHECKS"]
+                    else None
+                ),
+                name=self.alias,
+                **pool_options,
+            )
+            # Потоки могут создать пул одновременно, используется первый.
+            self._connection_pools.setdefault(self.alias, pool)
+
+        return self._connection_pools[self.alias]
+
+    def close_pool(self):
+        # Соединение возвращается в пул до его закрытия.
+        self.close()
+        pool = self._connection_pools.pop(self.alias, None)
+        if pool is not None:
+            pool.close()
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        pool.open()
+        connection = pool.getconn()
+        options = self.settings_dict["OPTIONS"]
+        if "isolation_level" in options:
+            self.isolation_level = base.IsolationLevel(options["isolation_level"])
+            connection.isolation_level = self.isolation_level
+        else:
+            self.isolation_level = base.IsolationLevel.READ_COMMITTED
+        connection.cursor_factory = (
+            base.ServerBindingCursor
+            if options.get("server_side_binding") is True
+            else base.Cursor
+        )
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if self.connection is None or pool is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            # Пул сам откатит незавершенную транзакцию и закроет сломанное соединение.
+            pool.putconn(self.connection)
+            # Соединение возвращено в пул, даже если закрытие было внутри atomic.
+            self.connection = None
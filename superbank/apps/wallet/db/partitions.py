@@ -0,0 +1,224 @@
+"""
+Помесячные партиции таблицы транзакций в PostgreSQL.
+
+Таблица wallet_transaction секционирована по date_created (PARTITION BY RANGE),
+см. миграцию 0007_partition_transactions. Транзакции до перехода на партиции
+хранятся в одной партиции wallet_transaction_legacy, затем — по партиции на месяц.
+
+Партиции по умолчанию нет (миграция 0014): с ней PostgreSQL не отсоединяет
+партиции с CONCURRENTLY. Вставка транзакции за пределами созданных месяцев
+завершается ошибкой, поэтому партиции на будущие месяцы заранее создает команда
+create_transaction_partitions (по cron). Старые партиции отсоединяет
+detach_transaction_partitions.
+
+"""
+
+import datetime
+import re
+
+from django.db import transaction
+from django.utils import timezone
+
+TABLE = "wallet_transaction"
+LEGACY_PARTITION = f"{TABLE}_legacy"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def month_start(value):
+    """Начало месяца (UTC), которому принадлежит value."""
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def bound(month):
+    """Граница диапазона партиции в виде литерала SQL."""
+    return f"'{month:%Y-%m-%d} 00:00:00+00'"
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def is_partitioned(connection):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions(connection):
+    """
+    Помесячные партиции: список (начало месяца, имя партиции) по возрастанию.
+
+    Партиция старых транзакций и партиция по умолчанию в список не входят.
+
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        try:
+            month = datetime.datetime.strptime(name, f"{TABLE}_p%Y_%m")
+        except ValueError:
+            continue
+        partitions.append((month.replace(tzinfo=datetime.timezone.utc), name))
+    return sorted(partitions)
+
+
+def create_partitions(connection, until, start=None):
+    """
+    Создание помесячных партиций для всех месяцев до until.
+
+    Партиции создаются начиная с месяца после последней существующей, а если их
+    нет — с месяца start. Возвращает имена созданных партиций.
+
+    Если партиция по умолчанию осталась и в нее попали строки месяца, PostgreSQL
+    не создаст партицию поверх них: строки переносятся в новую таблицу, и она
+    присоединяется к таблице транзакций в одной транзакции.
+
+    """
+    qn = connection.ops.quote_name
+    partitions = get_partitions(connection)
+    if partitions:
+        month = add_months(partitions[-1][0], 1)
+    else:
+        month = month_start(start or timezone.now())
+    default = has_default_partition(connection)
+    created = []
+    while month < until:
+        name = partition_name(month)
+        params = {
+            "partition": qn(name),
+            "table": qn(TABLE),
+            "default": qn(DEFAULT_PARTITION),
+            "start": bound(month),
+            "end": bound(add_months(month, 1)),
+        }
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            if default:
+                # Новые строки месяца ждут переноса, а не попадают в партицию по умолчанию.
+                cursor.execute("LOCK TABLE {default} IN SHARE MODE".format(**params))
+                cursor.execute(
+                    "SELECT 1 FROM {default} WHERE date_created >= {start} "
+                    "AND date_created < {end} LIMIT 1".format(**params)
+                )
+            if default and cursor.fetchone() is not None:
+                cursor.execute(
+                    "CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS "
+                    "INCLUDING CONSTRAINTS)".format(**params)
+                )
+                cursor.execute(
+                    "WITH moved AS (DELETE FROM {default} WHERE date_created >= {start} "
+                    "AND date_created < {end} RETURNING *) "
+                    "INSERT INTO {partition} SELECT * FROM moved".format(**params)
+                )
+                cursor.execute(
+                    "ALTER TABLE {table} ATTACH PARTITION {partition} "
+                    "FOR VALUES FROM ({start}) TO ({end})".format(**params)
+                )
+            else:
+                cursor.execute(
+                    "CREATE TABLE {partition} PARTITION OF {table} "
+                    "FOR VALUES FROM ({start}) TO ({end})".format(**params)
+                )
+        created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def get_upper_bound(connection, name):
+    """Верхняя граница диапазона партиции name или None, если партиция не присоединена."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE oid = to_regclass(%s)",
+            [name],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    expression = row[0]
+    upper = re.search(r"TO \('([^']+)'\)", expression).group(1)
+    return datetime.datetime.fromisoformat(upper).astimezone(datetime.timezone.utc)
+
+
+def get_retained_from(connection):
+    """
+    Начало самой старой присоединенной партиции транзакций.
+
+    None, если таблица не секционирована или партиция старых транзакций (диапазон
+    от MINVALUE) присоединена. Транзакции до этой даты отсоединены вместе
+    с партициями, их учитывают контрольные точки отсоединения.
+
+    """
+    if not is_partitioned(connection):
+        return None
+    if get_upper_bound(connection, LEGACY_PARTITION) is not None:
+        return None
+    partitions = get_partitions(connection)
+    return partitions[0][0] if partitions else None
+
+
+def get_partitioned_until(connection):
+    """
+    Конец последней помесячной партиции: транзакции с этой даты не вставить.
+
+    None, если таблица не секционирована или есть партиция по умолчанию.
+
+    """
+    if not is_partitioned(connection) or has_default_partition(connection):
+        return None
+    partitions = get_partitions(connection)
+    return add_months(partitions[-1][0], 1) if partitions else None
+
+
+def has_default_partition(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT partdefid <> 0 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+            [TABLE],
+        )
+        row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def detach_partition(connection, name):
+    """
+    Отсоединение партиции от таблицы транзакций.
+
+    Отсоединение меняет только метаданные и не переписывает строки. Отсоединенная
+    таблица остается в базе: ее можно выгрузить и удалить отдельно.
+
+    В PostgreSQL 14+ вне транзакции партиция отсоединяется с CONCURRENTLY, без
+    блокировки чтения и записи таблицы. Иначе, а также если партиция по умолчанию
+    осталась (PostgreSQL не допускает с ней CONCURRENTLY), DETACH кратко берет
+    ACCESS EXCLUSIVE и ждет завершения запросов к таблице.
+
+    """
+    qn = connection.ops.quote_name
+    concurrently = (
+        connection.pg_version >= 140000
+        and not connection.in_atomic_block
+        and not has_default_partition(connection)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "ALTER TABLE {table} DETACH PARTITION {partition}{concurrently}".format(
+                table=qn(TABLE),
+                partition=qn(name),
+                concurrently=" CONCURRENTLY" if concurrently else "",
+            )
+        )
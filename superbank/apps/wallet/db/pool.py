@@ -0,0 +1,43 @@
+"""Прогрев и метрики пулов соединений бэкенда apps.wallet.db.backends.postgresql."""
+
+import logging
+
+from django.db import connections
+from psycopg_pool import PoolTimeout
+
+logger = logging.getLogger("apps.wallet")
+
+
+def _pools():
+    for connection in connections.all():
+        pool = getattr(connection, "pool", None)
+        if pool is not None:
+            yield connection.alias, pool
+
+
+def warm_up(timeout=30.0):
+    """
+    Открытие пулов и ожидание min_size соединений.
+
+    Вызывается при старте воркера, чтобы первые запросы не ждали установки соединений.
+    Если база недоступна, воркер стартует, а пул продолжает подключаться в фоне.
+
+    """
+    for alias, pool in _pools():
+        pool.open()
+        try:
+            pool.wait(timeout=timeout)
+        except PoolTimeout as e:
+            logger.error(f"Пул соединений {alias} не прогрет: {e}")
+
+
+def get_stats():
+    """
+    Метрики пулов соединений текущего процесса.
+
+    requests_num — выдано соединений, requests_wait_ms — суммарное ожидание выдачи,
+    requests_queued — выдачи, ждавшие свободного соединения (пул исчерпан),
+    requests_errors — выдачи, не дождавшиеся соединения за timeout.
+
+    """
+    return {alias: pool.get_stats() for alias, pool in _pools()}
@@ -0,0 +1,171 @@
+"""
+Чтение с реплик PostgreSQL (ReplicaRouter в DATABASE_ROUTERS).
+
+Реплики — псевдонимы DATABASES из WALLET_DB_REPLICAS. На реплику уходят только
+чтения внутри read_from_replica(): баланс и история транзакций кошелька, списки
+админ-панели. Остальные запросы, в том числе все запросы проведения операции
+(Wallet._create_transaction), и чтения внутри транзакции БД идут в основную базу.
+
+Чтение своих записей: после запроса с изменяющим методом ReplicaPinMiddleware
+закрепляет клиента за основной базой на WALLET_REPLICA_PIN_SECONDS секунд — ставит
+cookie и заголовок ответа со временем окончания закрепления. Клиент без cookie
+передает этот заголовок в следующих запросах.
+
+Отставание каждой реплики процесс проверяет не чаще раза в
+WALLET_REPLICA_LAG_CHECK_INTERVAL секунд. Реплика, которая отстает больше чем на
+WALLET_REPLICA_MAX_LAG секунд или не отвечает, не используется до следующей
+проверки; если подходящих реплик нет, чтение идет в основную базу.
+
+При шардировании (apps.wallet.db.shards) запросы кошельков маршрутизирует
+ShardRouter, и реплики используются только для остальных моделей.
+
+"""
+
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger("apps.wallet")
+
+PIN_COOKIE = "wallet_primary_until"
+PIN_HEADER = "X-Primary-Pinned-Until"
+
+# Реплика, которая догнала основную базу, не отстает, даже если давно не было записей.
+LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_replica_reads = ContextVar("wallet_replica_reads", default=False)
+_pinned = ContextVar("wallet_primary_pinned", default=False)
+
+
+@contextmanager
+def read_from_replica():
+    """Чтения ORM внутри блока (или декорированной функции) можно выполнять на реплике."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin(pinned):
+    """Закрепление текущего запроса за основной базой; возвращает токен для unpin."""
+    return _pinned.set(pinned)
+
+
+def unpin(token):
+    _pinned.reset(token)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def pinned_until(request):
+    """Время окончания закрепления клиента из cookie или заголовка запроса, 0 — нет."""
+    until = 0.0
+    for value in (request.COOKIES.get(PIN_COOKIE), request.headers.get(PIN_HEADER)):
+        try:
+            until = max(until, float(value))
+        except (TypeError, ValueError):
+            continue
+    return until
+
+
+def measure_lag(alias):
+    """Отставание реплики в секундах или None, если реплика недоступна."""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except DatabaseError as e:
+        logger.warning(f"Реплика {alias} недоступна. Ошибка: {e}")
+        return None
+    return None if lag is None else float(lag)
+
+
+class ReplicaSet:
+    """Отставание реплик, проверенное не чаще раза в WALLET_REPLICA_LAG_CHECK_INTERVAL секунд."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lags = {}
+
+    def available(self):
+        """Реплики, отставание которых не больше WALLET_REPLICA_MAX_LAG секунд."""
+        return [
+            alias
+            for alias in settings.WALLET_DB_REPLICAS
+            if (lag := self.lag(alias)) is not None and lag <= settings.WALLET_REPLICA_MAX_LAG
+        ]
+
+    def lag(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            checked_at, lag = self._lags.get(alias, (None, None))
+            if (
+                checked_at is not None
+                and now - checked_at < settings.WALLET_REPLICA_LAG_CHECK_INTERVAL
+            ):
+                return lag
+            # Пока идет проверка, другие потоки используют прежнее значение.
+            self._lags[alias] = (now, lag)
+
+        lag = measure_lag(alias)
+        with self._lock:
+            self._lags[alias] = (time.monotonic(), lag)
+        return lag
+
+    def reset(self):
+        with self._lock:
+            self._lags.clear()
+
+
+replica_set = ReplicaSet()
+
+
+class ReplicaRouter:
+    """Маршрутизатор чтений на реплики; записи всегда идут в основную базу."""
+
+    def db_for_read(self, model, **hints):
+        if not settings.WALLET_DB_REPLICAS or not _replica_reads.get() or _pinned.get():
+            return None
+        # Подсказка primary=True: чтение должно видеть все зафиксированные изменения.
+        if hints.get("primary"):
+            return None
+        # Внутри транзакции БД чтения должны видеть ее изменения.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        replicas = replica_set.available()
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        # Без этого объект, прочитанный с реплики, сохранялся бы в нее же.
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db in settings.WALLET_DB_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.WALLET_DB_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему на реплики переносит репликация.
+        if db in settings.WALLET_DB_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,397 @@
+"""
+Горизонтальное шардирование кошельков (ShardRouter в DATABASE_ROUTERS).
+
+Шарды — псевдонимы DATABASES из WALLET_SHARDS. Кошелек принадлежит слоту
+crc32(uuid) % WALLET_SHARD_SLOTS, а слот — одному шарду по карте слотов (модель
+ShardSlot в основной базе). Все строки кошелька — корзины, транзакции, контрольные
+точки, ключи идемпотентности — хранятся в его шарде, поэтому операции кошелька
+проводятся в одной транзакции БД одного шарда.
+
+Маршрутизатор определяет кошелек по объекту (подсказка instance) или по подсказке
+wallet_uuid: запросы без объекта передают ее через менеджер for_wallet
+(Wallet.objects.for_wallet(uuid)). Запросы без кошелька — списки, сверка, выгрузка
+периода — выполняются по всем шардам (scatter).
+
+Слоты без строки в карте принадлежат первому шарду get_shards()[0] — основной базе,
+где кошельки хранились до включения шардирования; reshard --init записывает их в карту
+(в том числе до включения). Процесс перечитывает карту не чаще раза в
+WALLET_SHARD_MAP_TTL секунд.
+
+Перенос слотов в другой шард (move_slots, команда reshard) выполняется без
+остановки сервиса: запись в кошельки переносимых слотов отклоняется ответом 503
+с Retry-After (contention.busy), чтения идут в старый шард до переключения карты.
+Запись с явным using проверяется так же (check_writable). Перенесенные транзакции
+получают в новом шарде новые id, поэтому курсоры истории, выданные до переноса,
+становятся недействительными.
+
+"""
+
+import heapq
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from apps.wallet import contention
+
+# Модели, строки которых хранятся в шарде кошелька, и поле с uuid кошелька.
+SHARDED_MODELS = {
+    "wallet.wallet": "pk",
+    "wallet.walletbucket": "wallet_id",
+    "wallet.transaction": "wallet_id",
+    "wallet.balancecheckpoint": "wallet_id",
+    "wallet.idempotencykey": "wallet_uuid",
+}
+
+
+def is_enabled():
+    return bool(settings.WALLET_SHARDS)
+
+
+def get_shards():
+    """Псевдонимы шардов; без шардирования — только основная база."""
+    return list(settings.WALLET_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def slot_for(wallet_uuid):
+    if not isinstance(wallet_uuid, uuid.UUID):
+        wallet_uuid = uuid.UUID(str(wallet_uuid))
+    return zlib.crc32(wallet_uuid.bytes) % settings.WALLET_SHARD_SLOTS
+
+
+def default_shard():
+    """Шард слотов, которых нет в карте."""
+    return get_shards()[0]
+
+
+def get_wallet_uuid(instance):
+    """uuid кошелька, в шарде которого хранится объект, или None."""
+    field = SHARDED_MODELS.get(instance._meta.label_lower)
+    return None if field is None else getattr(instance, field)
+
+
+class ShardMap:
+    """Карта слотов, прочитанная не раньше чем WALLET_SHARD_MAP_TTL секунд назад."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._loaded_at = None
+
+    def get(self, slot):
+        """(шард, переносится ли слот)."""
+        with self._lock:
+            fresh = (
+                self._loaded_at is not None
+                and time.monotonic() - self._loaded_at < settings.WALLET_SHARD_MAP_TTL
+            )
+        if not fresh:
+            self.load()
+        return self._slots.get(slot) or (default_shard(), False)
+
+    def load(self):
+        from apps.wallet.models import ShardSlot
+
+        slots = {
+            slot: (database, is_moving)
+            for slot, database, is_moving in ShardSlot.objects.using(
+                DEFAULT_DB_ALIAS
+            ).values_list("slot", "database", "is_moving")
+        }
+        with self._lock:
+            self._slots, self._loaded_at = slots, time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+shard_map = ShardMap()
+
+
+def shard_for(wallet_uuid, write=False):
+    """
+    Шард кошелька.
+
+    Запись в кошелек переносимого слота отклоняется WalletBusyException: клиент
+    повторит запрос после переключения карты.
+    """
+    database, is_moving = shard_map.get(slot_for(wallet_uuid))
+    if write and is_moving:
+        raise contention.busy()
+    return database
+
+
+def check_writable(wallet_uuid):
+    """
+    Отклонение записи в кошелек переносимого слота, как у ShardRouter.
+
+    Нужна записи, которая выбирает базу явно (using) и не проходит через маршрутизатор:
+    админ-панель, пересчет балансов, контрольные точки.
+    """
+    if is_enabled():
+        shard_for(wallet_uuid, write=True)
+
+
+class ShardRouter:
+    """Маршрутизатор запросов кошелька в его шард; без шардирования не участвует."""
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints, write=False)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints, write=True)
+
+    def _route(self, model, hints, write):
+        if not is_enabled() or model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        wallet_uuid = hints.get("wallet_uuid")
+        instance = hints.get("instance")
+        if wallet_uuid is None and instance is not None:
+            wallet_uuid = get_wallet_uuid(instance)
+        if wallet_uuid is None:
+            return None
+        return shard_for(wallet_uuid, write=write)
+
+
+def scatter(func, databases=None):
+    """
+    func(alias) для каждого шарда, параллельно в отдельных потоках.
+
+    Возвращает результаты в порядке шардов. Соединения потоков закрываются.
+    """
+    databases = list(databases or get_shards())
+    if len(databases) == 1:
+        return [func(databases[0])]
+
+    def call(alias):
+        try:
+            return func(alias)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(databases)) as executor:
+        return list(executor.map(call, databases))
+
+
+def merge(querysets, key):
+    """Строки запросов к разным шардам, слитые в порядке key (запросы уже упорядочены)."""
+    return heapq.merge(*querysets, key=key)
+
+
+def chunks(items, size):
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def init_map():
+    """Заполнение карты слотами, которых в ней нет. Возвращает число добавленных слотов."""
+    from apps.wallet.models import ShardSlot
+
+    existing = set(
+        ShardSlot.objects.using(DEFAULT_DB_ALIAS).values_list("slot", flat=True)
+    )
+    database = default_shard()
+    created = ShardSlot.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+        [
+            ShardSlot(slot=slot, database=database)
+            for slot in range(settings.WALLET_SHARD_SLOTS)
+            if slot not in existing
+        ]
+    )
+    shard_map.invalidate()
+    return len(created)
+
+
+def wait_for_map():
+    """Ожидание, пока все процессы перечитают карту."""
+    time.sleep(settings.WALLET_SHARD_MAP_TTL)
+
+
+def move_slots(slots, target, chunk_size=1000, report=None):
+    """
+    Перенос кошельков слотов slots в шард target. Возвращает число кошельков.
+
+    1. Слоты помечаются переносимыми: после wait_for_map запись в их кошельки
+       отклоняется всеми процессами.
+    2. Кошельки копируются порциями по chunk_size, каждая — в транзакциях БД обоих
+       шардов под блокировкой кошельков в старом шарде. Недокопированные после сбоя
+       строки удаляются из нового шарда при следующем запуске. Транзакции получают
+       новые id: курсоры истории перенесенных кошельков, выданные до переноса,
+       перестают работать (клиенту нужно начать историю с первой страницы).
+    3. Карта переключается на новый шард, и после wait_for_map кошельки удаляются
+       из старых шардов.
+
+    Если перенос прерван до переключения, слоты остаются в старом шарде.
+    """
+    from apps.wallet.models import ShardSlot, Wallet
+
+    report = report or (lambda message: None)
+    if target not in get_shards():
+        raise ValueError(f"{target} не входит в WALLET_SHARDS")
+
+    init_map()
+    slot_rows = ShardSlot.objects.using(DEFAULT_DB_ALIAS).filter(slot__in=slots)
+    moving = slot_rows.exclude(database=target)
+    sources = {}
+    for slot, database in moving.values_list("slot", "database"):
+        sources.setdefault(database, set()).add(slot)
+    if not sources:
+        return 0
+
+    moving_slots = [slot for source_slots in sources.values() for slot in source_slots]
+    moving = slot_rows.filter(slot__in=moving_slots)
+    moving.update(is_moving=True, date_updated=timezone.now())
+    shard_map.invalidate()
+    try:
+        wait_for_map()
+        wallets = {}
+        for source, source_slots in sources.items():
+            wallets[source] = [
+                wallet_uuid
+                for wallet_uuid in Wallet.objects.using(source)
+                .values_list("pk", flat=True)
+                .iterator()
+                if slot_for(wallet_uuid) in source_slots
+            ]
+            for chunk in chunks(wallets[source], chunk_size):
+                copy_wallets(chunk, source, target)
+            report(f"{source} -> {target}: скопировано кошельков: {len(wallets[source])}")
+
+        moving.update(database=target, is_moving=False, date_updated=timezone.now())
+        shard_map.invalidate()
+        wait_for_map()
+        for source, wallet_uuids in wallets.items():
+            for chunk in chunks(wallet_uuids, chunk_size):
+                with transaction.atomic(using=source):
+                    delete_wallets(chunk, source)
+            report(f"{source}: удалено кошельков: {len(wallet_uuids)}")
+    finally:
+        moving.filter(is_moving=True).update(is_moving=False, date_updated=timezone.now())
+        shard_map.invalidate()
+    return sum(len(wallet_uuids) for wallet_uuids in wallets.values())
+
+
+def copy_wallets(wallet_uuids, source, target):
+    """Копирование кошельков и всех их строк из шарда source в шард target."""
+    from apps.wallet.models import (
+        BalanceCheckpoint,
+        IdempotencyKey,
+        Transaction,
+        Wallet,
+        WalletBucket,
+    )
+
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        delete_wallets(wallet_uuids, target)
+        locked = (
+            Wallet.objects.using(source)
+            .select_for_update()
+            .filter(pk__in=wallet_uuids)
+            .order_by("pk")
+        )
+        copy_rows(locked, target)
+        copy_rows(WalletBucket.objects.using(source).filter(wallet_id__in=wallet_uuids), target)
+        # Новые id транзакций назначает target: порядок вставки сохраняет порядок
+        # (date_created, id) каждого кошелька, по нему пересчитываются контрольные точки.
+        copy_rows(
+            Transaction.objects.using(source)
+            .filter(wallet_id__in=wallet_uuids)
+            .order_by("wallet_id", "date_created", "pk"),
+            target,
+        )
+        checkpoints = list(
+            BalanceCheckpoint.objects.using(source).filter(wallet_id__in=wallet_uuids)
+        )
+        for checkpoint in checkpoints:
+            checkpoint.transaction_id = remap_transaction_id(checkpoint, source, target)
+        insert_rows(
+            BalanceCheckpoint,
+            [
+                [getattr(checkpoint, field.attname) for field in copied_fields(BalanceCheckpoint)]
+                for checkpoint in checkpoints
+            ],
+            target,
+        )
+        copy_rows(
+            IdempotencyKey.objects.using(source).filter(wallet_uuid__in=wallet_uuids), target
+        )
+
+
+def remap_transaction_id(checkpoint, source, target):
+    """id последней учтенной контрольной точкой транзакции среди скопированных."""
+    from apps.wallet.models import Transaction
+
+    def ids(using):
+        return (
+            Transaction.objects.using(using)
+            .filter(wallet_id=checkpoint.wallet_id, date_created=checkpoint.as_of)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+    covered = [
+        new_id
+        for old_id, new_id in zip(ids(source), ids(target))
+        if old_id <= checkpoint.transaction_id
+    ]
+    return covered[-1] if covered else 0
+
+
+def delete_wallets(wallet_uuids, using):
+    """Удаление кошельков и всех их строк из шарда using."""
+    from apps.wallet.models import (
+        BalanceCheckpoint,
+        IdempotencyKey,
+        Transaction,
+        Wallet,
+        WalletBucket,
+    )
+
+    for model in (Transaction, BalanceCheckpoint, WalletBucket):
+        model.objects.using(using).filter(wallet_id__in=wallet_uuids).delete()
+    IdempotencyKey.objects.using(using).filter(wallet_uuid__in=wallet_uuids).delete()
+    Wallet.objects.using(using).filter(pk__in=wallet_uuids).delete()
+
+
+def copied_fields(model):
+    """Поля, которые переносятся в новый шард: все, кроме автоинкрементного id."""
+    return [field for field in model._meta.concrete_fields if field is not model._meta.auto_field]
+
+
+def copy_rows(queryset, using, chunk_size=1000):
+    """
+    Вставка строк queryset в базу using без изменения значений.
+
+    В отличие от bulk_create, поля auto_now и auto_now_add сохраняют исходные даты.
+    """
+    fields = copied_fields(queryset.model)
+    rows = queryset.values_list(*[field.attname for field in fields]).iterator(chunk_size)
+    for chunk in chunks(rows, chunk_size):
+        insert_rows(queryset.model, chunk, using)
+
+
+def insert_rows(model, rows, using):
+    if not rows:
+        return
+    fields = copied_fields(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        qn(model._meta.db_table),
+        ", ".join(qn(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+    params = [
+        [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+        for row in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
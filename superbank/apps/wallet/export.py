@@ -0,0 +1,68 @@
+"""
+Потоковая выгрузка транзакций в NDJSON и CSV.
+
+Транзакции читаются из базы порциями (Transaction.export_rows), строки формируются
+по одной и собираются в блоки по EXPORT_BLOCK_SIZE байт, поэтому память не зависит
+от объема выгрузки. Блоки можно сжимать gzip на лету (compress).
+
+"""
+
+import csv
+import json
+
+from django.utils.text import compress_sequence
+
+FIELDS = ("uuid", "wallet", "type", "amount", "timestamp")
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_BLOCK_SIZE = 64 * 1024
+
+
+def _values(row):
+    txn_uuid, wallet_uuid, operation_type, amount, date_created = row
+    return (
+        str(txn_uuid) if txn_uuid else None,
+        str(wallet_uuid),
+        operation_type,
+        str(amount),
+        date_created.isoformat(),
+    )
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(FIELDS, _values(row)))) + "\n"
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(_values(row))
+
+
+FORMATS = {"ndjson": ndjson_lines, "csv": csv_lines}
+
+
+def blocks(output, rows):
+    """Выгрузка строк rows в формате output блоками байт."""
+    block, size = [], 0
+    for line in FORMATS[output](rows):
+        block.append(line)
+        size += len(line)
+        if size >= EXPORT_BLOCK_SIZE:
+            yield "".join(block).encode()
+            block, size = [], 0
+    if block:
+        yield "".join(block).encode()
+
+
+def compress(sequence):
+    """Сжатие последовательности блоков gzip на лету."""
+    return compress_sequence(sequence)
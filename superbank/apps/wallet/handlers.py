@@ -0,0 +1,151 @@
+"""
+Облегченный конвейер запросов API кошелька.
+
+Запросы к маршрутам WalletConfig.get_urls (пути с префиксами WALLET_API_PATHS)
+обрабатывает отдельный обработчик Django с middleware из WALLET_API_MIDDLEWARE: без
+сессий, CSRF, сообщений, аутентификации Django и X-Frame-Options, которые нужны только
+админ-панели. Представления API аутентифицируют запрос сами (BasicAuthentication).
+Остальные запросы проходят полный список MIDDLEWARE.
+
+conf.wsgi и conf.asgi отдают серверу маршрутизатор путей (WSGIRouter, ASGIRouter).
+
+"""
+
+import logging
+
+import django
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("django.request")
+
+
+class APIHandlerMixin:
+    """Обработчик с middleware из WALLET_API_MIDDLEWARE вместо MIDDLEWARE."""
+
+    def load_middleware(self, is_async=False):
+        self.load_middleware_list(settings.WALLET_API_MIDDLEWARE, is_async=is_async)
+
+    def load_middleware_list(self, middleware_paths, is_async=False):
+        """
+        Цепочка middleware из списка middleware_paths.
+
+        Повторяет BaseHandler.load_middleware (Django 4.2), который берет список только
+        из settings.MIDDLEWARE: глобальная настройка не подменяется даже на время
+        загрузки.
+
+        """
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        get_response = self._get_response_async if is_async else self._get_response
+        handler = convert_exception_to_response(get_response)
+        handler_is_async = is_async
+        for middleware_path in reversed(middleware_paths):
+            middleware = import_string(middleware_path)
+            middleware_can_sync = getattr(middleware, "sync_capable", True)
+            middleware_can_async = getattr(middleware, "async_capable", False)
+            if not middleware_can_sync and not middleware_can_async:
+                raise RuntimeError(
+                    "Middleware %s must have at least one of "
+                    "sync_capable/async_capable set to True." % middleware_path
+                )
+            elif not handler_is_async and middleware_can_sync:
+                middleware_is_async = False
+            else:
+                middleware_is_async = middleware_can_async
+            try:
+                adapted_handler = self.adapt_method_mode(
+                    middleware_is_async,
+                    handler,
+                    handler_is_async,
+                    debug=settings.DEBUG,
+                    name="middleware %s" % middleware_path,
+                )
+                mw_instance = middleware(adapted_handler)
+            except MiddlewareNotUsed as exc:
+                if settings.DEBUG:
+                    if str(exc):
+                        logger.debug("MiddlewareNotUsed(%r): %s", middleware_path, exc)
+                    else:
+                        logger.debug("MiddlewareNotUsed: %r", middleware_path)
+                continue
+            else:
+                handler = adapted_handler
+
+            if mw_instance is None:
+                raise ImproperlyConfigured(
+                    "Middleware factory %s returned None." % middleware_path
+                )
+
+            if hasattr(mw_instance, "process_view"):
+                self._view_middleware.insert(
+                    0,
+                    self.adapt_method_mode(is_async, mw_instance.process_view),
+                )
+            if hasattr(mw_instance, "process_template_response"):
+                self._template_response_middleware.append(
+                    self.adapt_method_mode(is_async, mw_instance.process_template_response),
+                )
+            if hasattr(mw_instance, "process_exception"):
+                # Обработка исключений в Django всегда синхронная.
+                self._exception_middleware.append(
+                    self.adapt_method_mode(False, mw_instance.process_exception),
+                )
+
+            handler = convert_exception_to_response(mw_instance)
+            handler_is_async = middleware_is_async
+
+        handler = self.adapt_method_mode(is_async, handler, handler_is_async)
+        # Присваивается последним: по нему Django считает загрузку завершенной.
+        self._middleware_chain = handler
+
+
+class APIWSGIHandler(APIHandlerMixin, WSGIHandler):
+    pass
+
+
+class APIASGIHandler(APIHandlerMixin, ASGIHandler):
+    pass
+
+
+def is_api_path(path):
+    return path.startswith(tuple(settings.WALLET_API_PATHS))
+
+
+class WSGIRouter:
+    def __init__(self, default, api):
+        self.default = default
+        self.api = api
+
+    def get_handler(self, path):
+        return self.api if is_api_path(path) else self.default
+
+    def __call__(self, environ, start_response):
+        return self.get_handler(environ.get("PATH_INFO", ""))(environ, start_response)
+
+
+class ASGIRouter(WSGIRouter):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.default(scope, receive, send)
+
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path) :]
+        return await self.get_handler(path)(scope, receive, send)
+
+
+def get_wsgi_application():
+    django.setup(set_prefix=False)
+    return WSGIRouter(WSGIHandler(), APIWSGIHandler())
+
+
+def get_asgi_application():
+    django.setup(set_prefix=False)
+    return ASGIRouter(ASGIHandler(), APIASGIHandler())
@@ -0,0 +1,474 @@
+"""
+Массовая загрузка кошельков и транзакций (команда import_ledger).
+
+Файлы в формате выгрузки (apps.wallet.export): CSV с заголовком или NDJSON, при
+необходимости сжатые gzip (.gz). Поля транзакций: uuid, wallet, type, amount, timestamp;
+поля кошельков: uuid, date_created. Балансы из файлов не берутся: после загрузки баланс
+каждого затронутого кошелька пересчитывается по его транзакциям.
+
+Загрузка повторяема: транзакции, UUID и дата которых уже есть в базе (ограничение
+wallet_txn_uuid_uniq), пропускаются. Строке без UUID назначается uuid5 от ее номера
+в файле и значений, поэтому повторная загрузка того же файла ее не дублирует.
+
+В PostgreSQL строки передаются порциями через COPY FROM STDIN во временные таблицы
+без индексов и ограничений, затем проверяются и переносятся в основные таблицы
+в одной транзакции БД запросами INSERT ... SELECT. В остальных СУБД (SQLite
+в разработке) строки вставляются порциями через executemany.
+
+"""
+
+import csv
+import gzip
+import json
+import tempfile
+import time
+import uuid
+from decimal import Decimal as D
+from itertools import islice
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from apps.wallet import export, money
+from apps.wallet.cache import balance_cache
+from apps.wallet.db import partitions, shards
+from apps.wallet.models import BalanceCheckpoint, Transaction, Wallet
+
+WALLET_FIELDS = ("uuid", "date_created")
+TRANSACTION_FIELDS = export.FIELDS
+
+# Пространство имен UUID транзакций, которым в файле UUID не задан.
+IMPORT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_OID, "apps.wallet.importer")
+
+
+class LedgerImportError(Exception):
+    pass
+
+
+def read_rows(path, fields, output=None):
+    """
+    Строки файла path — кортежи значений полей fields.
+
+    Формат по умолчанию определяется по расширению: .csv или NDJSON.
+
+    """
+    compressed = path.endswith(".gz")
+    if output is None:
+        output = "csv" if path.removesuffix(".gz").endswith(".csv") else "ndjson"
+    with (gzip.open if compressed else open)(path, "rt", newline="") as file:
+        if output == "csv":
+            for record in csv.DictReader(file):
+                yield tuple(record.get(field) or None for field in fields)
+        else:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    yield tuple(record.get(field) for field in fields)
+
+
+def with_uuids(rows):
+    """Строки транзакций, в которых пустой UUID заменен постоянным uuid5."""
+    for number, (txn_uuid, *values) in enumerate(rows):
+        if not txn_uuid:
+            txn_uuid = uuid.uuid5(IMPORT_NAMESPACE, ":".join(map(str, (number, *values))))
+        yield (str(txn_uuid), *values)
+
+
+def split_rows(rows, position, databases):
+    """
+    Строки по шардам кошельков (значение с индексом position): {шард: строки}.
+
+    Файл разбирается один раз, строки каждого шарда записываются во временный файл
+    CSV. Строки кошельков других шардов пропускаются. Если слот кошелька переносится
+    (reshard), загрузка отклоняется WalletBusyException до записи в базу.
+
+    """
+    files, writers = {}, {}
+    for row in rows:
+        using = shards.shard_for(row[position], write=True)
+        if using not in databases:
+            continue
+        if using not in writers:
+            files[using] = tempfile.TemporaryFile("w+", newline="")
+            writers[using] = csv.writer(files[using])
+        writers[using].writerow(row)
+    return {using: read_spooled(files.get(using)) for using in databases}
+
+
+def read_spooled(file):
+    if file is None:
+        return
+    with file:
+        file.seek(0)
+        for record in csv.reader(file):
+            yield tuple(value or None for value in record)
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_importer(using, chunk_size, report=None):
+    if connections[using].vendor == "postgresql":
+        return PostgresLedgerImporter(using, chunk_size, report)
+    return LedgerImporter(using, chunk_size, report)
+
+
+class LedgerImporter:
+    """Загрузка порциями через executemany в одной транзакции БД."""
+
+    def __init__(self, using, chunk_size, report=None):
+        self.using = using
+        self.connection = connections[using]
+        self.chunk_size = chunk_size
+        self.report = report or (lambda message: None)
+
+    def run(self, wallet_rows=(), transaction_rows=()):
+        """
+        Загрузка кошельков и транзакций.
+
+        Возвращает число строк кошельков и число добавленных транзакций.
+
+        """
+        with transaction.atomic(using=self.using):
+            wallets = self.load_wallets(wallet_rows)
+            transactions, first_dates = self.load_transactions(transaction_rows)
+            for wallet_uuid, date_created in first_dates.items():
+                BalanceCheckpoint.invalidate(wallet_uuid, date_created, using=self.using)
+            Wallet.recompute_balances(first_dates, using=self.using)
+        return wallets, transactions
+
+    def load_wallets(self, rows):
+        count = 0
+        progress = self.progress("Кошельки")
+        for chunk in chunks(rows, self.chunk_size):
+            wallets = {}
+            for wallet_uuid, date_created in chunk:
+                wallets.setdefault(uuid.UUID(wallet_uuid), date_created)
+            existing = set(
+                Wallet.objects.using(self.using)
+                .filter(pk__in=wallets)
+                .values_list("pk", flat=True)
+            )
+            now = timezone.now()
+            self.insert(
+                Wallet,
+                ("uuid", "balance", "bucket_count", "date_created", "date_updated"),
+                [
+                    (wallet_uuid, D(0), 0, date_created or now, now)
+                    for wallet_uuid, date_created in wallets.items()
+                    if wallet_uuid not in existing
+                ],
+            )
+            count += len(chunk)
+            progress(count)
+        return count
+
+    def load_transactions(self, rows):
+        """
+        Возвращает число добавленных транзакций и дату самой ранней из них у каждого
+        кошелька. Уже загруженные транзакции пропускаются.
+        """
+        count, skipped, first_dates, known = 0, 0, {}, set()
+        types = {choice for choice, _ in Transaction.TYPE_CHOICES}
+        date_field = Transaction._meta.get_field("date_created")
+        progress = self.progress("Транзакции")
+        for chunk in chunks(rows, self.chunk_size):
+            values = {}
+            for txn_uuid, wallet_uuid, operation_type, amount, date_created in chunk:
+                wallet_uuid = uuid.UUID(wallet_uuid)
+                operation_type = (operation_type or "").lower()
+                amount = D(amount)
+                date_created = date_field.to_python(date_created)
+                if operation_type not in types or money.to_minor(amount) <= 0:
+                    raise LedgerImportError(f"Некорректная транзакция кошелька {wallet_uuid}")
+                if amount != amount.quantize(money.get_quantum()):
+                    raise LedgerImportError(
+                        f"Сумма {amount} кошелька {wallet_uuid} точнее минимальной единицы валюты"
+                    )
+                values.setdefault(
+                    (uuid.UUID(txn_uuid), date_created),
+                    (txn_uuid, wallet_uuid, operation_type, amount, date_created),
+                )
+
+            existing = set(
+                Transaction.objects.using(self.using)
+                .filter(uuid__in={txn_uuid for txn_uuid, _ in values})
+                .values_list("uuid", "date_created")
+            )
+            values = [row for key, row in values.items() if key not in existing]
+            skipped += len(chunk) - len(values)
+            for _, wallet_uuid, _, _, date_created in values:
+                if wallet_uuid not in first_dates or date_created < first_dates[wallet_uuid]:
+                    first_dates[wallet_uuid] = date_created
+
+            unknown = {row[1] for row in values} - known
+            known |= set(
+                Wallet.objects.using(self.using)
+                .filter(pk__in=unknown)
+                .values_list("pk", flat=True)
+            )
+            if unknown - known:
+                raise LedgerImportError(f"Кошельков не существует: {len(unknown - known)}")
+
+            self.insert(
+                Transaction,
+                ("uuid", "wallet", "operation_type", "amount", "date_created"),
+                values,
+            )
+            count += len(values)
+            progress(count)
+        if skipped:
+            self.report(f"Транзакции: пропущено уже загруженных: {skipped}")
+        return count, first_dates
+
+    def insert(self, model, names, rows):
+        fields = [model._meta.get_field(name) for name in names]
+        qn = self.connection.ops.quote_name
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            qn(model._meta.db_table),
+            ", ".join(qn(field.column) for field in fields),
+            ", ".join(["%s"] * len(fields)),
+        )
+        params = [
+            [
+                field.get_db_prep_save(field.to_python(value), self.connection)
+                for field, value in zip(fields, row)
+            ]
+            for row in rows
+        ]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+    def progress(self, name):
+        """Функция, сообщающая число загруженных строк и скорость загрузки."""
+        started = time.monotonic()
+
+        def report(count):
+            elapsed = time.monotonic() - started
+            rate = count / elapsed if elapsed else count
+            self.report(f"{name}: {count} строк, {rate:.0f} строк/с")
+
+        return report
+
+
+class PostgresLedgerImporter(LedgerImporter):
+    """
+    Загрузка через COPY FROM STDIN во временные таблицы.
+
+    Строки копируются порциями по chunk_size вне транзакции, поэтому прерванная
+    загрузка не оставляет строк в основных таблицах. Перенос, проверка и пересчет
+    балансов выполняются множественными запросами в одной транзакции БД:
+    - затронутые кошельки блокируются, чтобы пересчет не пропустил одновременные
+      операции;
+    - если таблица транзакций пуста (первоначальная загрузка), индекс истории
+      удаляется на время переноса и строится заново одним проходом;
+    - контрольные точки, которые не учитывают загруженные транзакции, удаляются.
+      Поэтому транзакции старше самой старой присоединенной партиции отклоняются:
+      их месяцы учтены контрольными точками отсоединения (detach_transaction_partitions),
+      которые нельзя пересчитать.
+
+    Добавленные транзакции (без пропущенных ON CONFLICT) собираются по кошелькам
+    во временную таблицу import_inserted: по ней пересчитываются балансы.
+
+    """
+
+    WALLETS = "import_wallet"
+    TRANSACTIONS = "import_transaction"
+    INSERTED = "import_inserted"
+
+    def run(self, wallet_rows=(), transaction_rows=()):
+        with self.connection.cursor() as cursor:
+            self.create_tables(cursor)
+            try:
+                wallets = self.copy(cursor, self.WALLETS, wallet_rows, "Кошельки")
+                copied = self.copy(cursor, self.TRANSACTIONS, transaction_rows, "Транзакции")
+                with transaction.atomic(using=self.using):
+                    self.insert_wallets(cursor)
+                    self.check_transactions(cursor)
+                    transactions = self.insert_transactions(cursor)
+                    self.recompute_balances(cursor)
+                self.invalidate_cache(cursor)
+            finally:
+                self.drop_tables(cursor)
+        if copied > transactions:
+            self.report(f"Транзакции: пропущено уже загруженных: {copied - transactions}")
+        return wallets, transactions
+
+    def drop_tables(self, cursor):
+        cursor.execute(
+            f"DROP TABLE IF EXISTS {self.WALLETS}, {self.TRANSACTIONS}, {self.INSERTED}"
+        )
+
+    def create_tables(self, cursor):
+        self.drop_tables(cursor)
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {self.WALLETS} (uuid uuid NOT NULL, date_created timestamptz)"
+        )
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {self.TRANSACTIONS} ("
+            f"uuid uuid NOT NULL, wallet_id uuid NOT NULL, operation_type varchar(255) NOT NULL, "
+            f"amount numeric NOT NULL, date_created timestamptz NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {self.INSERTED} ("
+            f"wallet_id uuid NOT NULL, date_created timestamptz NOT NULL, count bigint NOT NULL)"
+        )
+
+    def copy(self, cursor, table, rows, name):
+        if not hasattr(cursor.cursor, "copy"):
+            raise LedgerImportError("Загрузка через COPY требует драйвера psycopg 3")
+
+        count = 0
+        progress = self.progress(name)
+        for chunk in chunks(rows, self.chunk_size):
+            with cursor.cursor.copy(f"COPY {table} FROM STDIN") as copy:
+                for row in chunk:
+                    copy.write_row(row)
+            count += len(chunk)
+            progress(count)
+        return count
+
+    def insert_wallets(self, cursor):
+        cursor.execute(
+            f"INSERT INTO {Wallet._meta.db_table} "
+            f"(uuid, balance, bucket_count, date_created, date_updated) "
+            f"SELECT DISTINCT ON (uuid) uuid, 0, 0, COALESCE(date_created, now()), now() "
+            f"FROM {self.WALLETS} "
+            f"ON CONFLICT (uuid) DO NOTHING"
+        )
+
+    def check_transactions(self, cursor):
+        types = ", ".join(f"'{choice}'" for choice, _ in Transaction.TYPE_CHOICES)
+        scale = 10 ** money.get_exponent()
+        # Сумма точнее минимальной единицы валюты некорректна, а не округляется.
+        cursor.execute(
+            f"SELECT count(*) FROM {self.TRANSACTIONS} "
+            f"WHERE lower(operation_type) NOT IN ({types}) OR round(amount * %s) <= 0 "
+            f"OR amount * %s <> round(amount * %s)",
+            [scale, scale, scale],
+        )
+        invalid = cursor.fetchone()[0]
+        if invalid:
+            raise LedgerImportError(f"Некорректных транзакций: {invalid}")
+
+        retained_from = partitions.get_retained_from(self.connection)
+        if retained_from is not None:
+            cursor.execute(
+                f"SELECT count(*) FROM {self.TRANSACTIONS} WHERE date_created < %s",
+                [retained_from],
+            )
+            detached = cursor.fetchone()[0]
+            if detached:
+                raise LedgerImportError(
+                    f"Транзакций до {retained_from:%Y-%m-%d} (партиции отсоединены): {detached}"
+                )
+
+        partitioned_until = partitions.get_partitioned_until(self.connection)
+        if partitioned_until is not None:
+            cursor.execute(
+                f"SELECT count(*) FROM {self.TRANSACTIONS} WHERE date_created >= %s",
+                [partitioned_until],
+            )
+            future = cursor.fetchone()[0]
+            if future:
+                raise LedgerImportError(
+                    f"Транзакций с {partitioned_until:%Y-%m-%d} (партиции не созданы, "
+                    f"см. create_transaction_partitions): {future}"
+                )
+
+        cursor.execute(
+            f"SELECT count(DISTINCT t.wallet_id) FROM {self.TRANSACTIONS} t "
+            f"LEFT JOIN {Wallet._meta.db_table} w ON w.uuid = t.wallet_id "
+            f"WHERE w.uuid IS NULL"
+        )
+        missing = cursor.fetchone()[0]
+        if missing:
+            raise LedgerImportError(f"Кошельков не существует: {missing}")
+
+        cursor.execute(
+            f"SELECT count(*) FROM ("
+            f"SELECT uuid FROM {Wallet._meta.db_table} "
+            f"WHERE uuid IN (SELECT wallet_id FROM {self.TRANSACTIONS}) "
+            f"ORDER BY uuid FOR UPDATE) locked"
+        )
+
+    def insert_transactions(self, cursor):
+        table = Transaction._meta.db_table
+        deferred = [] if Transaction.objects.using(self.using).exists() else [
+            index for index in Transaction._meta.indexes if index.name == "wallet_txn_history_idx"
+        ]
+        with self.connection.schema_editor() as editor:
+            for index in deferred:
+                editor.remove_index(Transaction, index)
+
+        # Суммы из файла переводятся в минимальные единицы валюты (apps.wallet.money).
+        # Уже загруженные транзакции пропускает уникальный индекс wallet_txn_uuid_uniq.
+        cursor.execute(
+            f"WITH inserted AS ("
+            f"INSERT INTO {table} (uuid, wallet_id, operation_type, amount, date_created) "
+            f"SELECT uuid, wallet_id, lower(operation_type), "
+            f"round(amount * %s)::bigint, date_created FROM {self.TRANSACTIONS} "
+            f"ORDER BY wallet_id, date_created "
+            f"ON CONFLICT (uuid, date_created) WHERE uuid IS NOT NULL DO NOTHING "
+            f"RETURNING wallet_id, date_created) "
+            f"INSERT INTO {self.INSERTED} "
+            f"SELECT wallet_id, min(date_created), count(*) FROM inserted GROUP BY wallet_id",
+            [10 ** money.get_exponent()],
+        )
+
+        with self.connection.schema_editor() as editor:
+            for index in deferred:
+                editor.add_index(Transaction, index)
+        cursor.execute(f"ANALYZE {table}")
+        cursor.execute(f"SELECT COALESCE(sum(count), 0) FROM {self.INSERTED}")
+        return cursor.fetchone()[0]
+
+    def recompute_balances(self, cursor):
+        cursor.execute(
+            f"DELETE FROM {BalanceCheckpoint._meta.db_table} c "
+            f"USING {self.INSERTED} t "
+            f"WHERE c.wallet_id = t.wallet_id AND c.as_of >= t.date_created"
+        )
+        # Баланс — последняя контрольная точка плюс транзакции после нее, как
+        # в get_ledger_balance: транзакции отсоединенных партиций учтены только в точках.
+        cursor.execute(
+            f"UPDATE {Wallet._meta.db_table} w "
+            f"SET balance = COALESCE(c.balance, 0) + COALESCE(l.amount, 0), "
+            f"date_updated = now() "
+            f"FROM {self.INSERTED} i "
+            f"LEFT JOIN LATERAL (SELECT as_of, transaction_id, balance "
+            f"FROM {BalanceCheckpoint._meta.db_table} "
+            f"WHERE wallet_id = i.wallet_id "
+            f"ORDER BY as_of DESC, transaction_id DESC LIMIT 1) c ON true "
+            f"LEFT JOIN LATERAL (SELECT sum(CASE WHEN t.operation_type = %s "
+            f"THEN t.amount ELSE -t.amount END) AS amount "
+            f"FROM {Transaction._meta.db_table} t "
+            f"WHERE t.wallet_id = i.wallet_id AND (c.as_of IS NULL "
+            f"OR (t.date_created >= c.as_of AND (t.date_created > c.as_of "
+            f"OR t.id > c.transaction_id)))) l ON true "
+            f"WHERE w.uuid = i.wallet_id AND w.bucket_count = 0",
+            [Transaction.DEPOSIT],
+        )
+
+        # Кошельки в режиме корзин редки: их баланс распределяется по корзинам.
+        cursor.execute(
+            f"SELECT uuid FROM {Wallet._meta.db_table} "
+            f"WHERE bucket_count > 0 AND uuid IN (SELECT wallet_id FROM {self.INSERTED})"
+        )
+        Wallet.recompute_balances(
+            [wallet_uuid for (wallet_uuid,) in cursor.fetchall()], using=self.using
+        )
+
+    def invalidate_cache(self, cursor):
+        cursor.execute(f"SELECT wallet_id FROM {self.INSERTED}")
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                return
+            balance_cache.delete_many([wallet_uuid for (wallet_uuid,) in rows])
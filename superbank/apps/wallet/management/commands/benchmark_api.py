@@ -0,0 +1,122 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def _get(reader, writer, host, path):
+    """GET-запрос по keep-alive соединению. Возвращает статус ответа."""
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode()
+    )
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Соединение закрыто сервером")
+    content_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            content_length = int(value)
+    await reader.readexactly(content_length)
+    return int(status_line.split()[1])
+
+
+async def _worker(url, queue, latencies, errors):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                status = await _get(reader, writer, parts.netloc, parts.path)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors.append(None)
+                writer.close()
+                reader, writer = await asyncio.open_connection(
+                    parts.hostname, parts.port or 80
+                )
+                continue
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_benchmark(url, requests, concurrency):
+    """Нагрузка url: requests запросов из concurrency одновременных соединений."""
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+    latencies, errors = [], []
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(_worker(url, queue, latencies, errors) for _ in range(concurrency)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - started
+
+    failed_connections = sum(isinstance(result, Exception) for result in results)
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "failed_connections": failed_connections,
+        "elapsed": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0,
+        "p50": statistics.median(latencies) if latencies else 0,
+        "p99": (
+            statistics.quantiles(latencies, n=100)[98] if len(latencies) > 1 else 0
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение синхронного (WSGI) и асинхронного (ASGI) эндпоинтов баланса "
+        "под одновременной нагрузкой"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("wallet_uuid", help="UUID кошелька для чтения баланса")
+        parser.add_argument("--wsgi-url", default="http://localhost:8000")
+        parser.add_argument("--asgi-url", default="http://localhost:8001")
+        parser.add_argument("--requests", type=int, default=10000)
+        parser.add_argument("--concurrency", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests и --concurrency должны быть больше нуля")
+
+        targets = [
+            (
+                "WSGI",
+                f"{options['wsgi_url'].rstrip('/')}/api/v1/wallets/{options['wallet_uuid']}/",
+            ),
+            (
+                "ASGI",
+                f"{options['asgi_url'].rstrip('/')}/api/v1/async/wallets/{options['wallet_uuid']}/",
+            ),
+        ]
+        for name, url in targets:
+            result = asyncio.run(
+                run_benchmark(url, options["requests"], options["concurrency"])
+            )
+            self.stdout.write(
+                f"{name} {url}\n"
+                f"  запросов: {result['requests']}, ошибок: {result['errors']}, "
+                f"соединений не открыто: {result['failed_connections']}\n"
+                f"  {result['rps']:.0f} запросов/с, "
+                f"p50 {result['p50'] * 1000:.1f} мс, p99 {result['p99'] * 1000:.1f} мс"
+            )
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.wallet.benchmark import MiddlewareBenchmark
+from apps.wallet.management.commands.benchmark_wallets import current_commit
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарк запроса баланса через полный MIDDLEWARE и облегченный конвейер "
+        "API (WALLET_API_MIDDLEWARE), микросекунды на запрос в формате JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1 or options["repeat"] < 1:
+            raise CommandError("--iterations и --repeat должны быть больше нуля")
+
+        benchmark = MiddlewareBenchmark(
+            iterations=options["iterations"], repeat=options["repeat"]
+        )
+        result = {"commit": current_commit(), **benchmark.run()}
+        self.stdout.write(json.dumps(result, indent=2))
@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.wallet.benchmark import MoneyBenchmark
+from apps.wallet.management.commands.benchmark_wallets import current_commit
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарк сумм в Decimal и в минимальных единицах валюты: арифметика "
+        "проведения операции (микросекунды на вызов) и размер индекса по столбцу "
+        "numeric(12, 2) и bigint (байты) в формате JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        if min(options["iterations"], options["repeat"], options["rows"]) < 1:
+            raise CommandError("--iterations, --repeat и --rows должны быть больше нуля")
+
+        benchmark = MoneyBenchmark(
+            iterations=options["iterations"],
+            repeat=options["repeat"],
+            rows=options["rows"],
+            using=options["database"],
+        )
+        result = {"commit": current_commit(), **benchmark.run()}
+        self.stdout.write(json.dumps(result, indent=2))
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.wallet.benchmark import SerializationBenchmark
+from apps.wallet.management.commands.benchmark_wallets import current_commit
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарк проверки, разбора и отрисовки операции: сериализатор и "
+        "JSONRenderer DRF против OperationValidator и msgspec, микросекунды на вызов "
+        "в формате JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1 or options["repeat"] < 1:
+            raise CommandError("--iterations и --repeat должны быть больше нуля")
+
+        benchmark = SerializationBenchmark(
+            iterations=options["iterations"], repeat=options["repeat"]
+        )
+        result = {"commit": current_commit(), **benchmark.run()}
+        self.stdout.write(json.dumps(result, indent=2))
@@ -0,0 +1,76 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.wallet.benchmark import WalletBenchmark
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест эндпоинтов операции и баланса внутри процесса: пропускная "
+        "способность, задержки p50/p95/p99, повторы из-за блокировок, взаимные блокировки "
+        "и проверка балансов в формате JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wallets", type=int, default=100)
+        parser.add_argument("--hot-wallets", type=int, default=1)
+        parser.add_argument(
+            "--hot-share", type=float, default=0.5, help="Доля операций горячих кошельков"
+        )
+        parser.add_argument("--read-share", type=float, default=0.5, help="Доля чтений баланса")
+        parser.add_argument(
+            "--withdraw-share", type=float, default=0.3, help="Доля снятий среди операций"
+        )
+        parser.add_argument(
+            "--transfer-share",
+            type=float,
+            default=0.0,
+            help="Доля встречных переводов между двумя первыми кошельками",
+        )
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--operations", type=int, default=2000)
+        parser.add_argument("--seed", type=int)
+        parser.add_argument("--output", help="Файл результатов, по умолчанию stdout")
+        parser.add_argument(
+            "--keep", action="store_true", help="Не удалять кошельки теста после запуска"
+        )
+
+    def handle(self, *args, **options):
+        if options["wallets"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--wallets и --concurrency должны быть больше нуля")
+
+        benchmark = WalletBenchmark(
+            wallets=options["wallets"],
+            hot_wallets=options["hot_wallets"],
+            hot_share=options["hot_share"],
+            read_share=options["read_share"],
+            withdraw_share=options["withdraw_share"],
+            transfer_share=options["transfer_share"],
+            concurrency=options["concurrency"],
+            operations=options["operations"],
+            seed=options["seed"],
+        )
+        result = {"commit": current_commit(), **benchmark.run(keep=options["keep"])}
+
+        output = json.dumps(result, indent=2, default=str)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+        if not result["correctness"]["correct"]:
+            raise CommandError("Итоговые балансы кошельков не сходятся с операциями")
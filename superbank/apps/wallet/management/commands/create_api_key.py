@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.wallet.models import APIKey
+
+
+class Command(BaseCommand):
+    help = "Создание ключа API пользователя; ключ выводится один раз"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--name", default="", help="Название ключа")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User._default_manager.get_by_natural_key(options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь не найден: {options['username']}")
+
+        api_key, key = APIKey.generate(user, name=options["name"])
+        self.stderr.write(f"Создан ключ API {api_key}. Сохраните его, он больше не будет показан:")
+        self.stdout.write(key)
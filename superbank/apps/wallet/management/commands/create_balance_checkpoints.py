@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.wallet.api.exceptions import WalletBusyException
+from apps.wallet.db import shards
+from apps.wallet.models import Wallet
+
+
+class Command(BaseCommand):
+    help = "Создание контрольных точек баланса кошельков с большим числом новых транзакций"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-transactions",
+            type=int,
+            default=settings.WALLET_CHECKPOINT_MIN_TRANSACTIONS,
+        )
+
+    def handle(self, *args, **options):
+        def create(using):
+            created = 0
+            wallet_uuids = Wallet.objects.using(using).values_list("pk", flat=True)
+            for wallet_uuid in wallet_uuids.iterator():
+                try:
+                    checkpoint = Wallet(uuid=wallet_uuid).create_balance_checkpoint(
+                        options["min_transactions"], using=using
+                    )
+                except WalletBusyException:
+                    # Кошелек переносится в другой шард: точка создается следующим запуском.
+                    continue
+                created += checkpoint is not None
+            return created
+
+        # Шарды кошельков обрабатываются параллельно.
+        created = sum(shards.scatter(create))
+        self.stdout.write(f"Создано контрольных точек: {created}")
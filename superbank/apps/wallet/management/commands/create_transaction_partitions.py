@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from apps.wallet.db import partitions
+
+
+class Command(BaseCommand):
+    help = "Создание помесячных партиций таблицы транзакций на несколько месяцев вперед"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months", type=int, default=settings.WALLET_TRANSACTION_PARTITIONS_AHEAD
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if not partitions.is_partitioned(connection):
+            raise CommandError("Таблица транзакций не секционирована")
+
+        until = partitions.add_months(
+            partitions.month_start(timezone.now()), options["months"] + 1
+        )
+        created = partitions.create_partitions(connection, until)
+        self.stdout.write(f"Создано партиций: {len(created)}")
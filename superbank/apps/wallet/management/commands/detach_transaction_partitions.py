@@ -0,0 +1,78 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from apps.wallet.db import partitions
+from apps.wallet.models import BalanceCheckpoint, Wallet
+
+
+def month(value):
+    return datetime.datetime.strptime(value, "%Y-%m").replace(tzinfo=datetime.timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        "Отсоединение партиций транзакций, целиком лежащих до месяца --before (ГГГГ-ММ). "
+        "Перед отсоединением для кошельков партиции создаются контрольные точки баланса."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--before", type=month, required=True)
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        connection = connections[using]
+        if not partitions.is_partitioned(connection):
+            raise CommandError("Таблица транзакций не секционирована")
+
+        candidates = [
+            (partitions.add_months(start, 1), name)
+            for start, name in partitions.get_partitions(connection)
+        ]
+        legacy_bound = partitions.get_upper_bound(connection, partitions.LEGACY_PARTITION)
+        if legacy_bound is not None:
+            candidates.insert(0, (legacy_bound, partitions.LEGACY_PARTITION))
+
+        for upper, name in candidates:
+            if upper > options["before"]:
+                break
+            if options["dry_run"]:
+                self.stdout.write(f"Будет отсоединена партиция {name}")
+                continue
+            self.checkpoint_wallets(connection, name, upper, using)
+            partitions.detach_partition(connection, name)
+            self.stdout.write(f"Отсоединена партиция {name}")
+
+    def checkpoint_wallets(self, connection, name, upper, using):
+        """
+        Контрольные точки баланса на конец партиции для всех ее кошельков.
+
+        После отсоединения транзакции партиции не видны при пересчете баланса,
+        поэтому каждый кошелек должен иметь точку, покрывающую его последнюю транзакцию
+        в партиции. Точка ставится до границы партиции и не сбрасывается изменением
+        более новых транзакций.
+
+        """
+        as_of = upper - datetime.timedelta(microseconds=1)
+        for wallet_uuid, last_date_created in self.get_wallets(connection, name):
+            Wallet(uuid=wallet_uuid).create_balance_checkpoint(1, as_of=as_of, using=using)
+            covered = BalanceCheckpoint.objects.using(using).filter(
+                wallet_id=wallet_uuid, as_of__gte=last_date_created, as_of__lt=upper
+            )
+            if not covered.exists():
+                raise CommandError(
+                    f"Нет контрольной точки баланса кошелька {wallet_uuid} "
+                    f"для партиции {name}"
+                )
+
+    def get_wallets(self, connection, name):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT wallet_id, max(date_created) FROM {} GROUP BY wallet_id".format(
+                    connection.ops.quote_name(name)
+                )
+            )
+            return cursor.fetchall()
@@ -0,0 +1,58 @@
+import gzip
+import sys
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.wallet import export
+from apps.wallet.models import Transaction
+
+
+def datetime_argument(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Потоковая выгрузка транзакций кошелька или периода в NDJSON или CSV "
+        "(в файл или stdout, при необходимости со сжатием gzip)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wallet", help="UUID кошелька")
+        parser.add_argument("--date-from", type=datetime_argument)
+        parser.add_argument("--date-to", type=datetime_argument)
+        parser.add_argument(
+            "--operation-type", choices=[choice for choice, _ in Transaction.TYPE_CHOICES]
+        )
+        parser.add_argument("--output", choices=list(export.FORMATS), default="ndjson")
+        parser.add_argument("--file", default="-", help="Путь к файлу, по умолчанию stdout")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--chunk-size", type=int)
+
+    def handle(self, *args, **options):
+        rows = Transaction.export_rows(
+            options["wallet"],
+            operation_type=options["operation_type"],
+            date_from=options["date_from"],
+            date_to=options["date_to"],
+            chunk_size=options["chunk_size"],
+        )
+
+        path = options["file"]
+        with ExitStack() as stack:
+            if path == "-":
+                stream = sys.stdout.buffer
+            else:
+                stream = stack.enter_context(open(path, "wb"))
+            if options["gzip"]:
+                stream = stack.enter_context(gzip.GzipFile(fileobj=stream, mode="wb"))
+            for block in export.blocks(options["output"], rows):
+                stream.write(block)
@@ -0,0 +1,89 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from apps.wallet import export
+from apps.wallet.api.exceptions import WalletBusyException
+from apps.wallet.db import shards
+from apps.wallet.importer import (
+    TRANSACTION_FIELDS,
+    WALLET_FIELDS,
+    LedgerImportError,
+    get_importer,
+    read_rows,
+    split_rows,
+    with_uuids,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Массовая загрузка кошельков и транзакций из файлов CSV или NDJSON (в том числе .gz) "
+        "с пересчетом балансов. В PostgreSQL строки загружаются через COPY. При шардировании "
+        "строки раскладываются по шардам кошельков, и каждый шард загружается в своей "
+        "транзакции БД. Повторная загрузка пропускает уже загруженные транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wallets", help="Файл кошельков: uuid, date_created")
+        parser.add_argument(
+            "--transactions", help="Файл транзакций: uuid, wallet, type, amount, timestamp"
+        )
+        parser.add_argument("--input", choices=list(export.FORMATS), help="Формат файлов")
+        parser.add_argument("--chunk-size", type=int, default=50000)
+        parser.add_argument("--database", help="По умолчанию все шарды кошельков")
+
+    def handle(self, *args, **options):
+        if not options["wallets"] and not options["transactions"]:
+            raise CommandError("Укажите --wallets и/или --transactions")
+
+        databases = [options["database"]] if options["database"] else shards.get_shards()
+        started = time.monotonic()
+        try:
+            rows = self.read_shard_rows(options, databases)
+        except (LedgerImportError, ValueError) as e:
+            raise CommandError(f"Загрузка отменена: {e}")
+        except WalletBusyException:
+            raise CommandError("Загрузка отменена: слоты кошельков переносятся (reshard)")
+
+        wallets = transactions = 0
+        committed = []
+        for using in databases:
+            importer = get_importer(using, options["chunk_size"], self.stdout.write)
+            try:
+                loaded = importer.run(*rows[using])
+            except (LedgerImportError, IntegrityError, ValueError) as e:
+                # Шарды загружаются в отдельных транзакциях БД: загруженные остаются,
+                # повторный запуск пропустит их транзакции.
+                raise CommandError(
+                    f"Загрузка в {using} отменена: {e}. "
+                    f"Загружены шарды: {', '.join(committed) or 'нет'}"
+                )
+            committed.append(using)
+            wallets += loaded[0]
+            transactions += loaded[1]
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Загружено кошельков: {wallets}, транзакций: {transactions} "
+            f"за {elapsed:.1f} с ({(wallets + transactions) / (elapsed or 1):.0f} строк/с)"
+        )
+
+    def read_shard_rows(self, options, databases):
+        """{шард: (строки кошельков, строки транзакций)}; файлы читаются один раз."""
+        wallet_rows = transaction_rows = ()
+        if options["wallets"]:
+            wallet_rows = read_rows(options["wallets"], WALLET_FIELDS, options["input"])
+        if options["transactions"]:
+            transaction_rows = with_uuids(
+                read_rows(options["transactions"], TRANSACTION_FIELDS, options["input"])
+            )
+        if not shards.is_enabled():
+            return {using: (wallet_rows, transaction_rows) for using in databases}
+
+        wallets = split_rows(wallet_rows, WALLET_FIELDS.index("uuid"), databases)
+        transactions = split_rows(
+            transaction_rows, TRANSACTION_FIELDS.index("wallet"), databases
+        )
+        return {using: (wallets[using], transactions[using]) for using in databases}
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from apps.wallet.db import shards
+from apps.wallet.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Удаление ключей идемпотентности старше WALLET_IDEMPOTENCY_KEY_TTL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        # Ключи без кошелька хранятся в основной базе, остальные — в шардах кошельков.
+        databases = dict.fromkeys([DEFAULT_DB_ALIAS, *shards.get_shards()])
+        deleted = sum(
+            shards.scatter(
+                lambda using: IdempotencyKey.prune(batch_size=options["batch_size"], using=using),
+                databases,
+            )
+        )
+        self.stdout.write(f"Удалено ключей идемпотентности: {deleted}")
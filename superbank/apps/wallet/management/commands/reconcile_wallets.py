@@ -0,0 +1,97 @@
+import csv
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.wallet.db import shards as wallet_shards
+
+
+def shard_bounds(shards):
+    """Деление пространства uuid на shards равных диапазонов [start, end)."""
+    step = 2**128 // shards
+    bounds = [uuid.UUID(int=step * number) for number in range(1, shards)]
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+def check_shard(bounds, using):
+    # Модели импортируются после django.setup() в процессе пула.
+    from apps.wallet.models import Wallet
+
+    start, end = bounds
+    return using, Wallet.find_balance_mismatches(start, end, using=using)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверка балансов кошельков с суммой их транзакций. Пространство uuid делится "
+        "на диапазоны, которые проверяются параллельно в нескольких процессах, в каждом "
+        "шарде кошельков; расхождения выводятся в отчет CSV. С --repair балансы исправляются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--shards", type=int, help="По умолчанию 8 на процесс")
+        parser.add_argument("--report", default="-", help="Файл отчета, по умолчанию stdout")
+        parser.add_argument("--repair", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--database", help="По умолчанию все шарды кошельков")
+
+    def handle(self, *args, **options):
+        databases = [options["database"]] if options["database"] else wallet_shards.get_shards()
+        shards = shard_bounds(options["shards"] or options["workers"] * 8)
+
+        if options["report"] == "-":
+            report_file = nullcontext(self.stdout)
+        else:
+            report_file = open(options["report"], "w", newline="")
+        with report_file as report:
+            writer = csv.writer(report)
+            writer.writerow(("wallet", "balance", "ledger_balance", "difference"))
+
+            found, repaired, pending = 0, 0, {}
+            for using, mismatches in self.find_mismatches(
+                shards, options["workers"], databases
+            ):
+                for wallet_uuid, balance, ledger_balance in mismatches:
+                    writer.writerow(
+                        (wallet_uuid, balance, ledger_balance, balance - ledger_balance)
+                    )
+                found += len(mismatches)
+                if not options["repair"]:
+                    continue
+
+                pending.setdefault(using, []).extend(
+                    wallet_uuid for wallet_uuid, _, _ in mismatches
+                )
+                if len(pending[using]) >= options["batch_size"]:
+                    repaired += self.repair(pending.pop(using), using)
+            for using, wallet_uuids in pending.items():
+                repaired += self.repair(wallet_uuids, using)
+
+        self.stderr.write(f"Расхождений: {found}, исправлено: {repaired}")
+
+    def find_mismatches(self, shards, workers, databases):
+        """Пары (база, расхождения) по мере проверки диапазонов каждой базы."""
+        jobs = [(bounds, using) for using in databases for bounds in shards]
+        if workers <= 1:
+            for bounds, using in jobs:
+                yield check_shard(bounds, using)
+            return
+
+        # Соединения родительского процесса не должны достаться дочерним.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            futures = [executor.submit(check_shard, bounds, using) for bounds, using in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def repair(self, wallet_uuids, using):
+        """Исправление балансов пачки кошельков под блокировкой строк."""
+        from apps.wallet.models import Wallet
+
+        return len(Wallet.recompute_balances(wallet_uuids, using=using))
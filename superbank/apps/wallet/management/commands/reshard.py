@@ -0,0 +1,68 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.wallet.db import shards
+from apps.wallet.models import ShardSlot
+
+
+def slot_ranges(value):
+    """Слоты из списка вида 0-127,512."""
+    slots = set()
+    for part in value.split(","):
+        start, _, end = part.partition("-")
+        slots.update(range(int(start), int(end or start) + 1))
+    return sorted(slots)
+
+
+class Command(BaseCommand):
+    help = (
+        "Карта шардов кошельков: --init заполняет карту слотов, --slots и --to переносят "
+        "слоты в другой шард без остановки сервиса, --status показывает число слотов шардов. "
+        "Перенесенные транзакции получают новые id: выданные до переноса курсоры истории "
+        "их кошельков недействительны."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--init", action="store_true")
+        parser.add_argument("--slots", type=slot_ranges, help="Слоты, например 0-127,512")
+        parser.add_argument("--to", help="Шард, в который переносятся слоты")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--status", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["init"]:
+            # Карта заполняется и до включения шардирования: все слоты — основной базе.
+            self.stdout.write(f"Добавлено слотов в карту: {shards.init_map()}")
+
+        if not shards.is_enabled():
+            if options["init"]:
+                return
+            raise CommandError("Шардирование выключено: WALLET_SHARDS пуст")
+
+        if options["slots"] is not None:
+            if not options["to"]:
+                raise CommandError("Укажите шард --to")
+            if options["slots"][-1] >= settings.WALLET_SHARD_SLOTS:
+                raise CommandError(f"Слотов всего {settings.WALLET_SHARD_SLOTS}")
+            try:
+                moved = shards.move_slots(
+                    options["slots"],
+                    options["to"],
+                    chunk_size=options["chunk_size"],
+                    report=self.stdout.write,
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Перенесено кошельков: {moved}")
+
+        if options["status"]:
+            counts = Counter(ShardSlot.objects.values_list("database", flat=True))
+            for alias in shards.get_shards():
+                self.stdout.write(f"{alias}: {counts.pop(alias, 0)} слотов")
+            for alias, count in counts.items():
+                self.stdout.write(f"{alias} (нет в WALLET_SHARDS): {count} слотов")
+            moving = list(ShardSlot.objects.filter(is_moving=True).values_list("slot", flat=True))
+            if moving:
+                self.stdout.write(f"Переносятся слоты: {moving}")
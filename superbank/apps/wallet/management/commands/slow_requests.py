@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.wallet.models import SlowRequest
+
+
+class Command(BaseCommand):
+    help = (
+        "Медленные запросы, сохраненные профилированием запросов (WALLET_PROFILING): "
+        "список самых долгих или время этапов, запросы к базе и профиль одного запроса"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--endpoint", help="Имя маршрута, например create-transaction")
+        parser.add_argument("--id", type=int, help="Подробности запроса с этим ID")
+        parser.add_argument("--clear", action="store_true", help="Удалить сохраненные запросы")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            deleted = SlowRequest.objects.all().delete()[0]
+            self.stdout.write(f"Удалено медленных запросов: {deleted}")
+            return
+
+        if options["id"] is not None:
+            try:
+                request = SlowRequest.objects.get(pk=options["id"])
+            except SlowRequest.DoesNotExist:
+                raise CommandError(f"Медленный запрос {options['id']} не найден")
+            self.show(request)
+            return
+
+        requests = SlowRequest.objects.all()
+        if options["endpoint"]:
+            requests = requests.filter(endpoint=options["endpoint"])
+        for request in requests[: options["limit"]]:
+            timings = " ".join(f"{phase}={duration}" for phase, duration in request.timings.items())
+            self.stdout.write(
+                f"{request.pk:>6} {request.date_created:%Y-%m-%d %H:%M:%S} "
+                f"{request.duration:>9.1f} мс {request.status} {request.method} "
+                f"{request.path} [{timings}]"
+            )
+
+    def show(self, request):
+        self.stdout.write(f"{request.method} {request.path} ({request.endpoint})")
+        self.stdout.write(
+            f"Статус {request.status}, {request.duration:.1f} мс, {request.date_created}"
+        )
+        self.stdout.write("\nВремя этапов, мс:")
+        for phase, duration in request.timings.items():
+            self.stdout.write(f"  {phase:<10} {duration:>9.1f}")
+        self.stdout.write(f"\nЗапросы к базе ({request.query_count}):")
+        for query in request.queries:
+            self.stdout.write(f"  {query['duration_ms']:>9.1f} мс  {query['sql']}")
+        if request.profile:
+            self.stdout.write("\nПрофиль cProfile:")
+            self.stdout.write(request.profile)
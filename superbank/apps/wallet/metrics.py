@@ -0,0 +1,123 @@
+"""
+Метрики кошелька в формате Prometheus (GET /metrics).
+
+Под gunicorn с несколькими воркерами каждый процесс пишет значения в файлы каталога
+из переменной окружения PROMETHEUS_MULTIPROC_DIR (режим multiprocess prometheus_client),
+и /metrics любого воркера отдает сумму по всем воркерам. Каталог очищается перед
+запуском gunicorn, завершившиеся воркеры отмечаются в conf/gunicorn.py. Без переменной
+метрики хранятся в памяти процесса.
+
+Эндпоинт (apps.wallet.api.views.MetricsView) доступен администраторам и адресам
+из WALLET_METRICS_ALLOWED_NETWORKS.
+
+Запросы и запросы к базе считает MetricsMiddleware (apps.wallet.middleware),
+операции, блокировки и повторы — модели кошелька.
+
+"""
+
+import os
+from contextlib import contextmanager
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.dispatch import receiver
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from apps.wallet import profiling
+from apps.wallet.api.exceptions import RestApiException, WalletBusyException
+from apps.wallet.signals import transaction_retried
+
+REQUEST_LATENCY = Histogram(
+    "wallet_http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["endpoint", "method", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "wallet_http_request_db_queries",
+    "Количество запросов к базе данных за HTTP-запрос",
+    ["endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+OPERATIONS = Counter(
+    "wallet_operations_total",
+    "Операции по кошелькам по типу и результату",
+    ["operation_type", "outcome"],
+)
+LOCK_WAIT = Histogram(
+    "wallet_lock_wait_seconds",
+    "Время захвата блокировки строк кошелька или корзины (с ожиданием других операций)",
+    ["lock"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+RETRIES = Counter(
+    "wallet_operation_retries_total",
+    "Повторные попытки операций после ошибки базы данных",
+)
+RETRY_BACKOFF = Counter(
+    "wallet_operation_retry_backoff_seconds_total",
+    "Время ожидания между повторными попытками операций",
+)
+
+
+def operation_outcome(error):
+    if error is None:
+        return "success"
+    if isinstance(error, ObjectDoesNotExist):
+        return "not_found"
+    if isinstance(error, WalletBusyException):
+        return "busy"
+    if isinstance(error, RestApiException):
+        return "rejected"
+    return "error"
+
+
+def record_operation(operation_type, error=None):
+    OPERATIONS.labels(operation_type, operation_outcome(error)).inc()
+
+
+class track_operation:
+    """Учет результата операции, выполняемой внутри блока with."""
+
+    def __init__(self, operation_type):
+        self.operation_type = operation_type
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record_operation(self.operation_type, exc_value)
+        return False
+
+
+@contextmanager
+def lock_wait(lock):
+    """Замер времени захвата блокировки lock внутри блока with."""
+    with LOCK_WAIT.labels(lock).time(), profiling.phase("lock"):
+        yield
+
+
+@receiver(transaction_retried)
+def _count_retry(sender, delay=0, **kwargs):
+    RETRIES.inc()
+    RETRY_BACKOFF.inc(delay)
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_response():
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
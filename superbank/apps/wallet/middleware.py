@@ -0,0 +1,250 @@
+import logging
+import math
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError
+
+from apps.wallet import metrics, profiling
+from apps.wallet.cache import balance_cache
+from apps.wallet.db import replicas
+from apps.wallet.models import SlowRequest
+
+logger = logging.getLogger("apps.wallet")
+
+
+def endpoint_name(request):
+    """Имя маршрута запроса: число рядов метрик не зависит от UUID в адресах."""
+    match = request.resolver_match
+    return match.url_name or match.view_name if match else "unmatched"
+
+
+_query_counter = ContextVar("wallet_request_queries", default=None)
+
+
+class _QueryCounter:
+    """Количество запросов к базе за HTTP-запрос."""
+
+    def __init__(self):
+        self.queries = 0
+
+
+def observe_queries(execute, sql, params, many, context):
+    """
+    Обертка выполнения запросов (execute_wrapper) для MetricsMiddleware и профилирования.
+
+    Устанавливается на каждое соединение при подключении (WalletConfig.ready), а не
+    на время запроса: под ASGI синхронный ORM работает в потоке sync_to_async со своим
+    соединением. Контекст запроса переходит в поток вместе с вызовом.
+
+    """
+    counter = _query_counter.get()
+    profile = profiling.current()
+    if counter is not None:
+        counter.queries += 1
+    if profile is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_observer(sender, connection, **kwargs):
+    if observe_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(observe_queries)
+
+
+class MetricsMiddleware:
+    """
+    Время обработки и количество запросов к базе для каждого HTTP-запроса.
+
+    Запросы асинхронных эндпоинтов через пул psycopg (apps.wallet.db.async_pool)
+    не считаются.
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = _QueryCounter()
+        token = _query_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        self.observe(request, response, time.perf_counter() - started, counter.queries)
+        return response
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        token = _query_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        self.observe(request, response, time.perf_counter() - started, counter.queries)
+        return response
+
+    def observe(self, request, response, elapsed, queries):
+        endpoint = endpoint_name(request)
+        metrics.REQUEST_LATENCY.labels(
+            endpoint, request.method, response.status_code
+        ).observe(elapsed)
+        metrics.REQUEST_QUERIES.labels(endpoint).observe(queries)
+
+
+class ReplicaPinMiddleware:
+    """
+    Чтение своих записей при чтении с реплик (apps.wallet.db.replicas).
+
+    Запрос клиента, закрепленного за основной базой (cookie или заголовок
+    X-Primary-Pinned-Until в будущем), читает только основную базу. После запроса
+    с изменяющим методом клиент закрепляется на WALLET_REPLICA_PIN_SECONDS секунд.
+    Закрепленный клиент не читает и кеш балансов в памяти процесса (apps.wallet.cache).
+    Без реплик (WALLET_DB_REPLICAS) и такого кеша не используется.
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.WALLET_DB_REPLICAS and not balance_cache.is_local:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = replicas.pin(replicas.pinned_until(request) > time.time())
+        try:
+            response = self.get_response(request)
+        finally:
+            replicas.unpin(token)
+        self.pin_client(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = replicas.pin(replicas.pinned_until(request) > time.time())
+        try:
+            response = await self.get_response(request)
+        finally:
+            replicas.unpin(token)
+        self.pin_client(request, response)
+        return response
+
+    @staticmethod
+    def pin_client(request, response):
+        if request.method in ("GET", "HEAD", "OPTIONS", "TRACE"):
+            return
+        seconds = settings.WALLET_REPLICA_PIN_SECONDS
+        until = f"{time.time() + seconds:.3f}"
+        response.set_cookie(
+            replicas.PIN_COOKIE, until, max_age=math.ceil(seconds), httponly=True, samesite="Lax"
+        )
+        response[replicas.PIN_HEADER] = until
+
+
+class ProfilingMiddleware:
+    """
+    Заголовок Server-Timing и сохранение медленных запросов (apps.wallet.profiling).
+
+    Включается настройкой WALLET_PROFILING. Под cProfile выполняются только
+    синхронные запросы: в цикле событий профиль смешал бы разные запросы.
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.WALLET_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        profile = profiling.RequestProfile()
+        token = profiling.activate(profile)
+        if random.random() < settings.WALLET_PROFILING_CPROFILE_RATE:
+            profile.start_profiler()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop_profiler()
+            profiling.deactivate(token)
+
+        total = profile.elapsed()
+        if self.is_sampled(total):
+            self.save(request, response, profile, total)
+        response["Server-Timing"] = profile.server_timing(total)
+        return response
+
+    async def __acall__(self, request):
+        profile = profiling.RequestProfile()
+        token = profiling.activate(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling.deactivate(token)
+
+        total = profile.elapsed()
+        if self.is_sampled(total):
+            await sync_to_async(self.save)(request, response, profile, total)
+        response["Server-Timing"] = profile.server_timing(total)
+        return response
+
+    def process_template_response(self, request, response):
+        # Ответы DRF отрисовываются после представления, вне блока phase.
+        profile = profiling.current()
+        if profile is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: profile.add("render", time.perf_counter() - started)
+            )
+        return response
+
+    @staticmethod
+    def is_sampled(total):
+        return (
+            total >= settings.WALLET_PROFILING_SLOW_THRESHOLD
+            and random.random() < settings.WALLET_PROFILING_SAMPLE_RATE
+        )
+
+    def save(self, request, response, profile, total):
+        try:
+            SlowRequest.record(
+                request.method,
+                request.get_full_path(),
+                endpoint_name(request),
+                response.status_code,
+                total,
+                profile,
+            )
+        except DatabaseError:
+            logger.exception("Не удалось сохранить медленный запрос")
@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-16 22:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0002_wallet_balance_non_negative'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='bucket_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Количество корзин баланса'),
+        ),
+        migrations.CreateModel(
+            name='WalletBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField(verbose_name='Номер корзины')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения баланса')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='wallet.wallet', verbose_name='Кошелек')),
+            ],
+            options={
+                'verbose_name': 'Корзина баланса',
+                'verbose_name_plural': 'Корзины баланса',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='walletbucket',
+            constraint=models.UniqueConstraint(fields=('wallet', 'index'), name='wallet_bucket_unique_index'),
+        ),
+        migrations.AddConstraint(
+            model_name='walletbucket',
+            constraint=models.CheckConstraint(check=models.Q(('balance__gte', 0)), name='wallet_bucket_balance_non_negative'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-16 22:57
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0003_wallet_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Ключ')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='Хеш запроса')),
+                ('response_status', models.PositiveSmallIntegerField(null=True, verbose_name='Статус ответа')),
+                ('response_body', models.JSONField(null=True, verbose_name='Тело ответа')),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Ключ идемпотентности',
+                'verbose_name_plural': 'Ключи идемпотентности',
+            },
+        ),
+        # Поле добавляется без default: иначе всем существующим транзакциям
+        # достался бы один и тот же UUID. Старые транзакции остаются без UUID.
+        migrations.AddField(
+            model_name='transaction',
+            name='uuid',
+            field=models.UUIDField(editable=False, null=True, verbose_name='UUID транзакции'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, null=True, verbose_name='UUID транзакции'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-16 22:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0004_transaction_uuid_idempotency_keys'),
+    ]
+
+    operations = [
+        # Индекс по кошельку удаляется после создания составного индекса,
+        # который его заменяет.
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', 'date_created', 'id'], include=('operation_type', 'amount', 'uuid'), name='wallet_txn_history_idx'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='wallet',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='wallet.wallet', verbose_name='Кошелек'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-16 23:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0005_transaction_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField(verbose_name='Дата последней учтенной транзакции')),
+                ('transaction_id', models.BigIntegerField(verbose_name='ID последней учтенной транзакции')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Баланс')),
+                ('wallet', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='wallet.wallet', verbose_name='Кошелек')),
+            ],
+            options={
+                'verbose_name': 'Контрольная точка баланса',
+                'verbose_name_plural': 'Контрольные точки баланса',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='balancecheckpoint',
+            index=models.Index(fields=['wallet', 'as_of', 'transaction_id'], name='wallet_checkpoint_idx'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+"""
+Секционирование таблицы транзакций по месяцам (только PostgreSQL).
+
+Существующие строки не переписываются: старая таблица становится партицией
+wallet_transaction_legacy с диапазоном до начала месяца после следующего, дальше
+идут помесячные партиции. Чтобы присоединение не сканировало таблицу и не строило
+индексы под блокировкой, уникальный индекс (id, date_created) и ограничение на
+date_created строятся и проверяются заранее, без блокировки записи.
+
+"""
+
+from django.db import migrations, transaction
+from django.utils import timezone
+
+from apps.wallet.db import partitions
+
+PARTITIONS_AHEAD = 3
+
+
+def partition_transactions(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql" or partitions.is_partitioned(connection):
+        return
+
+    boundary = partitions.add_months(partitions.month_start(timezone.now()), 2)
+    table = partitions.TABLE
+    legacy = partitions.LEGACY_PARTITION
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {table}_id_date_uniq "
+            f"ON {table} (id, date_created)"
+        )
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_legacy_range "
+            f"CHECK (date_created < {partitions.bound(boundary)}) NOT VALID"
+        )
+        cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_legacy_range")
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_id_date_uniq "
+            f"UNIQUE USING INDEX {table}_id_date_uniq"
+        )
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        cursor.execute(f"ALTER INDEX wallet_txn_history_idx RENAME TO {legacy}_history_idx")
+        cursor.execute(f"ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY")
+        cursor.execute(
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (date_created)"
+        )
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_part_pkey PRIMARY KEY (id, date_created)"
+        )
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_wallet_id_fk "
+            f"FOREIGN KEY (wallet_id) REFERENCES wallet_wallet (uuid) "
+            f"DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(
+            f"CREATE INDEX wallet_txn_history_idx ON {table} (wallet_id, date_created, id) "
+            f"INCLUDE (operation_type, amount, uuid)"
+        )
+        cursor.execute(f"CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        cursor.execute(
+            f"SELECT setval('{table}_id_seq', COALESCE(max(id), 0) + 1, false) FROM {legacy}"
+        )
+        cursor.execute(
+            f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')"
+        )
+        cursor.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ({partitions.bound(boundary)})"
+        )
+        cursor.execute(f"ALTER TABLE {legacy} DROP CONSTRAINT {table}_legacy_range")
+        cursor.execute(
+            f"CREATE TABLE {partitions.DEFAULT_PARTITION} PARTITION OF {table} DEFAULT"
+        )
+        partitions.create_partitions(
+            connection, partitions.add_months(boundary, PARTITIONS_AHEAD), start=boundary
+        )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('wallet', '0006_balance_checkpoints'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_transactions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-16 23:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0007_partition_transactions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('path', models.CharField(max_length=2048, verbose_name='Адрес')),
+                ('endpoint', models.CharField(max_length=255, verbose_name='Эндпоинт')),
+                ('status', models.PositiveSmallIntegerField(verbose_name='Статус ответа')),
+                ('duration', models.FloatField(db_index=True, verbose_name='Время, мс')),
+                ('timings', models.JSONField(verbose_name='Время этапов, мс')),
+                ('query_count', models.PositiveIntegerField(verbose_name='Запросов к базе')),
+                ('queries', models.JSONField(verbose_name='Запросы к базе')),
+                ('profile', models.TextField(blank=True, verbose_name='Профиль cProfile')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ['-duration'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-16 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0008_slow_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='transfer_uuid',
+            field=models.UUIDField(blank=True, editable=False, null=True, verbose_name='UUID перевода'),
+        ),
+    ]
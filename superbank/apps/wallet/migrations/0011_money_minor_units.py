@@ -0,0 +1,139 @@
+"""
+Суммы в минимальных единицах валюты (apps.wallet.money).
+
+Балансы и суммы транзакций переводятся из numeric(12, 2) в bigint: значение
+умножается на 10 ** число знаков валюты DEFAULT_CURRENCY. В PostgreSQL столбец
+меняет тип одним ALTER TABLE ... USING (для секционированной таблицы транзакций —
+вместе с партициями), SQLite пересоздает таблицу.
+
+Миграция требует остановки сервиса. ALTER COLUMN ... TYPE переписывает таблицы
+кошельков, корзин, контрольных точок и все присоединенные партиции транзакций
+и перестраивает их индексы, в том числе wallet_txn_history_idx (сумма входит
+в INCLUDE). Все это время таблицы заблокированы ACCESS EXCLUSIVE: чтения и записи
+ждут, а время пропорционально размеру таблицы транзакций. Воркеры останавливаются
+на время миграции; если другой сеанс держит блокировку дольше LOCK_TIMEOUT,
+миграция отменяется, а не ставит все запросы в очередь за собой. Отсоединенные
+партиции (detach_transaction_partitions) не переводятся: перед обратным
+присоединением их суммы нужно перевести тем же ALTER TABLE.
+
+"""
+
+from django.db import migrations, models
+from django.db.migrations.exceptions import IrreversibleError
+
+from apps.wallet import money
+
+# Ожидание блокировок таблиц в PostgreSQL.
+LOCK_TIMEOUT = "10s"
+
+# (модель, поле, verbose_name)
+FIELDS = [
+    ("wallet", "balance", None),
+    ("walletbucket", "balance", None),
+    ("transaction", "amount", "Сумма транзакции"),
+    ("balancecheckpoint", "balance", "Баланс"),
+]
+
+
+def decimal_field(verbose_name):
+    return models.DecimalField(verbose_name, max_digits=12, decimal_places=2)
+
+
+def money_field(verbose_name):
+    return money.MoneyField(verbose_name)
+
+
+def alter_columns(apps, schema_editor, forward):
+    connection = schema_editor.connection
+    qn = schema_editor.quote_name
+    exponent = money.get_exponent()
+    scale = 10 ** exponent
+    if connection.vendor == "postgresql":
+        schema_editor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+    for model_name, name, verbose_name in FIELDS:
+        model = apps.get_model("wallet", model_name)
+        table = qn(model._meta.db_table)
+        column = qn(model._meta.get_field(name).column)
+        if connection.vendor == "postgresql":
+            using = (
+                f"TYPE bigint USING round({column} * {scale})::bigint"
+                if forward
+                else f"TYPE numeric(12, 2) USING {column}::numeric / {scale}"
+            )
+            schema_editor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} {using}")
+            continue
+
+        if not forward:
+            # PostgreSQL сам откажет на переполнении numeric(12, 2), SQLite — нет.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT count(*) FROM {table} WHERE abs({column}) >= {10 ** 10 * scale}"
+                )
+                if cursor.fetchone()[0]:
+                    raise IrreversibleError(
+                        f"{model._meta.db_table}.{name}: суммы не помещаются в numeric(12, 2)"
+                    )
+
+        old, new = decimal_field(verbose_name), money_field(verbose_name)
+        if not forward:
+            old, new = new, old
+        for field in (old, new):
+            field.set_attributes_from_name(name)
+            field.model = model
+        if forward:
+            schema_editor.execute(f"UPDATE {table} SET {column} = ROUND({column} * {scale})")
+        schema_editor.alter_field(model, old, new)
+        if not forward and exponent:
+            # Сумма собирается текстом из частного и остатка целых, как ее
+            # записывает DecimalField: деление через REAL дает лишние знаки.
+            schema_editor.execute(
+                f"UPDATE {table} SET {column} = "
+                f"CASE WHEN {column} < 0 THEN '-' ELSE '' END "
+                f"|| (abs({column}) / {scale}) || '.' "
+                f"|| printf('%0{exponent}d', abs({column}) % {scale})"
+            )
+
+
+def to_minor_units(apps, schema_editor):
+    alter_columns(apps, schema_editor, forward=True)
+
+
+def to_decimal(apps, schema_editor):
+    alter_columns(apps, schema_editor, forward=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0010_api_keys"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="wallet",
+                    name="balance",
+                    field=money.MoneyField(default=0),
+                ),
+                migrations.AlterField(
+                    model_name="walletbucket",
+                    name="balance",
+                    field=money.MoneyField(default=0),
+                ),
+                migrations.AlterField(
+                    model_name="transaction",
+                    name="amount",
+                    field=money.MoneyField(verbose_name="Сумма транзакции"),
+                ),
+                migrations.AlterField(
+                    model_name="balancecheckpoint",
+                    name="balance",
+                    field=money.MoneyField(verbose_name="Баланс"),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(to_minor_units, to_decimal),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-16 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0011_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardSlot',
+            fields=[
+                ('slot', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='Слот')),
+                ('database', models.CharField(max_length=100, verbose_name='Шард')),
+                ('is_moving', models.BooleanField(default=False, verbose_name='Переносится')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Слот шардирования',
+                'verbose_name_plural': 'Слоты шардирования',
+                'ordering': ['slot'],
+            },
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='wallet_uuid',
+            field=models.UUIDField(db_index=True, editable=False, null=True, verbose_name='UUID кошелька'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+"""
+Уникальность UUID транзакции: повторная загрузка реестра (import_ledger) пропускает
+уже загруженные транзакции.
+
+Уникальный индекс секционированной таблицы должен включать ключ секционирования,
+поэтому он строится по (uuid, date_created); транзакции без UUID в него не входят.
+В PostgreSQL индекс создается на родительской таблице без партиций (ON ONLY),
+затем на каждой партиции без блокировки записи (CONCURRENTLY) и присоединяется
+к родительскому. Новые партиции получают индекс при создании.
+
+"""
+
+from django.db import migrations, models
+
+from apps.wallet.db import partitions
+
+CONSTRAINT = models.UniqueConstraint(
+    fields=["uuid", "date_created"],
+    condition=models.Q(uuid__isnull=False),
+    name="wallet_txn_uuid_uniq",
+)
+
+
+def add_index(apps, schema_editor):
+    connection = schema_editor.connection
+    model = apps.get_model("wallet", "Transaction")
+    if not partitions.is_partitioned(connection):
+        schema_editor.add_constraint(model, CONSTRAINT)
+        return
+
+    table = partitions.TABLE
+    columns = "(uuid, date_created) WHERE uuid IS NOT NULL"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {CONSTRAINT.name} ON ONLY {table} {columns}"
+        )
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [table],
+        )
+        for (partition,) in cursor.fetchall():
+            index = f"{partition}_uuid_uniq"
+            cursor.execute(
+                f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {partition} {columns}"
+            )
+            cursor.execute(f"ALTER INDEX {CONSTRAINT.name} ATTACH PARTITION {index}")
+
+
+def remove_index(apps, schema_editor):
+    schema_editor.remove_constraint(apps.get_model("wallet", "Transaction"), CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("wallet", "0012_wallet_shards"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(model_name="transaction", constraint=CONSTRAINT),
+            ],
+            database_operations=[
+                migrations.RunPython(add_index, remove_index),
+            ],
+        ),
+    ]
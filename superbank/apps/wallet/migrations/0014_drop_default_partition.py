@@ -0,0 +1,66 @@
+"""
+Удаление партиции транзакций по умолчанию (только PostgreSQL).
+
+PostgreSQL не отсоединяет партиции с CONCURRENTLY, пока у таблицы есть партиция
+по умолчанию, поэтому detach_transaction_partitions брал ACCESS EXCLUSIVE на всю
+таблицу транзакций. Без нее вставка транзакции за пределами созданных месяцев
+завершается ошибкой: create_transaction_partitions должен создавать партиции
+заранее (WALLET_TRANSACTION_PARTITIONS_AHEAD месяцев).
+
+Строки, уже попавшие в партицию по умолчанию, переносятся в помесячные партиции.
+
+"""
+
+from django.db import migrations
+
+from apps.wallet.db import partitions
+
+
+def drop_default_partition(apps, schema_editor):
+    connection = schema_editor.connection
+    if not partitions.is_partitioned(connection):
+        return
+    if not partitions.has_default_partition(connection):
+        return
+
+    default = partitions.DEFAULT_PARTITION
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT max(date_created) FROM {default}")
+        latest = cursor.fetchone()[0]
+    if latest is not None:
+        partitions.create_partitions(
+            connection, partitions.add_months(partitions.month_start(latest), 1)
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {partitions.TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"SELECT count(*) FROM {default}")
+        count = cursor.fetchone()[0]
+        if count:
+            raise RuntimeError(
+                f"В партиции {default} остались транзакции ({count}) вне помесячных "
+                f"партиций; перенесите их вручную и повторите миграцию."
+            )
+        cursor.execute(f"DROP TABLE {default}")
+
+
+def create_default_partition(apps, schema_editor):
+    connection = schema_editor.connection
+    if not partitions.is_partitioned(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {partitions.DEFAULT_PARTITION} "
+            f"PARTITION OF {partitions.TABLE} DEFAULT"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0013_transaction_uuid_unique"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_default_partition, create_default_partition),
+    ]
@@ -1,18 +1,119 @@
+import asyncio
+import hashlib
 import logging
 import random
+import secrets
+import threading
 import time
 import uuid
+from collections import OrderedDict
+from datetime import timedelta
 from decimal import Decimal as D
 
-from django.db import models, transaction
-from django.db.models import F
-from django.db.utils import DatabaseError, OperationalError
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models, router, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.expressions import Col, CombinedExpression
+from django.db.utils import DatabaseError, IntegrityError, OperationalError
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare, get_random_string, salted_hmac
 
-from apps.wallet.api.exceptions import InvalidAmountException, InvalidTypeException
+from apps.wallet import contention, metrics, money
+from apps.wallet.api.exceptions import (
+    IdempotencyKeyMismatch,
+    InvalidAmountException,
+    InvalidTransferException,
+    InvalidTypeException,
+    RestApiException,
+)
+from apps.wallet.cache import balance_cache
+from apps.wallet.coalescer import coalescer
+from apps.wallet.db import async_pool, shards
+from apps.wallet.signals import transaction_retried
 
 logger = logging.getLogger("apps.wallet")
 
+# Сколько кошельков блокировать и сколько транзакций создавать одним запросом
+# при проведении пакета операций.
+BATCH_LOCK_CHUNK_SIZE = 1000
+
+# Точность сумм: минимальная единица валюты реестра (apps.wallet.money).
+BALANCE_QUANTUM = money.get_quantum()
+
+# Тип выражений с суммой в минимальных единицах: значение уходит в базу без перевода.
+MINOR_UNITS_FIELD = models.BigIntegerField()
+
+
+# Известное процессу количество корзин баланса кошельков в режиме корзин.
+# Позволяет не читать кошелек перед операцией; устаревшее значение исправляется
+# при первой неудачной попытке операции. Хранится не больше
+# WALLET_BUCKET_COUNT_HINTS_SIZE кошельков.
+_bucket_count_hints = OrderedDict()
+_bucket_count_hints_lock = threading.Lock()
+
+
+def _get_bucket_count_hint(wallet_uuid):
+    with _bucket_count_hints_lock:
+        count = _bucket_count_hints.get(wallet_uuid)
+        if count is None:
+            return 0
+        _bucket_count_hints.move_to_end(wallet_uuid)
+        return count
+
+
+def _retry_delay(attempt):
+    """
+    Интервал до следующей попытки проведения транзакции.
+
+    Повторяются только ошибки сериализации и взаимоблокировки: чужая транзакция
+    уже завершилась, и долго ждать не нужно.
+    """
+    return min(0.01 * (2**attempt) + random.uniform(0, 0.01), 0.1)
+
+
+def _add_minor_units(expression):
+    """Баланс строки плюс изменение expression в минимальных единицах валюты."""
+    return CombinedExpression(
+        F("balance"), CombinedExpression.ADD, expression, output_field=MINOR_UNITS_FIELD
+    )
+
+
+def _invalidate_cached_balances(wallet_uuids, using):
+    """Сброс балансов кошельков из кеша после фиксации текущей транзакции БД."""
+    wallet_uuids = list(wallet_uuids)
+    transaction.on_commit(lambda: balance_cache.delete_many(wallet_uuids), using=using)
+
+
+def _from_db_value(model, field_name, value, connection):
+    """Приведение значения из RETURNING к python-типу так же, как это делает ORM."""
+    expression = Col(model._meta.db_table, model._meta.get_field(field_name))
+    converters = connection.ops.get_db_converters(
+        expression
+    ) + expression.get_db_converters(connection)
+    for converter in converters:
+        value = converter(value, expression, connection)
+    return value
+
+
+class WalletRowQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        # Без явной базы объект выбирает маршрутизатор по самому объекту:
+        # так новый кошелек и его строки сохраняются в шард кошелька.
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class WalletRowManager(models.Manager.from_queryset(WalletRowQuerySet)):
+    """Менеджер моделей, строки которых хранятся в шарде кошелька (apps.wallet.db.shards)."""
+
+    def for_wallet(self, wallet_uuid):
+        """Менеджер, запросы которого идут в шард кошелька wallet_uuid."""
+        return self.db_manager(hints={"wallet_uuid": wallet_uuid})
+
 
 class Wallet(models.Model):
     """
@@ -21,19 +122,24 @@ class Wallet(models.Model):
     Содержит информацию о балансе и имеет уникальный идентификатор страндарта uuid.
     Хранит информацию о времи созданя и о времени изменения баланса.
 
-    Функционал полей: owner, last_transaction_uuid не реализован, так как информация о пользователе и
-    уникальный код транзакции не содержится в теле запроса, но хорошо было бы это реальзовать.
+    Баланс самых нагруженных кошельков можно хранить в нескольких корзинах (WalletBucket),
+    тогда баланс кошелька — это сумма поля balance и балансов всех корзин (get_balance).
+
+    Функционал поля owner не реализован, так как информация о пользователе
+    не содержится в теле запроса, но хорошо было бы это реальзовать.
 
     """
 
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    balance = models.DecimalField(
-        blank=False, default=0, max_digits=12, decimal_places=2
-    )
+    balance = money.MoneyField(blank=False, default=0)
 
     date_created = models.DateTimeField("Дата создания", auto_now_add=True)
     date_updated = models.DateTimeField("Дата изменения баланса", auto_now=True)
 
+    bucket_count = models.PositiveSmallIntegerField(
+        "Количество корзин баланса", default=0, editable=False
+    )
+
     # owner = models.ForeignKey(
     #     "auth.User",
     #     blank=True,
@@ -41,13 +147,23 @@ class Wallet(models.Model):
     #     on_delete=models.CASCADE,
     #     verbose_name="Владелец кошелька",
     # )
-    # last_transaction_uuid = models.UUIDField("UUID последней транзакции", blank=True)
     # currency = models.CharField("Валюта", max_length=12, default=get_default_currency)
 
+    objects = WalletRowManager()
+
+    # UUID последней транзакции, проведенной через этот объект. В базе не хранится:
+    # запись в строку кошелька при каждой операции удлинила бы горячий UPDATE.
+    last_transaction_uuid = None
+
     class Meta:
         app_label = "wallet"
         verbose_name = "Кошелек"
         verbose_name_plural = "Кошельки"
+        constraints = [
+            models.CheckConstraint(
+                check=Q(balance__gte=0), name="wallet_balance_non_negative"
+            ),
+        ]
 
     def __str__(self):
         return "Кошелек (uuid: {uuid}, Баланс {balance}".format(
@@ -63,6 +179,13 @@ class Wallet(models.Model):
         else:
             raise InvalidTypeException("Неверный тип транзакции")
 
+    async def atransaction(self, amount, tnx_type):
+        """Асинхронная обработка транзакции с проверкой типа."""
+        if tnx_type not in (Transaction.DEPOSIT, Transaction.WITHDRAW):
+            raise InvalidTypeException("Неверный тип транзакции")
+        with metrics.track_operation(tnx_type):
+            await self._acreate_transaction(amount=amount, txn_type=tnx_type)
+
     def deposit(self, amount):
         """
         Операция по внесению средст на данный кошелек.
@@ -71,7 +194,8 @@ class Wallet(models.Model):
         создает транзацию и увеличивает баланс.
 
         """
-        self._create_transaction(amount=amount, txn_type=Transaction.DEPOSIT)
+        with metrics.track_operation(Transaction.DEPOSIT):
+            self._create_transaction(amount=amount, txn_type=Transaction.DEPOSIT)
 
     deposit.alters_data = True
 
@@ -83,11 +207,667 @@ class Wallet(models.Model):
         создает транзацию снятия наличных и уменьшает баланс.
 
         """
-        self._create_transaction(amount=amount, txn_type=Transaction.WITHDRAW)
+        with metrics.track_operation(Transaction.WITHDRAW):
+            self._create_transaction(amount=amount, txn_type=Transaction.WITHDRAW)
 
     withdraw.alters_data = True
 
-    def _create_transaction(self, amount, txn_type, retries=10):
+    def transfer(self, target_uuid, amount):
+        """
+        Перевод средств с данного кошелька на кошелек target_uuid.
+
+        Снятие и внесение проводятся в одной транзакции БД и связаны общим
+        transfer_uuid. Оба кошелька блокируются одним запросом в порядке uuid, как
+        и при проведении пакета операций, поэтому встречные переводы между одной
+        парой кошельков не приводят к взаимной блокировке. Кроме блокировки,
+        перевод — это один INSERT двух транзакций и один UPDATE обоих балансов.
+
+        Возвращает транзакции снятия и внесения; баланс объекта обновляется.
+
+        """
+        with metrics.track_operation(Transaction.TRANSFER):
+            self._validate_amount(amount, Transaction.WITHDRAW)
+            if self.pk == target_uuid:
+                raise InvalidTransferException("Нельзя перевести средства на тот же кошелек")
+
+            using = router.db_for_write(self.__class__, instance=self)
+            if router.db_for_write(self.__class__, wallet_uuid=target_uuid) != using:
+                raise InvalidTransferException(
+                    "Перевод между кошельками разных шардов не поддерживается"
+                )
+            attempts = settings.WALLET_SERIALIZATION_RETRIES + 1
+            with contention.wallet_queue(self.pk), contention.wallet_queue(target_uuid):
+                for attempt in range(attempts):
+                    try:
+                        with transaction.atomic(using=using):
+                            contention.set_lock_timeout(using)
+                            return self._transfer_locked(target_uuid, amount, using)
+                    except DatabaseError as e:
+                        self._handle_database_error(e, attempt, attempts)
+                        delay = _retry_delay(attempt)
+                        transaction_retried.send(
+                            sender=self.__class__,
+                            wallet_uuid=self.pk,
+                            attempt=attempt,
+                            error=e,
+                            delay=delay,
+                        )
+                        time.sleep(delay)
+
+    transfer.alters_data = True
+
+    def _transfer_locked(self, target_uuid, amount, using):
+        cls = self.__class__
+        now = timezone.now()
+        locked = cls.objects.using(using).filter(pk__in=[self.pk, target_uuid])
+        with metrics.lock_wait("transfer"):
+            if not connections[using].features.has_select_for_update:
+                # SQLite блокирует базу целиком, и транзакция, начатая с чтения, не получит
+                # блокировку записи, пока ее держит другая. Блокировку берет UPDATE.
+                locked.update(date_updated=now)
+            wallets = {
+                wallet.pk: wallet for wallet in locked.select_for_update().order_by("pk")
+            }
+            if len(wallets) < 2:
+                raise cls.DoesNotExist("Кошелек не найден")
+            source, target = wallets[self.pk], wallets[target_uuid]
+
+            # Корзины блокируются после кошельков, в том же порядке, что и в пакете операций.
+            buckets = {}
+            if source.bucket_count or target.bucket_count:
+                for bucket in (
+                    WalletBucket.objects.using(using)
+                    .select_for_update()
+                    .filter(wallet_id__in=[self.pk, target_uuid])
+                    .order_by("wallet_id", "index")
+                ):
+                    buckets.setdefault(bucket.wallet_id, []).append(bucket)
+        # Суммы считаются в минимальных единицах валюты (apps.wallet.money).
+        units = money.to_minor(amount)
+        amount = money.from_minor(units)
+        balances = {
+            wallet.pk: money.to_minor(wallet.balance)
+            + sum(money.to_minor(bucket.balance) for bucket in buckets.get(wallet.pk, []))
+            for wallet in (source, target)
+        }
+        if balances[source.pk] < units:
+            source._validate_balance_for_withdraw(
+                amount, balance=money.from_minor(balances[source.pk])
+            )
+
+        transfer_uuid = uuid.uuid4()
+        transactions = Transaction.objects.using(using).bulk_create(
+            [
+                Transaction(
+                    wallet=source,
+                    amount=amount,
+                    operation_type=Transaction.WITHDRAW,
+                    transfer_uuid=transfer_uuid,
+                ),
+                Transaction(
+                    wallet=target,
+                    amount=amount,
+                    operation_type=Transaction.DEPOSIT,
+                    transfer_uuid=transfer_uuid,
+                ),
+            ]
+        )
+
+        balances[source.pk] -= units
+        balances[target.pk] += units
+        changes = {}
+        for wallet, units_to_change in ((source, -units), (target, units)):
+            if wallet.pk in buckets:
+                wallet._spread_balance(balances[wallet.pk], buckets[wallet.pk], using=using)
+            else:
+                wallet.balance = money.from_minor(balances[wallet.pk])
+                changes[wallet.pk] = units_to_change
+        if changes:
+            cls.objects.using(using).filter(pk__in=changes).update(
+                balance=_add_minor_units(
+                    Case(
+                        *[
+                            When(pk=pk, then=Value(change, output_field=MINOR_UNITS_FIELD))
+                            for pk, change in changes.items()
+                        ],
+                        output_field=MINOR_UNITS_FIELD,
+                    )
+                ),
+                date_updated=now,
+            )
+            _invalidate_cached_balances(changes, using)
+
+        self.balance = source.balance
+        self.bucket_count = source.bucket_count
+        self.date_updated = source.date_updated if source.pk in buckets else now
+        self.last_transaction_uuid = transactions[0].uuid
+        return transactions
+
+    def get_balance(self, using=None):
+        """
+        Баланс кошелька с учетом корзин.
+
+        В режиме корзин баланс кошелька и сумма его корзин читаются одним запросом,
+        чтобы не задеть перераспределение баланса между ними.
+
+        """
+        if not self.bucket_count:
+            return self.balance
+
+        balance, buckets_balance = (
+            self.__class__.objects.for_wallet(self.pk)
+            .using(using or self._state.db)
+            .filter(pk=self.pk)
+            .annotate(buckets_balance=Sum("buckets__balance"))
+            .values_list("balance", "buckets_balance")
+            .get()
+        )
+        return (balance + D(buckets_balance or 0)).quantize(BALANCE_QUANTUM)
+
+    async def aget_balance(self):
+        """
+        Асинхронное чтение баланса кошелька с учетом корзин.
+
+        В PostgreSQL баланс читается одним запросом через пул асинхронных соединений
+        (apps.wallet.db.async_pool), на остальных базах — через ORM в потоке.
+        Обновляет поля объекта, если кошелек не найден — DoesNotExist.
+
+        """
+        using = router.db_for_read(self.__class__, instance=self)
+        if not async_pool.is_available(using):
+            wallet = await self.__class__.objects.using(using).aget(pk=self.pk)
+            self.balance = wallet.balance
+            self.bucket_count = wallet.bucket_count
+            self.date_updated = wallet.date_updated
+            if not self.bucket_count:
+                return self.balance
+            return await sync_to_async(self.get_balance)(using=using)
+
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        opts = self._meta
+        bucket_opts = WalletBucket._meta
+        sql = (
+            "SELECT w.{balance}, w.{bucket_count}, w.{updated}, w.{balance} + COALESCE("
+            "(SELECT SUM(b.{bucket_balance}) FROM {bucket_table} b WHERE b.{bucket_wallet} = w.{pk}), 0"
+            ") FROM {table} w WHERE w.{pk} = %s"
+        ).format(
+            balance=qn(opts.get_field("balance").column),
+            bucket_count=qn(opts.get_field("bucket_count").column),
+            updated=qn(opts.get_field("date_updated").column),
+            bucket_balance=qn(bucket_opts.get_field("balance").column),
+            bucket_table=qn(bucket_opts.db_table),
+            bucket_wallet=qn(bucket_opts.get_field("wallet").column),
+            table=qn(opts.db_table),
+            pk=qn(opts.pk.column),
+        )
+        row = await async_pool.fetchone(using, sql, [self.pk])
+        if row is None:
+            raise self.DoesNotExist("Кошелек не найден")
+
+        balance, self.bucket_count, self.date_updated, total = row
+        self.balance = money.from_minor(balance)
+        return money.from_minor(total)
+
+    @classmethod
+    def get_cached_balance(cls, wallet_uuid):
+        """
+        Баланс кошелька и время его изменения через кеш балансов (apps.wallet.cache).
+
+        Значение, которое попадет в кеш, читается из основной базы: кеш сбрасывается
+        при фиксации изменения, и баланс с отстающей реплики остался бы в нем после
+        сброса. Без кеша баланс может читаться с реплики (apps.wallet.db.replicas).
+        Если кошелек не найден — DoesNotExist.
+
+        """
+        using = router.db_for_read(
+            cls, wallet_uuid=wallet_uuid, primary=balance_cache.cache is not None
+        )
+
+        def load():
+            wallet = cls.objects.using(using).get(pk=wallet_uuid)
+            return wallet.get_balance(), wallet.date_updated
+
+        return balance_cache.get(wallet_uuid, load)
+
+    def get_ledger_balance(self, as_of=None, using=None):
+        """
+        Баланс кошелька по его транзакциям на момент as_of (по умолчанию — по всем).
+
+        Суммируются только транзакции после ближайшей контрольной точки баланса
+        (BalanceCheckpoint), а не вся история кошелька.
+
+        """
+        checkpoint = self._get_checkpoint(as_of, using)
+        totals = self._transactions_after(checkpoint, as_of, using).aggregate(
+            deposits=Sum("amount", filter=Q(operation_type=Transaction.DEPOSIT)),
+            withdraws=Sum("amount", filter=Q(operation_type=Transaction.WITHDRAW)),
+        )
+        balance = checkpoint.balance if checkpoint is not None else D(0)
+        balance += D(totals["deposits"] or 0) - D(totals["withdraws"] or 0)
+        return balance.quantize(BALANCE_QUANTUM)
+
+    def create_balance_checkpoint(self, min_transactions, as_of=None, using=None):
+        """
+        Контрольная точка баланса по транзакциям после предыдущей точки.
+
+        Точка создается, если таких транзакций не меньше min_transactions, и учитывает
+        только транзакции не новее as_of — по умолчанию старше WALLET_CHECKPOINT_LAG
+        секунд: более новые могут быть еще не зафиксированы. Кошелек блокируется, чтобы
+        изменение старых транзакций в админ-панели не пересеклось с подсчетом.
+        Возвращает точку или None.
+
+        """
+        shards.check_writable(self.pk)
+        using = using or router.db_for_write(self.__class__, instance=self)
+        if as_of is None:
+            as_of = timezone.now() - timedelta(seconds=settings.WALLET_CHECKPOINT_LAG)
+        with transaction.atomic(using=using):
+            locked = (
+                self.__class__.objects.using(using)
+                .select_for_update()
+                .filter(pk=self.pk)
+                .values_list("pk", flat=True)
+            )
+            if not list(locked):
+                return None
+
+            checkpoint = self._get_checkpoint(as_of, using)
+            transactions = self._transactions_after(checkpoint, as_of, using)
+            totals = transactions.aggregate(
+                count=Count("pk"),
+                deposits=Sum("amount", filter=Q(operation_type=Transaction.DEPOSIT)),
+                withdraws=Sum("amount", filter=Q(operation_type=Transaction.WITHDRAW)),
+            )
+            if not totals["count"] or totals["count"] < min_transactions:
+                return None
+
+            last_date_created, last_pk = (
+                transactions.order_by("-date_created", "-pk")
+                .values_list("date_created", "pk")
+                .first()
+            )
+            balance = checkpoint.balance if checkpoint is not None else D(0)
+            balance += D(totals["deposits"] or 0) - D(totals["withdraws"] or 0)
+            return BalanceCheckpoint.objects.using(using).create(
+                wallet_id=self.pk,
+                as_of=last_date_created,
+                transaction_id=last_pk,
+                balance=balance.quantize(BALANCE_QUANTUM),
+            )
+
+    create_balance_checkpoint.alters_data = True
+
+    def _get_checkpoint(self, as_of=None, using=None):
+        """Последняя контрольная точка баланса не позже as_of."""
+        checkpoints = (
+            BalanceCheckpoint.objects.for_wallet(self.pk).using(using).filter(wallet_id=self.pk)
+        )
+        if as_of is not None:
+            checkpoints = checkpoints.filter(as_of__lte=as_of)
+        return checkpoints.order_by("-as_of", "-transaction_id").first()
+
+    def _transactions_after(self, checkpoint, as_of=None, using=None):
+        """Транзакции кошелька после контрольной точки и не позже as_of."""
+        transactions = Transaction.objects.for_wallet(self.pk).using(using).filter(
+            wallet_id=self.pk
+        )
+        if as_of is not None:
+            transactions = transactions.filter(date_created__lte=as_of)
+        if checkpoint is not None:
+            # Порядок транзакций — (date_created, id), как в индексе истории.
+            transactions = transactions.filter(date_created__gte=checkpoint.as_of).filter(
+                Q(date_created__gt=checkpoint.as_of) | Q(pk__gt=checkpoint.transaction_id)
+            )
+        return transactions
+
+    @classmethod
+    def find_balance_mismatches(cls, start=None, end=None, using=None):
+        """
+        Кошельки диапазона uuid [start, end), баланс которых расходится с транзакциями.
+
+        Баланс по транзакциям считается, как в get_ledger_balance: последняя контрольная
+        точка плюс транзакции после нее. Весь диапазон проверяется одним запросом
+        с группировкой, а не запросом на кошелек. Возвращает список
+        (uuid, баланс кошелька с корзинами, баланс по транзакциям).
+
+        """
+        using = using or router.db_for_read(cls)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        pk = cls._meta.pk
+
+        def uuid_range(column):
+            conditions, params = [], []
+            if start is not None:
+                conditions.append(f"{column} >= %s")
+                params.append(pk.get_db_prep_value(start, connection))
+            if end is not None:
+                conditions.append(f"{column} < %s")
+                params.append(pk.get_db_prep_value(end, connection))
+            return " AND ".join(conditions or ["1 = 1"]), params
+
+        checkpoint_range, range_params = uuid_range("wallet_id")
+        transaction_range, _ = uuid_range("t.wallet_id")
+        wallet_range, _ = uuid_range("w.uuid")
+        sql = f"""
+            WITH ranked AS (
+                SELECT wallet_id, as_of, transaction_id, balance, ROW_NUMBER() OVER (
+                    PARTITION BY wallet_id ORDER BY as_of DESC, transaction_id DESC
+                ) AS position
+                FROM {qn(BalanceCheckpoint._meta.db_table)}
+                WHERE {checkpoint_range}
+            ),
+            checkpoint AS (
+                SELECT wallet_id, as_of, transaction_id, balance FROM ranked WHERE position = 1
+            ),
+            ledger AS (
+                SELECT t.wallet_id, SUM(
+                    CASE WHEN t.operation_type = %s THEN t.amount ELSE -t.amount END
+                ) AS amount
+                FROM {qn(Transaction._meta.db_table)} t
+                LEFT JOIN checkpoint c ON c.wallet_id = t.wallet_id
+                WHERE {transaction_range}
+                    AND (c.wallet_id IS NULL OR t.date_created > c.as_of
+                        OR (t.date_created = c.as_of AND t.id > c.transaction_id))
+                GROUP BY t.wallet_id
+            ),
+            buckets AS (
+                SELECT wallet_id, SUM(balance) AS balance
+                FROM {qn(WalletBucket._meta.db_table)}
+                WHERE {checkpoint_range}
+                GROUP BY wallet_id
+            )
+            SELECT w.uuid, w.balance + COALESCE(b.balance, 0),
+                COALESCE(c.balance, 0) + COALESCE(l.amount, 0)
+            FROM {qn(cls._meta.db_table)} w
+            LEFT JOIN checkpoint c ON c.wallet_id = w.uuid
+            LEFT JOIN ledger l ON l.wallet_id = w.uuid
+            LEFT JOIN buckets b ON b.wallet_id = w.uuid
+            WHERE {wallet_range}
+                AND w.balance + COALESCE(b.balance, 0)
+                    <> COALESCE(c.balance, 0) + COALESCE(l.amount, 0)
+        """
+        params = range_params + [Transaction.DEPOSIT] + range_params * 3
+
+        mismatches = []
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for wallet_uuid, balance, ledger_balance in cursor.fetchall():
+                mismatches.append(
+                    (
+                        pk.to_python(wallet_uuid),
+                        money.from_minor(balance),
+                        money.from_minor(ledger_balance),
+                    )
+                )
+        return mismatches
+
+    @classmethod
+    def recompute_balances(cls, wallet_uuids, using=None):
+        """
+        Пересчет балансов кошельков по их транзакциям, как в админ-панели.
+
+        Кошельки блокируются в порядке uuid, в режиме корзин баланс распределяется
+        по корзинам. Без using кошельки пересчитываются в своих шардах. Возвращает
+        пересчитанные кошельки.
+
+        """
+        if using is None:
+            groups = {}
+            for wallet_uuid in wallet_uuids:
+                using = router.db_for_write(cls, wallet_uuid=wallet_uuid)
+                groups.setdefault(using, []).append(wallet_uuid)
+            return [
+                wallet
+                for using, group in groups.items()
+                for wallet in cls.recompute_balances(group, using=using)
+            ]
+
+        for wallet_uuid in wallet_uuids:
+            shards.check_writable(wallet_uuid)
+        with transaction.atomic(using=using):
+            wallets = list(
+                cls.objects.using(using)
+                .select_for_update()
+                .filter(pk__in=wallet_uuids)
+                .order_by("pk")
+                .only("bucket_count")
+            )
+            for wallet in wallets:
+                buckets = wallet._lock_buckets(using) if wallet.bucket_count else []
+                wallet._spread_balance(
+                    money.to_minor(wallet.get_ledger_balance(using=using)), buckets, using=using
+                )
+        return wallets
+
+    recompute_balances.alters_data = True
+
+    def set_bucket_count(self, count, using=None):
+        """
+        Включение, изменение количества или выключение (count=0) корзин баланса.
+
+        Переключение выполняется без остановки операций: кошелек и его корзины
+        блокируются, а весь баланс перераспределяется по новым корзинам.
+        Операции, выбравшие удаленную корзину, не найдут ее и будут повторены.
+
+        """
+        shards.check_writable(self.pk)
+        using = using or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using):
+            wallet = self.__class__.objects.using(using).select_for_update().get(pk=self.pk)
+            buckets = wallet._lock_buckets(using)
+            total = money.to_minor(wallet.balance) + sum(
+                money.to_minor(bucket.balance) for bucket in buckets
+            )
+
+            WalletBucket.objects.using(using).filter(
+                wallet_id=wallet.pk, index__gte=count
+            ).delete()
+            buckets = buckets[:count] + [
+                WalletBucket(wallet=wallet, index=index)
+                for index in range(len(buckets), count)
+            ]
+            wallet.bucket_count = count
+            wallet._spread_balance(total, buckets, using=using)
+
+        self.balance = wallet.balance
+        self.bucket_count = wallet.bucket_count
+        self.date_updated = wallet.date_updated
+        self._remember_bucket_count()
+
+    set_bucket_count.alters_data = True
+
+    def _remember_bucket_count(self):
+        with _bucket_count_hints_lock:
+            if not self.bucket_count:
+                _bucket_count_hints.pop(self.pk, None)
+                return
+            _bucket_count_hints[self.pk] = self.bucket_count
+            _bucket_count_hints.move_to_end(self.pk)
+            while len(_bucket_count_hints) > settings.WALLET_BUCKET_COUNT_HINTS_SIZE:
+                _bucket_count_hints.popitem(last=False)
+
+    @classmethod
+    def batch_transactions(cls, operations, using=None):
+        """
+        Проведение пакета операций по нескольким кошелькам в одной транзакции БД.
+
+        Получает список словарей {wallet_uuid, operation_type, amount} и возвращает
+        список результатов в том же порядке: {wallet_uuid, status, balance или error}.
+        При шардировании операции проводятся в одной транзакции БД каждого шарда.
+
+        """
+        if using is None:
+            applied = cls._apply_by_shard(operations)
+        else:
+            applied = cls._apply_operations(operations, using=using)
+
+        results = []
+        for operation, result in zip(operations, applied):
+            wallet_uuid = operation["wallet_uuid"]
+            metrics.record_operation(
+                operation["operation_type"], result if isinstance(result, Exception) else None
+            )
+            if isinstance(result, cls.DoesNotExist):
+                error = "Кошелек не найден"
+            elif isinstance(result, RestApiException):
+                error = result.detail[result.default_error_key]
+            else:
+                balance, date_updated, transaction_uuid = result
+                results.append(
+                    {
+                        "wallet_uuid": wallet_uuid,
+                        "status": "success",
+                        "balance": balance,
+                        "date_updated": date_updated,
+                        "transaction_uuid": transaction_uuid,
+                    }
+                )
+                continue
+            results.append({"wallet_uuid": wallet_uuid, "status": "error", "error": error})
+
+        return results
+
+    batch_transactions.alters_data = True
+
+    @classmethod
+    def _apply_by_shard(cls, operations):
+        """_apply_operations по шардам кошельков; результаты в порядке операций."""
+        groups = {}
+        for position, operation in enumerate(operations):
+            using = router.db_for_write(cls, wallet_uuid=operation["wallet_uuid"])
+            groups.setdefault(using, []).append(position)
+
+        results = [None] * len(operations)
+        for using, positions in groups.items():
+            applied = cls._apply_operations(
+                [operations[position] for position in positions], using=using
+            )
+            for position, result in zip(positions, applied):
+                results[position] = result
+        return results
+
+    @classmethod
+    def _apply_operations(cls, operations, using=None):
+        """
+        Проведение операций под одной блокировкой каждого кошелька.
+
+        Возвращает для каждой операции (баланс, время изменения, UUID транзакции) после ее
+        проведения либо объект исключения, по которому операция отклонена.
+
+        1. Блокируем все кошельки в порядке сортировки uuid, чтобы параллельные
+           пакеты не приводили к взаимной блокировке.
+        2. Проводим операции в памяти в порядке их следования. Операция, для которой
+           недостаточно средств, отклоняется, остальные проводятся.
+        3. Создаем все транзакции одним bulk_create.
+        4. Изменяем баланс каждого кошелька одним UPDATE на суммарное изменение.
+
+        """
+        using = using or router.db_for_write(cls)
+        wallet_uuids = sorted({operation["wallet_uuid"] for operation in operations})
+        results, transactions, changes = [], [], {}
+        now = timezone.now()
+
+        try:
+            with transaction.atomic(using=using):
+                contention.set_lock_timeout(using)
+                wallets = {}
+                for start in range(0, len(wallet_uuids), BATCH_LOCK_CHUNK_SIZE):
+                    chunk = wallet_uuids[start : start + BATCH_LOCK_CHUNK_SIZE]
+                    locked = (
+                        cls.objects.using(using)
+                        .select_for_update()
+                        .filter(pk__in=chunk)
+                        .order_by("pk")
+                    )
+                    with metrics.lock_wait("batch"):
+                        locked = list(locked)
+                    wallets.update((wallet.pk, wallet) for wallet in locked)
+
+                # У кошельков в режиме корзин блокируем и корзины: баланс на время
+                # проведения операций считается по кошельку вместе с корзинами.
+                buckets = {}
+                bucket_wallets = [
+                    wallet_uuid
+                    for wallet_uuid in wallet_uuids
+                    if wallet_uuid in wallets and wallets[wallet_uuid].bucket_count
+                ]
+                if bucket_wallets:
+                    locked_buckets = (
+                        WalletBucket.objects.using(using)
+                        .select_for_update()
+                        .filter(wallet_id__in=bucket_wallets)
+                        .order_by("wallet_id", "index")
+                    )
+                    for bucket in locked_buckets:
+                        buckets.setdefault(bucket.wallet_id, []).append(bucket)
+
+                # Операции проводятся в минимальных единицах валюты (apps.wallet.money).
+                balances = {
+                    wallet_uuid: money.to_minor(wallet.balance)
+                    + sum(money.to_minor(bucket.balance) for bucket in buckets.get(wallet_uuid, []))
+                    for wallet_uuid, wallet in wallets.items()
+                }
+
+                for operation in operations:
+                    wallet_uuid = operation["wallet_uuid"]
+                    amount = operation["amount"]
+                    txn_type = operation["operation_type"]
+
+                    wallet = wallets.get(wallet_uuid)
+                    if wallet is None:
+                        results.append(cls.DoesNotExist("Кошелек не найден"))
+                        continue
+
+                    units = money.to_minor(amount)
+                    try:
+                        if txn_type not in (Transaction.DEPOSIT, Transaction.WITHDRAW):
+                            raise InvalidTypeException("Неверный тип транзакции")
+                        wallet._validate_amount(amount, txn_type)
+                        if txn_type == Transaction.WITHDRAW and balances[wallet_uuid] < units:
+                            wallet._validate_balance_for_withdraw(
+                                amount, balance=money.from_minor(balances[wallet_uuid])
+                            )
+                    except RestApiException as e:
+                        results.append(e)
+                        continue
+
+                    units_to_change = units if txn_type == Transaction.DEPOSIT else -units
+                    balances[wallet_uuid] += units_to_change
+                    changes[wallet_uuid] = changes.get(wallet_uuid, 0) + units_to_change
+                    txn = Transaction(
+                        wallet=wallet, amount=money.from_minor(units), operation_type=txn_type
+                    )
+                    transactions.append(txn)
+                    results.append((money.from_minor(balances[wallet_uuid]), now, txn.uuid))
+
+                Transaction.objects.using(using).bulk_create(
+                    transactions, batch_size=BATCH_LOCK_CHUNK_SIZE
+                )
+
+                for wallet_uuid, units_to_change in changes.items():
+                    if wallet_uuid in buckets:
+                        wallets[wallet_uuid]._spread_balance(
+                            balances[wallet_uuid], buckets[wallet_uuid], using=using
+                        )
+                        continue
+                    cls.objects.using(using).filter(pk=wallet_uuid).update(
+                        balance=_add_minor_units(
+                            Value(units_to_change, output_field=MINOR_UNITS_FIELD)
+                        ),
+                        date_updated=now,
+                    )
+                _invalidate_cached_balances(changes, using)
+
+        except DatabaseError as e:
+            if contention.is_lock_timeout(e):
+                logger.warning(f"Кошельки пакета операций заняты. Ошибка: {e}")
+                raise contention.busy() from e
+            raise
+        return results
+
+    def _create_transaction(self, amount, txn_type):
         """
         Создание записи о транзакции.
 
@@ -99,69 +879,471 @@ class Wallet(models.Model):
         Но это уже зависит от контекста.
 
         1. Вализируем сумму транзакции.
-        2. Блокируем данный кошелек для других транзакций.
-        3. Создаем транзакцию.
-        4. Изменяем баланс кошелька.
-        5. Сохраняем изменения.
-        6. В случае Race Condition выполняем попытки еще 10 раз с разным интервалом.
+        2. Изменяем баланс одним условным UPDATE ... RETURNING. Достаточность средств для снятия
+           проверяет сама база данных в условии WHERE, поэтому строка кошелька заблокирована
+           только на время одного запроса, а не нескольких обменов с базой.
+        3. Создаем транзакцию. В PostgreSQL INSERT выполняется в том же запросе (CTE).
+        4. Обновляем объект значениями из RETURNING, без повторного чтения из базы данных.
+        5. Если строка кошелька не изменилась — кошелек не найден или недостаточно средств.
+        В режиме корзин вместо строки кошелька изменяется одна из его корзин (WalletBucket).
+        При включенном WALLET_COALESCE_ENABLED шаги 2-4 выполняются группой
+        одновременных операций этого кошелька (см. apps.wallet.coalescer).
+        6. Блокировку кошелька ждем не дольше WALLET_LOCK_TIMEOUT, иначе операция
+           отклоняется с WalletBusyException (см. apps.wallet.contention). После ошибки
+           сериализации или взаимоблокировки повторяем операцию с коротким интервалом.
         7. Откатываем изменения в случае ошибки.
-        8. Обновляем объект их базы данных для получения обновленных данных.
 
         """
         self._validate_amount(amount, txn_type)
+        using = router.db_for_write(self.__class__, instance=self)
+        if not self.bucket_count:
+            self.bucket_count = _get_bucket_count_hint(self.pk)
 
-        for attempt in range(retries):
-            try:
-                with transaction.atomic():
-                    wallet = self.__class__.objects.select_for_update().get(pk=self.pk)
-                    wallet.transactions.create(amount=amount, operation_type=txn_type)
-                    wallet._change_balance(amount, txn_type)
-                    break
-            except (OperationalError, DatabaseError) as e:
-                if attempt == retries - 1:
+        # Внутри внешней транзакции операцию нельзя отдать в общую группу:
+        # ее фиксирует транзакция другого потока. Кошельку в режиме корзин
+        # группировка не нужна.
+        if (
+            settings.WALLET_COALESCE_ENABLED
+            and not self.bucket_count
+            and not transaction.get_connection(using).in_atomic_block
+        ):
+            # Место в очереди кошелька занимает ведущая операция группы.
+            result = coalescer.submit(self, amount, txn_type, using=using)
+            if isinstance(result, DatabaseError):
+                # Группа откатилась целиком, проводим операцию отдельно.
+                logger.warning(
+                    f"Ошибка группового проведения операций кошелька {self.pk}. Ошибка: {result}"
+                )
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                self.balance, self.date_updated, self.last_transaction_uuid = result
+                return
+
+        attempts = settings.WALLET_SERIALIZATION_RETRIES + 1
+        with contention.wallet_queue(self.pk):
+            for attempt in range(attempts):
+                try:
+                    with transaction.atomic(using=using):
+                        contention.set_lock_timeout(using)
+                        if self.bucket_count:
+                            changed = self._change_bucket_balance(amount, txn_type, using=using)
+                        else:
+                            changed = self._change_balance(amount, txn_type, using=using)
+                except DatabaseError as e:
+                    self._handle_database_error(e, attempt, attempts)
+                    delay = _retry_delay(attempt)
+                    transaction_retried.send(
+                        sender=self.__class__,
+                        wallet_uuid=self.pk,
+                        attempt=attempt,
+                        error=e,
+                        delay=delay,
+                    )
+                    time.sleep(delay)
+                    continue
+                except Exception as e:
                     logger.error(
-                        f"Ошибка при создании транзакции у кошелька {self.pk}. Превышено количество попыток. Ошибка: {e}."
+                        f"Ошибка при создании транзакции у кошелька {self.pk}. Ошибка: {e}"
+                    )
+                    raise e
+
+                if changed:
+                    return
+
+                # Условие UPDATE не выполнилось: кошелька нет (DoesNotExist),
+                # на нем недостаточно средств (InvalidAmountException)
+                # или кошелек переключили в режим корзин или из него.
+                self.refresh_from_db(
+                    using=using, fields=["balance", "bucket_count", "date_updated"]
+                )
+                self._remember_bucket_count()
+                if txn_type == Transaction.WITHDRAW:
+                    self._validate_balance_for_withdraw(
+                        amount, balance=self.get_balance(using=using)
                     )
-                    raise OperationalError("Ошибка при создании транзакции")
-                sleep_time = min(0.1 * (2**attempt) + random.uniform(0, 0.5), 2.0)
-                time.sleep(sleep_time)
-            except Exception as e:
-                logger.error(
-                    f"Ошибка при создании транзакции у кошелька {self.pk}. Ошибка: {e}"
+                # Кошелек успели пополнить после UPDATE, пробуем еще раз.
+
+        raise OperationalError("Ошибка при создании транзакции")
+
+    def _handle_database_error(self, error, attempt, attempts):
+        """
+        Разбор ошибки базы данных при проведении операции.
+
+        Возвращает управление, только если операцию можно повторить: при ошибке
+        сериализации или взаимоблокировке, пока не исчерпаны попытки. Если блокировку
+        кошелька не удалось получить за WALLET_LOCK_TIMEOUT — WalletBusyException,
+        остальные ошибки передаются дальше.
+
+        """
+        if contention.is_lock_timeout(error):
+            logger.warning(f"Кошелек {self.pk} занят другими операциями. Ошибка: {error}")
+            raise contention.busy() from error
+        if not contention.is_retryable(error):
+            logger.error(
+                f"Ошибка при создании транзакции у кошелька {self.pk}. Ошибка: {error}"
+            )
+            raise error
+        if attempt == attempts - 1:
+            logger.error(
+                f"Ошибка при создании транзакции у кошелька {self.pk}. Превышено количество попыток. Ошибка: {error}."
+            )
+            raise OperationalError("Ошибка при создании транзакции") from error
+
+    async def _acreate_transaction(self, amount, txn_type):
+        """
+        Асинхронное создание записи о транзакции.
+
+        Выполняет тот же условный UPDATE ... RETURNING, что и _create_transaction,
+        через пул асинхронных соединений, а между попытками ждет asyncio.sleep,
+        не занимая поток. Кошельки в режиме корзин и базы кроме PostgreSQL
+        обрабатываются синхронной реализацией в потоке.
+
+        """
+        self._validate_amount(amount, txn_type)
+        using = router.db_for_write(self.__class__, instance=self)
+        if not self.bucket_count:
+            self.bucket_count = _get_bucket_count_hint(self.pk)
+        if self.bucket_count or not async_pool.is_available(using):
+            return await sync_to_async(self._create_transaction)(amount, txn_type)
+
+        connection = connections[using]
+        attempts = settings.WALLET_SERIALIZATION_RETRIES + 1
+        with contention.wallet_queue(self.pk):
+            for attempt in range(attempts):
+                txn_uuid = uuid.uuid4()
+                sql, params = self._balance_update_sql(
+                    self.__class__,
+                    [("uuid", self.pk), ("bucket_count", 0)],
+                    amount,
+                    txn_type,
+                    txn_uuid,
+                    connection,
+                )
+                try:
+                    row = await async_pool.fetchone(using, sql, params)
+                except async_pool.DatabaseError as e:
+                    self._handle_database_error(e, attempt, attempts)
+                    delay = _retry_delay(attempt)
+                    transaction_retried.send(
+                        sender=self.__class__,
+                        wallet_uuid=self.pk,
+                        attempt=attempt,
+                        error=e,
+                        delay=delay,
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+
+                if row is not None:
+                    self.balance = money.from_minor(row[0])
+                    self.date_updated = row[1]
+                    self.last_transaction_uuid = txn_uuid
+                    await balance_cache.adelete_many([self.pk])
+                    return
+
+                # Кошелька нет, на нем недостаточно средств или он в режиме корзин.
+                balance = await self.aget_balance()
+                self._remember_bucket_count()
+                if self.bucket_count:
+                    break
+                if txn_type == Transaction.WITHDRAW:
+                    self._validate_balance_for_withdraw(amount, balance=balance)
+            else:
+                raise OperationalError("Ошибка при создании транзакции")
+
+        return await sync_to_async(self._create_transaction)(amount, txn_type)
+
+    def _change_balance(self, amount, txn_type, using=DEFAULT_DB_ALIAS):
+        """
+        Изменение баланса с созданием транзакции.
+
+        Для снятия UPDATE выполняется с условием balance >= amount, поэтому баланс
+        не может уйти в минус даже при конкурентных запросах. Возвращает False,
+        если строка кошелька не изменилась. Кошелек в режиме корзин не изменяется:
+        его баланс меняет _change_bucket_balance.
+
+        """
+        with metrics.lock_wait("wallet"):
+            row = self._update_balance_row(
+                self.__class__,
+                [("uuid", self.pk), ("bucket_count", 0)],
+                amount,
+                txn_type,
+                using,
+            )
+        if row is None:
+            return False
+
+        self.balance, self.date_updated = row
+        return True
+
+    def _change_bucket_balance(self, amount, txn_type, using=DEFAULT_DB_ALIAS):
+        """
+        Изменение баланса кошелька в режиме корзин.
+
+        Операция проводится условным UPDATE одной случайной корзины, строка кошелька
+        не блокируется, поэтому одновременные пополнения не ждут друг друга.
+        Если в выбранной корзине недостаточно средств, снятие проводится по всем корзинам
+        с перераспределением баланса (_change_balance_locked).
+
+        """
+        with metrics.lock_wait("bucket"):
+            row = self._update_balance_row(
+                WalletBucket,
+                [("wallet", self.pk), ("index", random.randrange(self.bucket_count))],
+                amount,
+                txn_type,
+                using,
+            )
+        if row is None:
+            if txn_type != Transaction.WITHDRAW:
+                # Корзину удалили при выключении режима или изменении количества корзин.
+                return False
+            return self._change_balance_locked(amount, txn_type, using=using)
+
+        self.date_updated = row[1]
+        return True
+
+    def _change_balance_locked(self, amount, txn_type, using=DEFAULT_DB_ALIAS):
+        """
+        Изменение баланса под блокировкой кошелька и всех его корзин.
+
+        Баланс кошелька с учетом корзин после операции распределяется по корзинам поровну.
+        Возвращает False, если кошелек не найден или на нем недостаточно средств.
+
+        """
+        with metrics.lock_wait("wallet_buckets"):
+            wallet = (
+                self.__class__.objects.using(using)
+                .select_for_update()
+                .filter(pk=self.pk)
+                .first()
+            )
+            if wallet is None:
+                return False
+            buckets = wallet._lock_buckets(using)
+        units = money.to_minor(amount)
+        total = money.to_minor(wallet.balance) + sum(
+            money.to_minor(bucket.balance) for bucket in buckets
+        )
+        if txn_type == Transaction.WITHDRAW:
+            if total < units:
+                return False
+            total -= units
+        else:
+            total += units
+
+        wallet._spread_balance(total, buckets, using=using)
+        txn = Transaction.objects.using(using).create(
+            wallet=wallet, amount=money.from_minor(units), operation_type=txn_type
+        )
+        self.last_transaction_uuid = txn.uuid
+        self.balance = wallet.balance
+        self.bucket_count = wallet.bucket_count
+        self.date_updated = wallet.date_updated
+        return True
+
+    def _lock_buckets(self, using=DEFAULT_DB_ALIAS):
+        """Блокировка корзин кошелька в порядке их номеров."""
+        return list(
+            WalletBucket.objects.using(using)
+            .select_for_update()
+            .filter(wallet_id=self.pk)
+            .order_by("index")
+        )
+
+    def _spread_balance(self, total, buckets, using=DEFAULT_DB_ALIAS):
+        """
+        Запись баланса кошелька поровну по заблокированным корзинам.
+
+        total — баланс в минимальных единицах валюты. Без корзин весь баланс хранится
+        в самом кошельке. Остаток от деления достается первой корзине.
+
+        """
+        now = timezone.now()
+        if buckets:
+            share, remainder = divmod(total, len(buckets))
+            for bucket in buckets:
+                bucket.balance = money.from_minor(share)
+                bucket.date_updated = now
+            buckets[0].balance = money.from_minor(share + remainder)
+
+            WalletBucket.objects.using(using).bulk_create(
+                [bucket for bucket in buckets if bucket.pk is None]
+            )
+            WalletBucket.objects.using(using).bulk_update(
+                [bucket for bucket in buckets if bucket.pk is not None],
+                ["balance", "date_updated"],
+            )
+            self.balance = D(0)
+        else:
+            self.balance = money.from_minor(total)
+
+        self.date_updated = now
+        self.save(using=using, update_fields=["balance", "bucket_count", "date_updated"])
+        _invalidate_cached_balances([self.pk], using)
+
+    def _update_balance_row(self, model, filters, amount, txn_type, using):
+        """
+        Условный UPDATE ... RETURNING баланса строки с созданием транзакции кошелька.
+
+        Возвращает (баланс строки, время изменения) или None,
+        если ни одна строка не изменилась.
+
+        """
+        connection = connections[using]
+        txn_uuid = uuid.uuid4()
+        sql, params = self._balance_update_sql(
+            model, filters, amount, txn_type, txn_uuid, connection
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+            if row is not None and connection.vendor != "postgresql":
+                Transaction.objects.using(using).create(
+                    wallet_id=self.pk, amount=amount, operation_type=txn_type, uuid=txn_uuid
                 )
-                raise e
 
-        self.refresh_from_db()
+        if row is None:
+            return None
+
+        self.last_transaction_uuid = txn_uuid
+        _invalidate_cached_balances([self.pk], using)
+        return (
+            _from_db_value(model, "balance", row[0], connection),
+            _from_db_value(model, "date_updated", row[1], connection),
+        )
+
+    def _balance_update_sql(self, model, filters, amount, txn_type, txn_uuid, connection):
+        """
+        SQL условного изменения баланса строки model.
+
+        filters — пары (поле, значение) для условия WHERE. Для снятия добавляется
+        условие balance >= amount. В PostgreSQL INSERT транзакции выполняется в том же
+        запросе (CTE), на остальных базах транзакцию создает вызывающий код.
+        Сумма передается в базу целым числом минимальных единиц (apps.wallet.money).
 
-    def _change_balance(self, amount, txn_type):
-        """Изменение баланса с сохранением."""
+        """
+        qn = connection.ops.quote_name
+        amount = money.to_minor(amount)
         amount_to_change = amount if txn_type == Transaction.DEPOSIT else -amount
-        self.balance = F("balance") + D(amount_to_change)
-        self.date_updated = timezone.now()
-        self.save(update_fields=["balance", "date_updated"])
+        now = timezone.now()
+
+        opts = model._meta
+        balance = qn(opts.get_field("balance").column)
+        date_updated = opts.get_field("date_updated")
+        updated = qn(date_updated.column)
+
+        conditions = []
+        params = [amount_to_change, date_updated.get_db_prep_value(now, connection)]
+        for name, value in filters:
+            field = opts.get_field(name)
+            conditions.append("{column} = %s".format(column=qn(field.column)))
+            params.append(field.get_db_prep_value(value, connection))
+        if txn_type == Transaction.WITHDRAW:
+            conditions.append("{balance} >= %s".format(balance=balance))
+            params.append(amount)
+
+        update_sql = (
+            "UPDATE {table} SET {balance} = {balance} + %s, {updated} = %s WHERE {where} "
+            "RETURNING {balance}, {updated}"
+        ).format(
+            table=qn(opts.db_table),
+            balance=balance,
+            updated=updated,
+            where=" AND ".join(conditions),
+        )
+        if connection.vendor != "postgresql":
+            return update_sql, params
+
+        # UPDATE и INSERT транзакции уходят в базу одним запросом.
+        txn_opts = Transaction._meta
+        sql = (
+            "WITH updated AS ({update}), "
+            "created AS (INSERT INTO {txn} ({txn_uuid}, {wallet_id}, {operation_type}, {amount}, {created}) "
+            "SELECT %s, %s, %s, %s, %s FROM updated) "
+            "SELECT {balance}, {updated} FROM updated"
+        ).format(
+            update=update_sql,
+            balance=balance,
+            updated=updated,
+            txn=qn(txn_opts.db_table),
+            txn_uuid=qn(txn_opts.get_field("uuid").column),
+            wallet_id=qn(txn_opts.get_field("wallet").column),
+            operation_type=qn(txn_opts.get_field("operation_type").column),
+            amount=qn(txn_opts.get_field("amount").column),
+            created=qn(txn_opts.get_field("date_created").column),
+        )
+        return sql, params + [txn_uuid, self.pk, txn_type, amount, now]
 
     def _validate_amount(self, amount, tnx_type):
-        """Валидация суммы транзакции."""
-        if D(amount) <= 0:
+        """
+        Валидация суммы транзакции.
+
+        Достаточность средств для снятия проверяется условием UPDATE в _change_balance:
+        баланс объекта может быть устаревшим.
+
+        """
+        if money.to_minor(amount) <= 0:
             raise InvalidAmountException(
                 "Неверное значение суммы транзакции. Сумма транзакции отрицательная или равна 0"
             )
 
-        if tnx_type == Transaction.WITHDRAW:
-            self._validate_balance_for_withdraw(amount)
-
         return True
 
-    def _validate_balance_for_withdraw(self, amount):
+    def _validate_balance_for_withdraw(self, amount, balance=None):
         """Проверка достаточности баланса для снятия."""
-        if D(self.balance) < D(amount):
+        balance = self.balance if balance is None else balance
+        if money.to_minor(balance) < money.to_minor(amount):
             raise InvalidAmountException(
                 "Недостаточно средств для снятия. Сумма транзакции: {amount}. Баланс: {balance}".format(
-                    amount=amount, balance=self.balance
+                    amount=amount, balance=balance
                 )
             )
 
 
+class WalletBucket(models.Model):
+    """
+    Корзина баланса кошелька.
+
+    Пополнения кошелька в режиме корзин распределяются по случайным корзинам,
+    поэтому одновременные операции изменяют разные строки и не ждут друг друга.
+
+    """
+
+    wallet = models.ForeignKey(
+        "wallet.Wallet",
+        on_delete=models.CASCADE,
+        related_name="buckets",
+        verbose_name="Кошелек",
+    )
+    index = models.PositiveSmallIntegerField("Номер корзины")
+    balance = money.MoneyField(default=0)
+    date_updated = models.DateTimeField("Дата изменения баланса", auto_now=True)
+
+    objects = WalletRowManager()
+
+    class Meta:
+        app_label = "wallet"
+        verbose_name = "Корзина баланса"
+        verbose_name_plural = "Корзины баланса"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["wallet", "index"], name="wallet_bucket_unique_index"
+            ),
+            models.CheckConstraint(
+                check=Q(balance__gte=0), name="wallet_bucket_balance_non_negative"
+            ),
+        ]
+
+    def __str__(self):
+        return "Корзина {index} кошелька {uuid}, Баланс {balance}".format(
+            index=self.index, uuid=self.wallet_id, balance=self.balance
+        )
+
+
 class Transaction(models.Model):
     """
     Объект транзакции.
@@ -173,16 +1355,26 @@ class Transaction(models.Model):
     иметь статус "Успешно", так как создание транзакции происходит только при успешном завершении операции.
     Каждая транзакция также должна иметь уникальный идентификатор.
 
+    В PostgreSQL таблица секционирована по date_created (apps.wallet.db.partitions).
+    Партиции отсекаются в запросах с границей date_created: страницы истории после первой
+    (курсор), отбор истории и выгрузки по датам, баланс после контрольной точки.
+    Первая страница истории и баланс кошелька без контрольной точки обращаются
+    к индексам всех присоединенных партиций.
+
     """
 
+    # Отдельный индекс по кошельку не нужен: его заменяет wallet_txn_history_idx.
     wallet = models.ForeignKey(
         "wallet.Wallet",
         on_delete=models.CASCADE,
         related_name="transactions",
         verbose_name="Кошелек",
+        db_index=False,
     )
 
     DEPOSIT, WITHDRAW = "deposit", "withdraw"
+    # Перевод проводится парой транзакций снятия и внесения с общим transfer_uuid.
+    TRANSFER = "transfer"
     TYPE_CHOICES = (
         (DEPOSIT, "Внесение средств"),
         (WITHDRAW, "Изъятие средств"),
@@ -191,7 +1383,7 @@ class Transaction(models.Model):
     operation_type = models.CharField(
         "Тип операции", choices=TYPE_CHOICES, max_length=255, blank=False, null=False
     )
-    amount = models.DecimalField("Сумма транзакции", max_digits=12, decimal_places=2)
+    amount = money.MoneyField("Сумма транзакции")
 
     date_created = models.DateTimeField(
         "Дата создания",
@@ -205,14 +1397,37 @@ class Transaction(models.Model):
     #     (CANCEL, "Отменена"),
     # )
     # status = models.CharField("Статус", max_length=12, choices=STATUS_CHOICES)
-    # uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    # Первичным ключом остается id. У транзакций, созданных до появления поля, UUID нет.
+    uuid = models.UUIDField("UUID транзакции", default=uuid.uuid4, null=True, editable=False)
+    transfer_uuid = models.UUIDField("UUID перевода", null=True, blank=True, editable=False)
     # currency = models.CharField("Валюта", max_length=12, default=get_default_currency)
 
+    objects = WalletRowManager()
+
     class Meta:
         app_label = "wallet"
         ordering = ["date_created", "wallet"]
         verbose_name = "Транзиция"
         verbose_name_plural = "Транзакции"
+        indexes = [
+            # История транзакций кошелька (get_history). В PostgreSQL остальные поля
+            # страницы входят в индекс (INCLUDE), и страница читается только из индекса.
+            models.Index(
+                fields=["wallet", "date_created", "id"],
+                include=["operation_type", "amount", "uuid"],
+                name="wallet_txn_history_idx",
+            ),
+        ]
+        constraints = [
+            # Повторная загрузка реестра пропускает загруженные транзакции (import_ledger).
+            # Уникальный индекс секционированной таблицы включает ключ секционирования.
+            models.UniqueConstraint(
+                fields=["uuid", "date_created"],
+                condition=models.Q(uuid__isnull=False),
+                name="wallet_txn_uuid_uniq",
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -222,3 +1437,393 @@ class Transaction(models.Model):
             operation_type=self.operation_type,
             amount=self.amount,
         )
+
+    def save(self, *args, **kwargs):
+        # Измененная транзакция могла войти в контрольные точки баланса.
+        if not self._state.adding and self.date_created is not None:
+            BalanceCheckpoint.invalidate(self.wallet_id, self.date_created, using=self._state.db)
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        BalanceCheckpoint.invalidate(self.wallet_id, self.date_created, using=self._state.db)
+        return super().delete(*args, **kwargs)
+
+    @classmethod
+    def get_history(
+        cls,
+        wallet_uuid,
+        limit,
+        before=None,
+        operation_type=None,
+        date_from=None,
+        date_to=None,
+        using=None,
+    ):
+        """
+        Страница истории транзакций кошелька, от новых к старым.
+
+        Постраничный вывод по ключу (keyset): before — пара (date_created, id) последней
+        транзакции предыдущей страницы. Страница читается диапазоном индекса
+        wallet_txn_history_idx, поэтому дальние страницы не дороже первой.
+
+        """
+        queryset = cls.objects.for_wallet(wallet_uuid).using(using).filter(wallet_id=wallet_uuid)
+        if operation_type:
+            queryset = queryset.filter(operation_type=operation_type)
+        if date_from:
+            queryset = queryset.filter(date_created__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date_created__lt=date_to)
+        if before:
+            date_created, pk = before
+            # Условие date_created <= ... ограничивает диапазон индекса,
+            # а OR отсекает уже выданные транзакции с той же датой.
+            queryset = queryset.filter(date_created__lte=date_created).filter(
+                Q(date_created__lt=date_created) | Q(pk__lt=pk)
+            )
+
+        return list(
+            queryset.order_by("-date_created", "-pk").only(
+                "pk", "uuid", "operation_type", "amount", "date_created"
+            )[:limit]
+        )
+
+    @classmethod
+    def export_rows(
+        cls,
+        wallet_uuid=None,
+        operation_type=None,
+        date_from=None,
+        date_to=None,
+        chunk_size=None,
+        using=None,
+    ):
+        """
+        Транзакции для выгрузки: кортежи (uuid, кошелек, тип, сумма, дата создания).
+
+        Строки читаются порциями по chunk_size (в PostgreSQL — серверным курсором),
+        в порядке индекса wallet_txn_history_idx, поэтому выгрузка не сортирует
+        и не держит в памяти весь результат. Выгрузка периода при шардировании читает
+        все шарды и сливает их строки в том же порядке.
+
+        """
+        if not wallet_uuid and using is None and shards.is_enabled():
+            return shards.merge(
+                [
+                    cls.export_rows(
+                        operation_type=operation_type,
+                        date_from=date_from,
+                        date_to=date_to,
+                        chunk_size=chunk_size,
+                        using=alias,
+                    )
+                    for alias in shards.get_shards()
+                ],
+                key=lambda row: (row[1], row[4]),
+            )
+
+        manager = cls.objects.for_wallet(wallet_uuid) if wallet_uuid else cls.objects
+        queryset = manager.using(using)
+        if wallet_uuid:
+            queryset = queryset.filter(wallet_id=wallet_uuid)
+        if operation_type:
+            queryset = queryset.filter(operation_type=operation_type)
+        if date_from:
+            queryset = queryset.filter(date_created__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date_created__lt=date_to)
+
+        return (
+            queryset.order_by("wallet_id", "date_created", "pk")
+            .values_list("uuid", "wallet_id", "operation_type", "amount", "date_created")
+            .iterator(chunk_size=chunk_size or settings.WALLET_EXPORT_CHUNK_SIZE)
+        )
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ключ идемпотентности запроса на проведение операции (заголовок Idempotency-Key).
+
+    Хранит ответ на первый успешный запрос с этим ключом: повтор запроса получает
+    сохраненный ответ одним чтением по уникальному индексу, без блокировки кошелька.
+    Ключ вставляется в той же транзакции БД, что и операция, поэтому одновременный
+    повтор ждет на уникальном индексе завершения первого запроса и операцию
+    не проводит. Отклоненные операции ключ не сохраняют: их можно повторить.
+
+    Ключи старше WALLET_IDEMPOTENCY_KEY_TTL секунд удаляются командой
+    prune_idempotency_keys.
+
+    """
+
+    key = models.CharField("Ключ", max_length=255, unique=True)
+    # Кошелек операции: ключ хранится в его шарде (apps.wallet.db.shards).
+    wallet_uuid = models.UUIDField("UUID кошелька", null=True, db_index=True, editable=False)
+    request_hash = models.CharField("Хеш запроса", max_length=64)
+    response_status = models.PositiveSmallIntegerField("Статус ответа", null=True)
+    response_body = models.JSONField("Тело ответа", null=True)
+    date_created = models.DateTimeField("Дата создания", auto_now_add=True, db_index=True)
+
+    objects = WalletRowManager()
+
+    class Meta:
+        app_label = "wallet"
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+
+    def __str__(self):
+        return self.key
+
+    @staticmethod
+    def make_request_hash(*parts):
+        return hashlib.sha256(":".join(map(str, parts)).encode()).hexdigest()
+
+    @classmethod
+    def execute(cls, key, request_hash, handler, wallet_uuid=None, using=None):
+        """
+        Выполнение запроса с ключом идемпотентности.
+
+        handler() проводит операцию и возвращает (статус, тело ответа). Возвращает
+        (статус, тело ответа, повтор ли это). Ответ со статусом 400 и выше не сохраняется,
+        а изменения handler() откатываются. Если ключ уже использован для другого
+        запроса — IdempotencyKeyMismatch.
+
+        Ключ хранится в шарде кошелька wallet_uuid, чтобы операция и ключ
+        фиксировались одной транзакцией БД.
+
+        """
+        using = using or router.db_for_write(cls, wallet_uuid=wallet_uuid)
+        stored = cls.objects.using(using).filter(key=key).first()
+        if stored is None:
+            record = cls(key=key, request_hash=request_hash, wallet_uuid=wallet_uuid)
+            inserted = False
+            try:
+                with transaction.atomic(using=using):
+                    record.save(using=using, force_insert=True)
+                    inserted = True
+                    record.response_status, record.response_body = handler()
+                    if record.response_status >= 400:
+                        transaction.set_rollback(True, using=using)
+                    else:
+                        record.save(
+                            using=using, update_fields=["response_status", "response_body"]
+                        )
+                return record.response_status, record.response_body, False
+            except IntegrityError:
+                if inserted:
+                    raise
+            # Одновременный запрос с тем же ключом уже зафиксирован.
+            stored = cls.objects.using(using).get(key=key)
+
+        if stored.request_hash != request_hash:
+            raise IdempotencyKeyMismatch(
+                "Ключ идемпотентности уже использован для другого запроса"
+            )
+        return stored.response_status, stored.response_body, True
+
+    @classmethod
+    def prune(cls, batch_size=10000, using=None):
+        """Удаление ключей старше WALLET_IDEMPOTENCY_KEY_TTL пачками по batch_size."""
+        using = using or router.db_for_write(cls)
+        expired = cls.objects.using(using).filter(
+            date_created__lt=timezone.now()
+            - timedelta(seconds=settings.WALLET_IDEMPOTENCY_KEY_TTL)
+        )
+        deleted = 0
+        while True:
+            pks = list(expired.values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            deleted += cls.objects.using(using).filter(pk__in=pks).delete()[0]
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    Контрольная точка баланса кошелька.
+
+    Баланс по всем транзакциям кошелька до транзакции transaction_id включительно
+    в порядке (date_created, id). Пересчет баланса и баланс на момент времени
+    (Wallet.get_ledger_balance) суммируют только транзакции после ближайшей точки.
+
+    Точки создаются командой create_balance_checkpoints. Изменение или удаление
+    транзакции удаляет точки, которые ее учитывают (invalidate).
+
+    """
+
+    wallet = models.ForeignKey(
+        "wallet.Wallet",
+        on_delete=models.CASCADE,
+        related_name="checkpoints",
+        verbose_name="Кошелек",
+        db_index=False,
+    )
+    as_of = models.DateTimeField("Дата последней учтенной транзакции")
+    transaction_id = models.BigIntegerField("ID последней учтенной транзакции")
+    balance = money.MoneyField("Баланс")
+
+    objects = WalletRowManager()
+
+    class Meta:
+        app_label = "wallet"
+        verbose_name = "Контрольная точка баланса"
+        verbose_name_plural = "Контрольные точки баланса"
+        indexes = [
+            models.Index(
+                fields=["wallet", "as_of", "transaction_id"],
+                name="wallet_checkpoint_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Баланс кошелька {self.wallet_id} на {self.as_of}: {self.balance}"
+
+    @classmethod
+    def invalidate(cls, wallet_id, date_created, using=None):
+        """Удаление точек кошелька, которые учитывают транзакцию от date_created."""
+        cls.objects.for_wallet(wallet_id).using(using).filter(wallet_id=wallet_id, as_of__gte=date_created).delete()
+
+
+class SlowRequest(models.Model):
+    """
+    Медленный запрос к API, сохраненный профилированием запросов (apps.wallet.profiling).
+
+    Хранит время этапов запроса (как в заголовке Server-Timing), его запросы к базе
+    и, если запрос выполнялся под cProfile, профиль. Хранятся последние
+    WALLET_PROFILING_KEEP запросов.
+
+    """
+
+    method = models.CharField("Метод", max_length=10)
+    path = models.CharField("Адрес", max_length=2048)
+    endpoint = models.CharField("Эндпоинт", max_length=255)
+    status = models.PositiveSmallIntegerField("Статус ответа")
+    duration = models.FloatField("Время, мс", db_index=True)
+    timings = models.JSONField("Время этапов, мс")
+    query_count = models.PositiveIntegerField("Запросов к базе")
+    queries = models.JSONField("Запросы к базе")
+    profile = models.TextField("Профиль cProfile", blank=True)
+    date_created = models.DateTimeField("Дата создания", auto_now_add=True)
+
+    class Meta:
+        app_label = "wallet"
+        ordering = ["-duration"]
+        verbose_name = "Медленный запрос"
+        verbose_name_plural = "Медленные запросы"
+
+    def __str__(self):
+        return f"{self.method} {self.path}: {self.duration:.0f} мс"
+
+    @classmethod
+    def record(cls, method, path, endpoint, status, duration, profile, using=None):
+        """Сохранение запроса длительностью duration секунд и удаление старых."""
+        using = using or router.db_for_write(cls)
+        request = cls.objects.using(using).create(
+            method=method,
+            path=path[: cls._meta.get_field("path").max_length],
+            endpoint=endpoint,
+            status=status,
+            duration=round(duration * 1000, 3),
+            timings=profile.timings(),
+            query_count=profile.query_count,
+            queries=profile.queries,
+            profile=profile.profile_stats(),
+        )
+        keep = settings.WALLET_PROFILING_KEEP
+        stale = list(
+            cls.objects.using(using)
+            .order_by("-pk")
+            .values_list("pk", flat=True)[keep : keep + 1]
+        )
+        if stale:
+            cls.objects.using(using).filter(pk__lte=stale[0]).delete()
+        return request
+
+
+class APIKey(models.Model):
+    """
+    Ключ API кошелька (apps.wallet.api.authentication.APIKeyAuthentication).
+
+    Ключ имеет вид <prefix>.<secret> и передается в заголовке Authorization: Api-Key <ключ>.
+    В базе хранится только HMAC секрета с SECRET_KEY: проверка ключа — одно чтение
+    по уникальному префиксу и сравнение HMAC за постоянное время, без хеширования пароля.
+    Сам ключ показывается один раз при создании (команда create_api_key).
+
+    """
+
+    PREFIX_LENGTH = 12
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="wallet_api_keys",
+        verbose_name="Пользователь",
+    )
+    name = models.CharField("Название", max_length=100, blank=True)
+    prefix = models.CharField("Префикс", max_length=PREFIX_LENGTH, unique=True, editable=False)
+    digest = models.CharField("HMAC секрета", max_length=64, editable=False)
+    is_active = models.BooleanField("Активен", default=True)
+    date_created = models.DateTimeField("Дата создания", auto_now_add=True)
+
+    class Meta:
+        app_label = "wallet"
+        verbose_name = "Ключ API"
+        verbose_name_plural = "Ключи API"
+
+    def __str__(self):
+        return f"{self.prefix} ({self.name})" if self.name else self.prefix
+
+    @staticmethod
+    def make_digest(secret):
+        return salted_hmac("apps.wallet.APIKey", secret, algorithm="sha256").hexdigest()
+
+    @classmethod
+    def generate(cls, user, name="", using=None):
+        """Новый ключ пользователя user. Возвращает (APIKey, ключ для клиента)."""
+        prefix = get_random_string(cls.PREFIX_LENGTH)
+        secret = secrets.token_urlsafe(32)
+        api_key = cls.objects.using(using or router.db_for_write(cls)).create(
+            user=user, name=name, prefix=prefix, digest=cls.make_digest(secret)
+        )
+        return api_key, f"{prefix}.{secret}"
+
+    @classmethod
+    def get_user(cls, key, using=None):
+        """Активный пользователь ключа key или None, если ключ неверный или отозван."""
+        prefix, _, secret = key.partition(".")
+        if not secret:
+            return None
+        api_key = (
+            cls.objects.using(using or router.db_for_read(cls))
+            .select_related("user")
+            .filter(prefix=prefix, is_active=True)
+            .first()
+        )
+        if api_key is None or not api_key.user.is_active:
+            return None
+        if not constant_time_compare(api_key.digest, cls.make_digest(secret)):
+            return None
+        return api_key.user
+
+
+class ShardSlot(models.Model):
+    """
+    Слот карты шардов кошельков (apps.wallet.db.shards).
+
+    Кошелек принадлежит слоту crc32(uuid) % WALLET_SHARD_SLOTS, слот — шарду database.
+    Карта хранится в основной базе и изменяется командой reshard; пока слот
+    переносится (is_moving), запись в его кошельки отклоняется.
+
+    """
+
+    slot = models.PositiveIntegerField("Слот", primary_key=True)
+    database = models.CharField("Шард", max_length=100)
+    is_moving = models.BooleanField("Переносится", default=False)
+    date_updated = models.DateTimeField("Дата изменения", auto_now=True)
+
+    class Meta:
+        app_label = "wallet"
+        ordering = ["slot"]
+        verbose_name = "Слот шардирования"
+        verbose_name_plural = "Слоты шардирования"
+
+    def __str__(self):
+        return f"Слот {self.slot}: {self.database}"
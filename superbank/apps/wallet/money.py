@@ -0,0 +1,123 @@
+"""
+Денежные суммы в минимальных единицах валюты (копейках, центах).
+
+Балансы и суммы транзакций хранятся в базе целыми числами (BIGINT) минимальных единиц
+валюты DEFAULT_CURRENCY: строки и индексы короче, чем с numeric, база складывает
+и сравнивает целые числа, а суммы не ограничены 12 знаками.
+
+В Python поле MoneyField отдает Decimal с точностью валюты, поэтому API, админ-панель
+и выгрузка работают с теми же значениями, что и раньше. Код горячего пути
+(условный UPDATE баланса, пакет операций, перевод, распределение по корзинам)
+переводит суммы в минимальные единицы один раз, считает целыми числами и передает
+в базу целое число; в Decimal переводятся только значения полей и ответов.
+
+Минимальные единицы одинаковы для всего реестра: смена DEFAULT_CURRENCY на валюту
+с другим количеством знаков после запятой требует пересчета сохраненных сумм.
+
+"""
+
+from decimal import ROUND_HALF_EVEN
+from decimal import Decimal as D
+
+from django import forms
+from django.core import exceptions
+from django.db import models
+
+from apps.wallet.utils import get_default_currency
+
+# Количество знаков после запятой валют ISO 4217, которые отличаются от двух.
+CURRENCY_EXPONENTS = {
+    "BHD": 3,
+    "CLP": 0,
+    "IQD": 3,
+    "ISK": 0,
+    "JOD": 3,
+    "JPY": 0,
+    "KRW": 0,
+    "KWD": 3,
+    "LYD": 3,
+    "OMR": 3,
+    "TND": 3,
+    "VND": 0,
+}
+DEFAULT_EXPONENT = 2
+
+# Знаков в сумме: BIGINT хранит любое 18-значное число минимальных единиц.
+MAX_DIGITS = 18
+
+
+def get_exponent(currency=None):
+    """Количество знаков после запятой валюты, по умолчанию — DEFAULT_CURRENCY."""
+    return CURRENCY_EXPONENTS.get(currency or get_default_currency(), DEFAULT_EXPONENT)
+
+
+def get_quantum(currency=None):
+    """Минимальная единица валюты в виде Decimal, например Decimal("0.01")."""
+    return D(1).scaleb(-get_exponent(currency))
+
+
+def to_minor(amount, currency=None):
+    """
+    Сумма в минимальных единицах валюты (int).
+
+    Лишние знаки после запятой округляются, как при записи в DecimalField.
+    """
+    if isinstance(amount, int):
+        return amount * 10 ** get_exponent(currency)
+    if not isinstance(amount, D):
+        amount = D(str(amount))
+    return int(
+        amount.scaleb(get_exponent(currency)).to_integral_value(rounding=ROUND_HALF_EVEN)
+    )
+
+
+def from_minor(units, currency=None):
+    """Decimal с точностью валюты из суммы в минимальных единицах."""
+    return D(int(units)).scaleb(-get_exponent(currency))
+
+
+class MoneyField(models.Field):
+    """
+    Денежная сумма: BIGINT минимальных единиц в базе и Decimal в Python.
+
+    Значение переводится в минимальные единицы при записи в базу и в выражениях
+    запросов, обратно — при чтении, в том числе результатов Sum.
+    """
+
+    description = "Денежная сумма в минимальных единицах валюты"
+    default_error_messages = {"invalid": "Значение “%(value)s” должно быть числом."}
+
+    def get_internal_type(self):
+        return "BigIntegerField"
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else from_minor(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, D):
+            return value
+        try:
+            value = D(str(value))
+        except ArithmeticError:
+            raise exceptions.ValidationError(
+                self.error_messages["invalid"], code="invalid", params={"value": value}
+            )
+        if not value.is_finite():
+            raise exceptions.ValidationError(
+                self.error_messages["invalid"], code="invalid", params={"value": value}
+            )
+        return value.quantize(get_quantum())
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        return None if value is None else to_minor(self.to_python(value))
+
+    def formfield(self, **kwargs):
+        return super().formfield(
+            **{
+                "form_class": forms.DecimalField,
+                "max_digits": MAX_DIGITS,
+                "decimal_places": get_exponent(),
+                **kwargs,
+            }
+        )
@@ -0,0 +1,135 @@
+"""
+Профилирование запросов к API кошелька (WALLET_PROFILING).
+
+ProfilingMiddleware (apps.wallet.middleware) разбивает время каждого запроса на этапы
+и отдает их в заголовке Server-Timing:
+
+- auth — аутентификация (apps.wallet.api.authentication);
+- validation — проверка данных сериализаторами;
+- lock — захват блокировки строки кошелька или корзины (это время входит и в sql);
+- sql — все запросы к базе данных;
+- retry — паузы между повторами операции после ошибки базы данных;
+- render — отрисовка ответа;
+- total — весь запрос.
+
+Запросы дольше WALLET_PROFILING_SLOW_THRESHOLD секунд с их запросами к базе сохраняются
+в SlowRequest с вероятностью WALLET_PROFILING_SAMPLE_RATE, хранятся последние
+WALLET_PROFILING_KEEP. Доля WALLET_PROFILING_CPROFILE_RATE синхронных запросов выполняется
+под cProfile, медленные из них сохраняются вместе с профилем. Просмотр — админ-панель
+или команда slow_requests.
+
+"""
+
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.dispatch import receiver
+
+from apps.wallet.signals import transaction_retried
+
+PHASES = ("auth", "validation", "lock", "sql", "retry", "render")
+
+# Сколько запросов к базе и строк профиля сохраняется для медленного запроса.
+MAX_QUERIES = 200
+PROFILE_LINES = 40
+
+_current = ContextVar("wallet_request_profile", default=None)
+
+
+class RequestProfile:
+    """Время этапов и запросы к базе одного HTTP-запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.query_count = 0
+        self.queries = []
+        self.profiler = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def add_query(self, sql, seconds):
+        self.add("sql", seconds)
+        self.query_count += 1
+        if len(self.queries) < MAX_QUERIES:
+            self.queries.append({"sql": sql, "duration_ms": round(seconds * 1000, 3)})
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def timings(self):
+        """Время этапов в миллисекундах, без этапов нулевой длительности."""
+        return {
+            phase: round(seconds * 1000, 3) for phase, seconds in self.phases.items() if seconds
+        }
+
+    def server_timing(self, total):
+        entries = []
+        for phase, duration in self.timings().items():
+            if phase == "sql":
+                entries.append(f'sql;dur={duration};desc="{self.query_count} queries"')
+            else:
+                entries.append(f"{phase};dur={duration}")
+        entries.append(f"total;dur={round(total * 1000, 3)}")
+        return ", ".join(entries)
+
+    def start_profiler(self):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # В потоке уже работает другой профилировщик.
+            return
+        self.profiler = profiler
+
+    def stop_profiler(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def profile_stats(self):
+        """Самые затратные функции по накопленному времени в виде текста pstats."""
+        if self.profiler is None:
+            return ""
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_LINES)
+        return output.getvalue()
+
+
+def current():
+    """Профиль текущего запроса или None, если запрос не профилируется."""
+    return _current.get()
+
+
+def activate(profile):
+    return _current.set(profile)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """Учет времени блока with в этапе name текущего запроса."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started)
+
+
+@receiver(transaction_retried)
+def _record_retry(sender, delay=0, **kwargs):
+    profile = _current.get()
+    if profile is not None:
+        profile.add("retry", delay)
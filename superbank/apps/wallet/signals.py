@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Повторная попытка проведения операции после ошибки базы данных (блокировка,
+# взаимоблокировка, разрыв соединения). Аргументы: wallet_uuid, attempt, error,
+# delay — пауза перед следующей попыткой в секундах.
+transaction_retried = Signal()
@@ -1,11 +1,55 @@
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
 import uuid
 from decimal import Decimal
+from unittest import mock
 
+import msgspec
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections, router, transaction
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    tag,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
-from apps.wallet.models import Wallet
+from apps.wallet import contention
+from apps.wallet.api.authentication import credential_cache
+from apps.wallet.api.exceptions import WalletBusyException
+from apps.wallet.api.serializers import TransactionSerializer
+from apps.wallet.db import replicas, shards
+from apps.wallet.benchmark import (
+    MiddlewareBenchmark,
+    MoneyBenchmark,
+    SerializationBenchmark,
+    WalletBenchmark,
+)
+from apps.wallet.handlers import APIWSGIHandler, WSGIRouter
+from apps.wallet.models import (
+    APIKey,
+    BalanceCheckpoint,
+    IdempotencyKey,
+    ShardSlot,
+    SlowRequest,
+    Transaction,
+    Wallet,
+)
 
 
 class CreateTransactionViewTests(APITestCase):
@@ -23,6 +67,12 @@ class CreateTransactionViewTests(APITestCase):
         response = self.client.post(url, self.valid_deposit_payload)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_transaction_with_invalid_wallet_uuid(self):
+        """Тест транзакции для некорректного UUID кошелька"""
+        url = reverse("create-transaction", args=["not-a-uuid"])
+        response = self.client.post(url, self.valid_deposit_payload)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_transaction_with_invalid_data(self):
         """Тест с некорректными данными"""
         invalid_payloads = [
@@ -36,6 +86,41 @@ class CreateTransactionViewTests(APITestCase):
             response = self.client.post(self.url, payload)
             self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_invalid_data_errors(self):
+        """Тест ошибок проверки: те же, что у TransactionSerializer"""
+        payloads = [
+            {},
+            {"operation_type": None, "amount": "1.005"},
+            {"operation_type": 1, "amount": "NaN"},
+            {"operation_type": "deposit", "amount": "12345678901234567.00"},
+        ]
+        for payload in payloads:
+            serializer = TransactionSerializer(data=payload)
+            self.assertFalse(serializer.is_valid())
+            response = self.client.post(self.url, payload, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.json(), {"error": serializer.errors})
+
+        response = self.client.post(self.url, [1], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("non_field_errors", response.json()["error"])
+
+    def test_msgpack(self):
+        """Тест операции в формате MessagePack"""
+        response = self.client.post(
+            self.url,
+            msgspec.msgpack.encode({"operation_type": "DEPOSIT", "amount": "500.00"}),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        response_data = msgspec.msgpack.decode(response.content)
+        self.assertEqual(response_data["wallet"]["balance"], "1500.00")
+
+        response = self.client.post(self.url, b"\xc1", content_type="application/msgpack")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_successful_deposit_transaction(self):
         """Тест успешного пополнения"""
         response = self.client.post(self.url, self.valid_deposit_payload)
@@ -57,6 +142,7 @@ class CreateTransactionViewTests(APITestCase):
         response = self.client.post(self.url, self.valid_withdraw_payload)
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["wallet"]["balance"], "700.00")
         self.wallet.refresh_from_db()
         self.assertEqual(self.wallet.balance, Decimal("700.00"))
 
@@ -99,3 +185,1008 @@ class GetWalletBalanceViewTests(APITestCase):
 
         response = self.client.get(self.url)
         self.assertEqual(response.data["wallet"]["balance"], "2200.00")
+
+    def test_conditional_get(self):
+        """Тест ответа 304 по If-None-Match"""
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wallet.deposit(Decimal("500.00"))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["wallet"]["balance"], "2500.00")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_balance_as_of(self):
+        """Тест баланса на момент времени"""
+        self.wallet.deposit(Decimal("500.00"))
+
+        response = self.client.get(self.url, {"as_of": "2000-01-01T00:00:00Z"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["wallet"]["balance"], "0.00")
+
+        response = self.client.get(self.url, {"as_of": "2100-01-01T00:00:00Z"})
+        self.assertEqual(response.data["wallet"]["balance"], "500.00")
+
+        response = self.client.get(self.url, {"as_of": "not-a-date"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class WalletBusyViewTests(APITestCase):
+    @override_settings(WALLET_LOCK_QUEUE_SIZE=1)
+    def test_busy_wallet(self):
+        """Тест ответа 503 с Retry-After для занятого кошелька"""
+        wallet = Wallet.objects.create()
+        with contention.wallet_queue(wallet.pk):
+            response = self.client.post(
+                reverse("create-transaction", args=[wallet.uuid]),
+                {"operation_type": "DEPOSIT", "amount": "10.00"},
+                format="json",
+                HTTP_IDEMPOTENCY_KEY="busy",
+            )
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class TransferViewTests(APITestCase):
+    def setUp(self):
+        self.source = Wallet.objects.create(balance=Decimal("100.00"))
+        self.target = Wallet.objects.create(balance=Decimal("0.00"))
+        self.url = reverse("transfer")
+
+    def transfer(self, amount, target=None, **extra):
+        return self.client.post(
+            self.url,
+            {
+                "source_wallet_uuid": str(self.source.uuid),
+                "target_wallet_uuid": str(target or self.target.uuid),
+                "amount": amount,
+            },
+            format="json",
+            **extra,
+        )
+
+    def test_transfer(self):
+        """Тест успешного перевода"""
+        response = self.transfer("40.00")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["wallet"]["balance"], "60.00")
+        self.assertEqual(response.data["transfer"]["target_wallet_uuid"], str(self.target.uuid))
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.balance, Decimal("40.00"))
+
+    def test_invalid_transfer(self):
+        """Тест некорректных переводов"""
+        self.assertEqual(self.transfer("100.01").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.transfer("1.00", target=self.source.uuid).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        self.assertEqual(
+            self.transfer("1.00", target="not-a-uuid").status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        self.assertEqual(
+            self.transfer("1.00", target=uuid.uuid4()).status_code, status.HTTP_404_NOT_FOUND
+        )
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_idempotent_transfer(self):
+        """Тест повтора перевода с ключом идемпотентности"""
+        first = self.transfer("10.00", HTTP_IDEMPOTENCY_KEY="transfer-1")
+        second = self.transfer("10.00", HTTP_IDEMPOTENCY_KEY="transfer-1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+class BatchOperationsViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.first_wallet = Wallet.objects.create(balance=Decimal("100.00"))
+        self.second_wallet = Wallet.objects.create(balance=Decimal("0.00"))
+        self.url = reverse("batch-operations")
+
+    def test_batch_operations(self):
+        """Тест проведения пакета операций по нескольким кошелькам"""
+        operations = [
+            {"wallet_uuid": str(self.first_wallet.uuid), "operation_type": "WITHDRAW", "amount": "30.00"},
+            {"wallet_uuid": str(self.second_wallet.uuid), "operation_type": "DEPOSIT", "amount": "50.00"},
+            {"wallet_uuid": str(self.first_wallet.uuid), "operation_type": "WITHDRAW", "amount": "80.00"},
+            {"wallet_uuid": str(self.second_wallet.uuid), "operation_type": "WITHDRAW", "amount": "20.00"},
+            {"wallet_uuid": str(uuid.uuid4()), "operation_type": "DEPOSIT", "amount": "10.00"},
+            {"wallet_uuid": str(self.first_wallet.uuid), "operation_type": "DEPOSIT", "amount": "-1.00"},
+        ]
+        response = self.client.post(self.url, {"operations": operations}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["succeeded"], 3)
+        self.assertEqual(response.data["failed"], 3)
+
+        results = response.data["results"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["success", "success", "error", "success", "error", "error"],
+        )
+        self.assertEqual(results[0]["balance"], "70.00")
+        self.assertIn("Недостаточно средств", results[2]["error"])
+        self.assertEqual(results[3]["balance"], "30.00")
+        self.assertEqual(results[4]["error"], "Кошелек не найден")
+
+        self.first_wallet.refresh_from_db()
+        self.second_wallet.refresh_from_db()
+        self.assertEqual(self.first_wallet.balance, Decimal("70.00"))
+        self.assertEqual(self.second_wallet.balance, Decimal("30.00"))
+        self.assertEqual(self.first_wallet.transactions.count(), 1)
+        self.assertEqual(self.second_wallet.transactions.count(), 2)
+
+    def test_batch_with_invalid_item(self):
+        """Тест пакета с некорректной операцией"""
+        operations = [
+            {"wallet_uuid": "not-a-uuid", "operation_type": "DEPOSIT", "amount": "10.00"},
+            {"wallet_uuid": str(self.second_wallet.uuid), "operation_type": "DEPOSIT", "amount": "10.00"},
+        ]
+        response = self.client.post(self.url, {"operations": operations}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["status"], "error")
+        self.assertIn("wallet_uuid", response.data["results"][0]["error"])
+        self.assertEqual(response.data["results"][1]["balance"], "10.00")
+
+    def test_batch_without_operations(self):
+        """Тест пакета без операций"""
+        response = self.client.post(self.url, {"operations": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class WalletBucketViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.wallet = Wallet.objects.create(balance=Decimal("100.00"))
+        self.wallet.set_bucket_count(4)
+
+    def test_operation_and_balance_in_bucket_mode(self):
+        """Тест операций и баланса кошелька в режиме корзин"""
+        url = reverse("create-transaction", args=[self.wallet.uuid])
+        response = self.client.post(url, {"operation_type": "DEPOSIT", "amount": "50.00"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["wallet"]["balance"], "150.00")
+
+        response = self.client.get(reverse("wallet-balance", args=[self.wallet.uuid]))
+        self.assertEqual(response.data["wallet"]["balance"], "150.00")
+
+    def test_admin_changelist_balance(self):
+        """Тест баланса кошельков в режиме корзин в списке админ-панели"""
+        User.objects.create_superuser("admin", password="admin")
+        self.client.login(username="admin", password="admin")
+        url = reverse("admin:wallet_wallet_changelist")
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.client.get(url)
+
+        wallet = Wallet.objects.create(balance=Decimal("20.00"))
+        wallet.set_bucket_count(2)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        changelist = response.context["cl"]
+        self.assertEqual(
+            sorted(changelist.model_admin.total_balance(obj) for obj in changelist.result_list),
+            [Decimal("20.00"), Decimal("100.00")],
+        )
+
+
+class AsyncWalletViewTests(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create(balance=Decimal("1000.00"))
+        self.operation_url = reverse("async-create-transaction", args=[self.wallet.uuid])
+        self.balance_url = reverse("async-wallet-balance", args=[self.wallet.uuid])
+
+    async def test_deposit_and_withdraw(self):
+        """Тест операций через асинхронный эндпоинт"""
+        response = await self.async_client.post(
+            self.operation_url,
+            {"operation_type": "DEPOSIT", "amount": "500.00"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["wallet"]["balance"], "1500.00")
+        self.assertEqual(response.json()["transaction"]["type"], "deposit")
+
+        response = await self.async_client.post(
+            self.operation_url, {"operation_type": "WITHDRAW", "amount": "300.00"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["wallet"]["balance"], "1200.00")
+
+        response = await self.async_client.get(self.balance_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["wallet"]["balance"], "1200.00")
+
+    async def test_invalid_requests(self):
+        """Тест ошибок асинхронного эндпоинта"""
+        response = await self.async_client.post(
+            self.operation_url, {"operation_type": "WITHDRAW", "amount": "1500.00"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Недостаточно средств", response.json()["error"])
+
+        response = await self.async_client.post(
+            self.operation_url, {"operation_type": "INVALID", "amount": "500.00"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for wallet_uuid in (uuid.uuid4(), "not-a-uuid"):
+            url = reverse("async-wallet-balance", args=[wallet_uuid])
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        await self.wallet.arefresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("1000.00"))
+
+    async def test_msgpack(self):
+        """Тест асинхронного эндпоинта в формате MessagePack"""
+        response = await self.async_client.post(
+            self.operation_url,
+            msgspec.msgpack.encode({"operation_type": "DEPOSIT", "amount": "500.00"}),
+            content_type="application/msgpack",
+            ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        response_data = msgspec.msgpack.decode(response.content)
+        self.assertEqual(response_data["wallet"]["balance"], "1500.00")
+
+        response = await self.async_client.get(self.balance_url)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.json()["wallet"]["balance"], "1500.00")
+
+
+class DatabasePoolStatsViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("db-pool-stats")
+
+    def test_stats_for_admin_only(self):
+        """Тест доступа к метрикам пула соединений"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        User.objects.create_superuser("admin", password="admin")
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Basic " + base64.b64encode(b"admin:admin").decode()
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # В тестах используется SQLite без пула соединений.
+        self.assertEqual(response.data["pools"], {})
+
+
+class APIAuthenticationTests(APITestCase):
+    def setUp(self):
+        credential_cache.clear()
+        self.user = User.objects.create_superuser("admin", password="admin")
+        self.url = reverse("db-pool-stats")
+
+    def basic(self, password):
+        credentials = base64.b64encode(f"admin:{password}".encode()).decode()
+        return self.client.get(self.url, HTTP_AUTHORIZATION=f"Basic {credentials}")
+
+    def test_cached_basic_credentials(self):
+        """Тест повторной Basic-аутентификации без проверки пароля"""
+        with mock.patch.object(
+            ModelBackend, "authenticate", autospec=True, side_effect=ModelBackend.authenticate
+        ) as authenticate:
+            self.assertEqual(self.basic("admin").status_code, status.HTTP_200_OK)
+            self.assertEqual(self.basic("admin").status_code, status.HTTP_200_OK)
+            self.assertEqual(authenticate.call_count, 1)
+
+            # Неверный пароль не попадает в кеш.
+            self.assertEqual(self.basic("wrong").status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(self.basic("wrong").status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(authenticate.call_count, 3)
+
+    def test_password_change_invalidates_cache(self):
+        """Тест сброса кешированной проверки после смены пароля"""
+        self.assertEqual(self.basic("admin").status_code, status.HTTP_200_OK)
+
+        self.user.set_password("new")
+        self.user.save()
+        self.assertEqual(self.basic("admin").status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.basic("new").status_code, status.HTTP_200_OK)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.basic("new").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(WALLET_AUTH_CACHE_SIZE=1)
+    def test_cache_size(self):
+        """Тест вытеснения записей сверх WALLET_AUTH_CACHE_SIZE"""
+        user = User.objects.create_user("other", password="other")
+        credential_cache.set(credential_cache.make_key("admin", "admin"), self.user)
+        credential_cache.set(credential_cache.make_key("other", "other"), user)
+
+        self.assertIsNone(credential_cache.get(credential_cache.make_key("admin", "admin")))
+        self.assertIsNotNone(credential_cache.get(credential_cache.make_key("other", "other")))
+
+    def test_api_key(self):
+        """Тест аутентификации ключом API"""
+        api_key, key = APIKey.generate(self.user, name="test")
+        self.assertEqual(APIKey.objects.get().digest, APIKey.make_digest(key.split(".")[1]))
+
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f"Api-Key {key}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for invalid_key in (key + "x", api_key.prefix, "unknown.secret"):
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f"Api-Key {invalid_key}")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        api_key.is_active = False
+        api_key.save()
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f"Api-Key {key}")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_create_api_key_command(self):
+        """Тест команды create_api_key"""
+        output = io.StringIO()
+        call_command("create_api_key", "admin", name="test", stdout=output, stderr=io.StringIO())
+        self.assertEqual(APIKey.get_user(output.getvalue().strip()), self.user)
+
+
+class APIHandlerTests(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create(balance=Decimal("1000.00"))
+        self.router = WSGIRouter(WSGIHandler(), APIWSGIHandler())
+        self.factory = RequestFactory()
+
+    def test_routing(self):
+        """Тест выбора обработчика по пути запроса"""
+        self.assertIs(self.router.get_handler("/api/v1/wallets/"), self.router.api)
+        self.assertIs(self.router.get_handler("/metrics"), self.router.api)
+        self.assertIs(self.router.get_handler("/admin/login/"), self.router.default)
+
+    def test_api_middleware(self):
+        """Тест запроса к API без middleware админ-панели"""
+        path = reverse("wallet-balance", args=[self.wallet.uuid])
+        response = self.router.api.get_response(self.factory.get(path))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["wallet"]["balance"], "1000.00")
+        self.assertNotIn("X-Frame-Options", response)
+        self.assertEqual(response["X-Content-Type-Options"], "nosniff")
+
+        response = self.router.default.get_response(self.factory.get("/admin/login/"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Frame-Options"], "DENY")
+
+    def test_basic_authentication(self):
+        """Тест аутентификации представлением без AuthenticationMiddleware"""
+        User.objects.create_superuser("admin", "admin@example.com", "password")
+        credentials = base64.b64encode(b"admin:password").decode()
+        request = self.factory.get(
+            reverse("db-pool-stats"), HTTP_AUTHORIZATION=f"Basic {credentials}"
+        )
+        response = self.router.api.get_response(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.router.api.get_response(self.factory.get(reverse("db-pool-stats")))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class MetricsViewTests(APITestCase):
+    def test_metrics(self):
+        """Тест метрик Prometheus после операции через API"""
+        wallet = Wallet.objects.create()
+        response = self.client.post(
+            reverse("create-transaction", args=[wallet.uuid]),
+            {"operation_type": Transaction.DEPOSIT, "amount": "10.00"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content.decode()
+        self.assertIn(
+            'wallet_operations_total{operation_type="deposit",outcome="success"}', content
+        )
+        self.assertIn(
+            'wallet_http_request_duration_seconds_count{endpoint="create-transaction"',
+            content,
+        )
+        self.assertIn("wallet_http_request_db_queries_bucket", content)
+
+    def test_metrics_access(self):
+        """Тест доступа к метрикам только из внутренней сети или администратору"""
+        url = reverse("metrics")
+        response = self.client.get(url, REMOTE_ADDR="203.0.113.5")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with self.settings(WALLET_METRICS_ALLOWED_NETWORKS=["203.0.113.0/24"]):
+            response = self.client.get(
+                url, REMOTE_ADDR="203.0.113.5", HTTP_ACCEPT="text/plain;version=0.0.4"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        User.objects.create_superuser("admin", password="admin")
+        response = self.client.get(
+            url,
+            REMOTE_ADDR="203.0.113.5",
+            HTTP_AUTHORIZATION="Basic " + base64.b64encode(b"admin:admin").decode(),
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(
+    WALLET_PROFILING=True,
+    WALLET_PROFILING_SLOW_THRESHOLD=0,
+    WALLET_PROFILING_CPROFILE_RATE=1,
+)
+class ProfilingMiddlewareTests(APITestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create()
+        self.url = reverse("create-transaction", args=[self.wallet.uuid])
+
+    def deposit(self):
+        return self.client.post(
+            self.url, {"operation_type": "DEPOSIT", "amount": "10.00"}, format="json"
+        )
+
+    def test_server_timing(self):
+        """Тест заголовка Server-Timing с этапами запроса"""
+        response = self.deposit()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        phases = [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+        for phase in ("auth", "validation", "lock", "sql", "render", "total"):
+            self.assertIn(phase, phases)
+
+    @override_settings(WALLET_PROFILING=False)
+    def test_disabled(self):
+        """Тест отключенного профилирования"""
+        response = self.deposit()
+        self.assertNotIn("Server-Timing", response)
+        self.assertFalse(SlowRequest.objects.exists())
+
+    @override_settings(WALLET_PROFILING_KEEP=2)
+    def test_slow_requests(self):
+        """Тест сохранения медленных запросов и команды slow_requests"""
+        for _ in range(3):
+            self.deposit()
+        self.assertEqual(SlowRequest.objects.count(), 2)
+
+        request = SlowRequest.objects.latest("pk")
+        self.assertEqual(request.endpoint, "create-transaction")
+        self.assertEqual(request.status, status.HTTP_201_CREATED)
+        self.assertGreater(request.query_count, 0)
+        self.assertEqual(len(request.queries), request.query_count)
+        self.assertIn("lock", request.timings)
+        self.assertIn("cumulative", request.profile)
+
+        output = io.StringIO()
+        call_command("slow_requests", "--id", request.pk, stdout=output)
+        self.assertIn("create-transaction", output.getvalue())
+        self.assertIn("UPDATE", output.getvalue())
+
+
+class IdempotentTransactionViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.wallet = Wallet.objects.create(balance=Decimal("100.00"))
+        self.url = reverse("create-transaction", args=[self.wallet.uuid])
+        self.payload = {"operation_type": "DEPOSIT", "amount": "50.00"}
+
+    def test_replayed_request(self):
+        """Тест повтора запроса с тем же ключом идемпотентности"""
+        response = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY="key-1")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", response)
+
+        replayed = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY="key-1")
+        self.assertEqual(replayed.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replayed["Idempotent-Replayed"], "true")
+        self.assertEqual(replayed.data, response.data)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("150.00"))
+        self.assertEqual(Transaction.objects.filter(wallet=self.wallet).count(), 1)
+
+    def test_key_reused_for_other_request(self):
+        """Тест ключа идемпотентности, использованного для другого запроса"""
+        self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY="key-1")
+        response = self.client.post(
+            self.url,
+            {"operation_type": "WITHDRAW", "amount": "50.00"},
+            HTTP_IDEMPOTENCY_KEY="key-1",
+        )
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_rejected_operation_is_not_stored(self):
+        """Тест повтора отклоненной операции с тем же ключом"""
+        payload = {"operation_type": "WITHDRAW", "amount": "120.00"}
+        response = self.client.post(self.url, payload, HTTP_IDEMPOTENCY_KEY="key-1")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.wallet.deposit(Decimal("50.00"))
+        response = self.client.post(self.url, payload, HTTP_IDEMPOTENCY_KEY="key-1")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["wallet"]["balance"], "30.00")
+
+
+class TransactionHistoryViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.wallet = Wallet.objects.create(balance=Decimal("0.00"))
+        for amount in range(1, 6):
+            self.wallet.deposit(Decimal(amount))
+        self.wallet.withdraw(Decimal("1.00"))
+        self.url = reverse("transaction-history", args=[self.wallet.uuid])
+
+    def test_pages_by_cursor(self):
+        """Тест постраничного вывода истории по курсору"""
+        amounts, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            amounts += [txn["amount"] for txn in response.data["transactions"]]
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(amounts, ["1.00", "5.00", "4.00", "3.00", "2.00", "1.00"])
+
+    def test_filters(self):
+        """Тест фильтров истории по типу и дате"""
+        response = self.client.get(self.url, {"operation_type": "WITHDRAW"})
+        self.assertEqual(len(response.data["transactions"]), 1)
+        self.assertEqual(response.data["transactions"][0]["type"], "withdraw")
+
+        response = self.client.get(self.url, {"date_from": "2100-01-01T00:00:00Z"})
+        self.assertEqual(response.data["transactions"], [])
+
+    def test_invalid_requests(self):
+        """Тест некорректных запросов истории"""
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.url, {"limit": 100000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        url = reverse("transaction-history", args=[uuid.uuid4()])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TransactionExportViewTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.wallet = Wallet.objects.create(balance=Decimal("0.00"))
+        for amount in range(1, 4):
+            self.wallet.deposit(Decimal(amount))
+        self.wallet.withdraw(Decimal("1.00"))
+        self.url = reverse("transaction-export", args=[self.wallet.uuid])
+
+    def test_export_ndjson(self):
+        """Тест потоковой выгрузки транзакций кошелька в NDJSON"""
+        response = self.client.get(self.url, {"operation_type": "DEPOSIT"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["amount"] for row in rows], ["1.00", "2.00", "3.00"])
+        self.assertEqual(rows[0]["wallet"], str(self.wallet.uuid))
+
+    def test_export_csv_gzip(self):
+        """Тест выгрузки в CSV со сжатием gzip"""
+        response = self.client.get(self.url, {"output": "csv"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ["uuid", "wallet", "type", "amount", "timestamp"])
+        self.assertEqual(len(rows), 5)
+
+    def test_invalid_requests(self):
+        """Тест некорректных запросов выгрузки"""
+        response = self.client.get(self.url, {"output": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        url = reverse("transaction-export", args=[uuid.uuid4()])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_range_export_for_admin_only(self):
+        """Тест выгрузки транзакций всех кошельков за период"""
+        url = reverse("transaction-range-export")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        User.objects.create_superuser("admin", password="admin")
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Basic " + base64.b64encode(b"admin:admin").decode()
+        )
+        response = self.client.get(url, {"date_to": "2100-01-01T00:00:00Z"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 4)
+
+
+@override_settings(WALLET_DB_REPLICAS=["replica"], WALLET_BALANCE_CACHE=None)
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        replicas.replica_set.reset()
+        self.client = APIClient()
+        self.wallet = Wallet.objects.create(balance=Decimal("1000.00"))
+        self.balance_url = reverse("wallet-balance", args=[self.wallet.uuid])
+
+    def tearDown(self):
+        replicas.replica_set.reset()
+
+    def get(self, url, **extra):
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(replica.captured_queries)
+
+    def test_reads_from_replica(self):
+        """Тест чтения баланса, истории и баланса на момент времени с реплики"""
+        for url in (
+            self.balance_url,
+            self.balance_url + "?as_of=2100-01-01T00:00:00Z",
+            reverse("transaction-history", args=[self.wallet.uuid]),
+        ):
+            response, replica_queries = self.get(url)
+            self.assertGreater(replica_queries, 0, url)
+
+    def test_writes_stay_on_primary(self):
+        """Тест операций, чтений в транзакции и сохранения объекта с реплики"""
+        url = reverse("create-transaction", args=[self.wallet.uuid])
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.post(url, {"operation_type": "DEPOSIT", "amount": "10.00"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(replica), 0)
+
+        with replicas.read_from_replica():
+            self.assertEqual(router.db_for_read(Wallet), "replica")
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Wallet), "default")
+            wallet = Wallet.objects.get(pk=self.wallet.pk)
+        self.assertEqual(wallet._state.db, "replica")
+        self.assertEqual(router.db_for_write(Wallet, instance=wallet), "default")
+
+    def test_pinned_after_write(self):
+        """Тест чтения основной базы клиентом сразу после его операции"""
+        url = reverse("create-transaction", args=[self.wallet.uuid])
+        response = self.client.post(url, {"operation_type": "DEPOSIT", "amount": "10.00"})
+        pinned_until = response[replicas.PIN_HEADER]
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+        response, replica_queries = self.get(self.balance_url)
+        self.assertEqual(replica_queries, 0)
+        self.assertEqual(response.json()["wallet"]["balance"], "1010.00")
+
+        # Клиент без cookie передает заголовок.
+        self.client = APIClient()
+        response, replica_queries = self.get(
+            self.balance_url, HTTP_X_PRIMARY_PINNED_UNTIL=pinned_until
+        )
+        self.assertEqual(replica_queries, 0)
+        response, replica_queries = self.get(self.balance_url)
+        self.assertGreater(replica_queries, 0)
+
+    def test_lagging_replica_not_used(self):
+        """Тест чтения основной базы, если реплика отстает или недоступна"""
+        for lag in (60.0, None):
+            replicas.replica_set.reset()
+            with mock.patch.object(replicas, "measure_lag", return_value=lag) as measure:
+                self.get(self.balance_url)
+                response, replica_queries = self.get(self.balance_url)
+            self.assertEqual(replica_queries, 0)
+            self.assertEqual(measure.call_count, 1)
+
+    @override_settings(WALLET_BALANCE_CACHE="wallet_balance")
+    def test_cached_balance_from_primary(self):
+        """Тест загрузки баланса в кеш из основной базы"""
+        response, replica_queries = self.get(self.balance_url)
+        self.assertEqual(replica_queries, 0)
+
+    def test_admin_changelist(self):
+        """Тест списков админ-панели с реплики"""
+        User.objects.create_superuser("admin", password="admin")
+        self.client.login(username="admin", password="admin")
+        for name in ("admin:wallet_wallet_changelist", "admin:wallet_transaction_changelist"):
+            response, replica_queries = self.get(reverse(name))
+            self.assertGreater(replica_queries, 0, name)
+
+
+@override_settings(WALLET_SHARDS=["shard1", "shard2"], WALLET_SHARD_MAP_TTL=0)
+class ShardingTests(TransactionTestCase):
+    databases = {"default", "shard1", "shard2"}
+
+    def setUp(self):
+        # Слоты поровну между шардами, как после reshard --slots.
+        ShardSlot.objects.bulk_create(
+            ShardSlot(slot=slot, database=("shard1", "shard2")[slot % 2])
+            for slot in range(settings.WALLET_SHARD_SLOTS)
+        )
+        shards.shard_map.invalidate()
+        self.client = APIClient()
+
+    def tearDown(self):
+        shards.shard_map.invalidate()
+
+    def create_wallet(self, shard, balance="100.00"):
+        """Кошелек, uuid которого попадает в шард shard."""
+        while True:
+            wallet_uuid = uuid.uuid4()
+            if shards.shard_for(wallet_uuid) == shard:
+                return Wallet.objects.create(uuid=wallet_uuid, balance=Decimal(balance))
+
+    def deposit(self, wallet, amount, **extra):
+        url = reverse("create-transaction", args=[wallet.uuid])
+        return self.client.post(url, {"operation_type": "DEPOSIT", "amount": amount}, **extra)
+
+    def test_wallet_rows_in_wallet_shard(self):
+        """Тест хранения кошелька, его транзакций и ключей идемпотентности в его шарде"""
+        wallets = [self.create_wallet(shard) for shard in ("shard1", "shard2")]
+        for wallet in wallets:
+            response = self.deposit(wallet, "10.00", HTTP_IDEMPOTENCY_KEY=f"key-{wallet.uuid}")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        for wallet, shard, other in zip(wallets, ("shard1", "shard2"), ("shard2", "shard1")):
+            self.assertEqual(wallet._state.db, shard)
+            self.assertTrue(Transaction.objects.using(shard).filter(wallet=wallet).exists())
+            self.assertFalse(Wallet.objects.using(other).filter(pk=wallet.pk).exists())
+            key = IdempotencyKey.objects.using(shard).get(key=f"key-{wallet.uuid}")
+            self.assertEqual(key.wallet_uuid, wallet.uuid)
+        self.assertFalse(Wallet.objects.using("default").exists())
+
+        wallet = wallets[1]
+        response = self.client.get(reverse("wallet-balance", args=[wallet.uuid]))
+        self.assertEqual(response.json()["wallet"]["balance"], "110.00")
+        response = self.client.get(
+            reverse("wallet-balance", args=[wallet.uuid]), {"as_of": "2100-01-01T00:00:00Z"}
+        )
+        self.assertEqual(response.json()["wallet"]["balance"], "10.00")
+        response = self.client.get(reverse("transaction-history", args=[wallet.uuid]))
+        self.assertEqual(len(response.json()["transactions"]), 1)
+
+    def test_batch_and_transfers(self):
+        """Тест пакета операций по шардам и отклонения перевода между шардами"""
+        first, second = self.create_wallet("shard1"), self.create_wallet("shard2")
+        neighbour = self.create_wallet("shard1")
+        operations = [
+            {"wallet_uuid": str(second.uuid), "operation_type": "DEPOSIT", "amount": "5.00"},
+            {"wallet_uuid": str(first.uuid), "operation_type": "WITHDRAW", "amount": "30.00"},
+            {"wallet_uuid": str(second.uuid), "operation_type": "WITHDRAW", "amount": "500.00"},
+        ]
+        response = self.client.post(
+            reverse("batch-operations"), {"operations": operations}, format="json"
+        )
+        results = response.data["results"]
+        self.assertEqual([result["status"] for result in results], ["success", "success", "error"])
+        self.assertEqual(results[0]["balance"], "105.00")
+        self.assertEqual(results[1]["balance"], "70.00")
+
+        data = {"source_wallet_uuid": str(first.uuid), "amount": "10.00"}
+        response = self.client.post(
+            reverse("transfer"), {**data, "target_wallet_uuid": str(second.uuid)}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            reverse("transfer"), {**data, "target_wallet_uuid": str(neighbour.uuid)}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Wallet.objects.using("shard1").get(pk=neighbour.pk).balance, Decimal("110.00"))
+
+    def test_scatter_gather(self):
+        """Тест выгрузки периода и сверки балансов по всем шардам"""
+        wallets = [self.create_wallet(shard, "0") for shard in ("shard1", "shard2", "shard1")]
+        for wallet in wallets:
+            self.deposit(wallet, "1.00")
+            self.deposit(wallet, "2.00")
+
+        rows = list(Transaction.export_rows())
+        self.assertEqual(len(rows), 6)
+        self.assertEqual([row[1] for row in rows], sorted(wallet.uuid for wallet in wallets for _ in "12"))
+
+        Wallet.objects.using("shard2").filter(pk=wallets[1].pk).update(balance=Decimal("1.00"))
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("reconcile_wallets", workers=1, repair=True, stdout=stdout, stderr=stderr)
+        self.assertIn(str(wallets[1].uuid), stdout.getvalue())
+        self.assertIn("Расхождений: 1, исправлено: 1", stderr.getvalue())
+        self.assertEqual(Wallet.objects.using("shard2").get(pk=wallets[1].pk).balance, Decimal("3.00"))
+
+    def test_reshard(self):
+        """Тест переноса слота кошелька в другой шард со всеми его строками"""
+        wallet = self.create_wallet("shard1", balance="0")
+        for amount in ("1.00", "2.00", "3.00"):
+            self.deposit(wallet, amount, HTTP_IDEMPOTENCY_KEY=f"key-{amount}")
+        wallet.create_balance_checkpoint(1, as_of=timezone.now())
+        wallet.set_bucket_count(2)
+        transactions = list(
+            Transaction.objects.using("shard1").filter(wallet=wallet).values_list("uuid", "date_created")
+        )
+
+        slot = shards.slot_for(wallet.uuid)
+        call_command("reshard", init=True, stdout=io.StringIO())
+        stdout = io.StringIO()
+        call_command("reshard", "--slots", str(slot), "--to", "shard2", stdout=stdout)
+        self.assertIn("Перенесено кошельков: 1", stdout.getvalue())
+
+        self.assertEqual(shards.shard_for(wallet.uuid), "shard2")
+        self.assertFalse(Wallet.objects.using("shard1").filter(pk=wallet.pk).exists())
+        self.assertFalse(Transaction.objects.using("shard1").exists())
+        moved = Wallet.objects.for_wallet(wallet.uuid).get(pk=wallet.pk)
+        self.assertEqual(moved._state.db, "shard2")
+        self.assertEqual(moved.date_created, wallet.date_created)
+        self.assertEqual(moved.get_balance(), Decimal("6.00"))
+        self.assertEqual(moved.buckets.count(), 2)
+        self.assertCountEqual(
+            Transaction.objects.using("shard2").values_list("uuid", "date_created"), transactions
+        )
+        checkpoint = BalanceCheckpoint.objects.using("shard2").get(wallet=wallet)
+        self.assertEqual(
+            checkpoint.transaction_id,
+            Transaction.objects.using("shard2").order_by("date_created", "pk").last().pk,
+        )
+        self.assertEqual(IdempotencyKey.objects.using("shard2").count(), 3)
+
+        # Повтор запроса после переноса находит ключ в новом шарде.
+        response = self.deposit(wallet, "1.00", HTTP_IDEMPOTENCY_KEY="key-1.00")
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        response = self.deposit(wallet, "4.00")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(moved.get_ledger_balance(), Decimal("10.00"))
+
+    def test_import_ledger(self):
+        """Тест загрузки реестра по шардам и сообщения о загруженных шардах"""
+        wallets = [self.create_wallet(shard, "0") for shard in ("shard1", "shard2")]
+        unknown = uuid.uuid4()
+        while shards.shard_for(unknown) != "shard2":
+            unknown = uuid.uuid4()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "transactions.csv")
+        with open(path, "w") as file:
+            file.write("uuid,wallet,type,amount,timestamp\n")
+            for wallet_uuid in (*(wallet.uuid for wallet in wallets), unknown):
+                file.write(f",{wallet_uuid},deposit,1.00,2025-04-03T05:21:56+00:00\n")
+
+        with self.assertRaisesMessage(CommandError, "Загружены шарды: shard1"):
+            call_command("import_ledger", transactions=path, stdout=io.StringIO())
+        self.assertEqual(Transaction.objects.using("shard1").count(), 1)
+        self.assertFalse(Transaction.objects.using("shard2").exists())
+
+        # После исправления файла повторная загрузка не дублирует транзакции shard1.
+        with open(path) as file:
+            lines = file.readlines()[:-1]
+        with open(path, "w") as file:
+            file.writelines(lines)
+        call_command("import_ledger", transactions=path, stdout=io.StringIO())
+        for wallet, shard in zip(wallets, ("shard1", "shard2")):
+            self.assertEqual(Transaction.objects.using(shard).count(), 1)
+            self.assertEqual(Wallet.objects.using(shard).get(pk=wallet.pk).balance, Decimal("1.00"))
+
+    def test_enable_sharding(self):
+        """Тест включения шардирования: кошельки основной базы остаются в ней"""
+        ShardSlot.objects.all().delete()
+        with override_settings(WALLET_SHARDS=[]):
+            wallet = Wallet.objects.create(balance=Decimal("5.00"))
+            stdout = io.StringIO()
+            call_command("reshard", init=True, stdout=stdout)
+            self.assertIn(f"Добавлено слотов в карту: {settings.WALLET_SHARD_SLOTS}", stdout.getvalue())
+            self.assertEqual(set(ShardSlot.objects.values_list("database", flat=True)), {"default"})
+            ShardSlot.objects.all().delete()
+
+        with override_settings(WALLET_SHARDS=["default", "shard1"]):
+            shards.shard_map.invalidate()
+            # Слоты вне карты принадлежат первому шарду — основной базе.
+            self.assertEqual(shards.shard_for(wallet.uuid), "default")
+            response = self.client.get(reverse("wallet-balance", args=[wallet.uuid]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.deposit(wallet, "1.00").status_code, status.HTTP_201_CREATED)
+
+    def test_writes_rejected_while_moving(self):
+        """Тест отклонения операций кошелька переносимого слота"""
+        wallet = self.create_wallet("shard1")
+        ShardSlot.objects.filter(slot=shards.slot_for(wallet.uuid)).update(is_moving=True)
+
+        response = self.deposit(wallet, "10.00")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn("Retry-After", response)
+        response = self.client.get(reverse("wallet-balance", args=[wallet.uuid]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Запись с явным using проверяется так же, как запись через маршрутизатор.
+        with self.assertRaises(WalletBusyException):
+            wallet.set_bucket_count(2, using="shard1")
+        User.objects.create_superuser("admin", password="admin")
+        self.client.login(username="admin", password="admin")
+        response = self.client.post(
+            reverse("admin:wallet_wallet_changelist") + "?shard=shard1",
+            {"action": "enable_buckets", "_selected_action": [str(wallet.pk)]},
+            follow=True,
+        )
+        self.assertContains(response, "Кошелек переносится в другой шард")
+        self.assertEqual(Wallet.objects.using("shard1").get(pk=wallet.pk).bucket_count, 0)
+
+    def test_admin(self):
+        """Тест списков и страниц объектов админ-панели по шардам"""
+        wallet = self.create_wallet("shard2")
+        self.deposit(wallet, "10.00")
+        User.objects.create_superuser("admin", password="admin")
+        self.client.login(username="admin", password="admin")
+
+        response = self.client.get(reverse("admin:wallet_wallet_changelist"))
+        self.assertNotContains(response, str(wallet.uuid))
+        self.assertContains(response, "shard2 (1)")
+        response = self.client.get(reverse("admin:wallet_wallet_changelist"), {"shard": "shard2"})
+        self.assertContains(response, str(wallet.uuid))
+
+        response = self.client.get(reverse("admin:wallet_wallet_change", args=[wallet.uuid]))
+        self.assertContains(response, "110.00")
+        txn = Transaction.objects.using("shard2").get()
+        url = reverse("admin:wallet_transaction_change", args=[txn.pk])
+        response = self.client.get(url, {"_changelist_filters": "shard=shard2"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, "10.00")
+
+
+@tag("benchmark")
+class WalletBenchmarkTest(TransactionTestCase):
+    """
+    Нагрузочный тест API. Объем нагрузки задается WALLET_BENCHMARK_OPERATIONS;
+    запуск только нагрузочных тестов: manage.py test apps --tag benchmark,
+    без них: --exclude-tag benchmark.
+    """
+
+    def test_benchmark(self):
+        """Тест пропускной способности и корректности балансов под нагрузкой"""
+        operations = int(os.environ.get("WALLET_BENCHMARK_OPERATIONS", 200))
+        result = WalletBenchmark(
+            wallets=10, hot_share=0.8, concurrency=4, operations=operations, seed=1
+        ).run()
+
+        self.assertTrue(result["correctness"]["correct"], result["correctness"])
+        self.assertEqual(sum(result["statuses"].values()), operations)
+        self.assertGreater(result["throughput"], 0)
+        self.assertFalse(Wallet.objects.exists())
+
+    def test_bidirectional_transfers(self):
+        """Тест встречных переводов между двумя кошельками без взаимных блокировок"""
+        operations = int(os.environ.get("WALLET_BENCHMARK_OPERATIONS", 200))
+        result = WalletBenchmark(
+            wallets=2, transfer_share=1, concurrency=8, operations=operations, seed=1
+        ).run()
+
+        self.assertTrue(result["correctness"]["correct"], result["correctness"])
+        self.assertEqual(result["deadlocks"], 0)
+        self.assertEqual(result["statuses"], {"transfer 201": operations})
+
+    def test_serialization(self):
+        """Тест микробенчмарка проверки, разбора и отрисовки операции"""
+        result = SerializationBenchmark(iterations=10, repeat=1).run()
+
+        for name in ("validation", "parsing", "rendering", "rendering_msgpack", "request"):
+            self.assertGreater(result["us_per_call"][name]["lean"], 0)
+
+    def test_middleware(self):
+        """Тест микробенчмарка облегченного конвейера API"""
+        result = MiddlewareBenchmark(iterations=10, repeat=1).run()
+
+        self.assertGreater(result["us_per_request"]["api"], 0)
+        self.assertFalse(Wallet.objects.exists())
+
+    def test_money(self):
+        """Тест микробенчмарка сумм в минимальных единицах"""
+        result = MoneyBenchmark(iterations=10, repeat=1, rows=100).run()
+
+        self.assertGreater(result["us_per_call"]["sum"]["minor_units"], 0)
+        self.assertGreater(result["index_bytes"]["bigint"], 0)
+        self.assertGreater(result["index_bytes"]["numeric(12, 2)"], 0)
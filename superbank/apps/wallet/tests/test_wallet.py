@@ -1,11 +1,34 @@
+import gzip
+import io
+import json
+import os
+import tempfile
 import time
+import uuid
 from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from decimal import Decimal as D
+from unittest import mock, skipUnless
 
-from django.test import TestCase, TransactionTestCase
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 
-from apps.wallet.api.exceptions import InvalidAmountException, InvalidTypeException
-from apps.wallet.models import Transaction, Wallet
+from psycopg import errors
+
+from apps.wallet import contention, money
+from apps.wallet.api.exceptions import (
+    InvalidAmountException,
+    InvalidTransferException,
+    InvalidTypeException,
+    WalletBusyException,
+)
+from apps.wallet.cache import balance_cache
+from apps.wallet.db import partitions, replicas
+from apps.wallet.models import IdempotencyKey, Transaction, Wallet
 
 
 class WalletModelTest(TestCase):
@@ -70,6 +93,74 @@ class WalletModelTest(TestCase):
         with self.assertRaises(InvalidTypeException):
             self.wallet.transaction(D("100.00"), "invalid_type")
 
+    def test_withdraw_with_stale_balance(self):
+        """Тест снятия, когда баланс объекта устарел: проверку выполняет база данных"""
+        stale_wallet = Wallet(uuid=self.wallet.uuid)
+        stale_wallet.withdraw(D("1000.00"))
+
+        self.assertEqual(stale_wallet.balance, D("0.00"))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, D("0.00"))
+
+    def test_insufficient_funds_does_not_create_transaction(self):
+        """Тест, что отклоненное снятие не создает транзакцию"""
+        with self.assertRaises(InvalidAmountException):
+            self.wallet.withdraw(D("1000.01"))
+
+        self.assertFalse(self.wallet.transactions.exists())
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, D("1000.00"))
+
+    def test_transaction_for_non_existing_wallet(self):
+        """Тест транзакции для несуществующего кошелька"""
+        with self.assertRaises(Wallet.DoesNotExist):
+            Wallet().deposit(D("100.00"))
+
+    def test_negative_balance_constraint(self):
+        """Тест ограничения на отрицательный баланс в базе данных"""
+        self.wallet.balance = D("-1.00")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.wallet.save()
+
+
+class MoneyTest(TestCase):
+    def test_minor_units(self):
+        """Тест перевода сумм в минимальные единицы валюты и обратно"""
+        self.assertEqual(money.to_minor(D("1234.57")), 123457)
+        self.assertEqual(money.to_minor(D("0.005")), 0)
+        self.assertEqual(money.to_minor(D("0.015")), 2)
+        self.assertEqual(money.to_minor(5), 500)
+        self.assertEqual(money.from_minor(123457), D("1234.57"))
+        self.assertEqual(money.to_minor(D("1.5"), "JPY"), 2)
+        self.assertEqual(money.to_minor(D("1.5"), "KWD"), 1500)
+
+    @override_settings(DEFAULT_CURRENCY="JPY")
+    def test_currency_exponent(self):
+        """Тест точности сумм валюты реестра"""
+        self.assertEqual(money.get_quantum(), D("1"))
+        self.assertEqual(money.to_minor(D("1500")), 1500)
+
+    def test_stored_as_integer(self):
+        """Тест хранения баланса целым числом без ограничения в 12 знаков"""
+        balance = D("1234567890123456.78")
+        wallet = Wallet.objects.create(balance=balance)
+        wallet.deposit(D("0.01"))
+
+        self.assertEqual(
+            Wallet.objects.filter(pk=wallet.pk).values_list("balance", flat=True).get(),
+            balance + D("0.01"),
+        )
+        self.assertEqual(wallet.get_ledger_balance(), D("0.01"))
+        self.assertEqual(Wallet.objects.filter(balance__gt=balance).count(), 1)
+
+    def test_invalid_value(self):
+        """Тест некорректной суммы"""
+        field = Wallet._meta.get_field("balance")
+        with self.assertRaises(ValidationError):
+            field.to_python("NaN")
+        with self.assertRaises(ValidationError):
+            field.to_python("abc")
+
 
 class WalletModelConcurrentTest(TransactionTestCase):
 
@@ -107,6 +198,123 @@ class WalletModelConcurrentTest(TransactionTestCase):
         )
 
 
+class WalletTransferTest(TestCase):
+    def setUp(self):
+        self.source = Wallet.objects.create(balance=D("100.00"))
+        self.target = Wallet.objects.create(balance=D("10.00"))
+
+    def test_transfer(self):
+        """Тест перевода со связанными транзакциями снятия и внесения"""
+        withdraw, deposit = self.source.transfer(self.target.pk, D("30.00"))
+        self.assertEqual(self.source.balance, D("70.00"))
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.balance, D("40.00"))
+
+        self.assertEqual(withdraw.transfer_uuid, deposit.transfer_uuid)
+        self.assertEqual(
+            list(
+                Transaction.objects.filter(transfer_uuid=withdraw.transfer_uuid)
+                .order_by("operation_type")
+                .values_list("wallet_id", "operation_type", "amount")
+            ),
+            [
+                (self.target.pk, Transaction.DEPOSIT, D("30.00")),
+                (self.source.pk, Transaction.WITHDRAW, D("30.00")),
+            ],
+        )
+
+    def test_transfer_rejected(self):
+        """Тест отказа в переводе без изменения кошельков"""
+        with self.assertRaises(InvalidAmountException):
+            self.source.transfer(self.target.pk, D("100.01"))
+        with self.assertRaises(InvalidAmountException):
+            self.source.transfer(self.target.pk, D("-1.00"))
+        with self.assertRaises(InvalidTransferException):
+            self.source.transfer(self.source.pk, D("1.00"))
+        with self.assertRaises(Wallet.DoesNotExist):
+            self.source.transfer(uuid.uuid4(), D("1.00"))
+
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.balance, D("100.00"))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_transfer_in_bucket_mode(self):
+        """Тест перевода на кошелек в режиме корзин и обратно"""
+        self.target.set_bucket_count(4)
+        self.source.transfer(self.target.pk, D("30.00"))
+        Wallet(uuid=self.target.pk).transfer(self.source.pk, D("5.00"))
+
+        self.assertEqual(Wallet.objects.get(pk=self.source.pk).get_balance(), D("75.00"))
+        self.assertEqual(Wallet.objects.get(pk=self.target.pk).get_balance(), D("35.00"))
+
+
+def database_error(cause):
+    """Ошибка Django, оборачивающая ошибку psycopg, как при выполнении запроса."""
+    error = OperationalError(str(cause))
+    error.__cause__ = cause
+    return error
+
+
+class WalletContentionTest(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create(balance=D("100.00"))
+
+    def test_error_classification(self):
+        """Тест разделения ошибок базы данных на повторяемые и остальные"""
+        self.assertTrue(contention.is_retryable(database_error(errors.SerializationFailure())))
+        self.assertTrue(contention.is_retryable(database_error(errors.DeadlockDetected())))
+        self.assertFalse(contention.is_retryable(database_error(errors.LockNotAvailable())))
+        self.assertTrue(contention.is_retryable(OperationalError("database is locked")))
+        self.assertTrue(contention.is_lock_timeout(database_error(errors.LockNotAvailable())))
+        self.assertFalse(contention.is_lock_timeout(database_error(errors.UniqueViolation())))
+
+    def test_serialization_failure_retried(self):
+        """Тест повтора операции после ошибки сериализации"""
+        change_balance = Wallet._change_balance
+        failures = [database_error(errors.SerializationFailure())]
+
+        def flaky(wallet, *args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return change_balance(wallet, *args, **kwargs)
+
+        with mock.patch.object(Wallet, "_change_balance", flaky):
+            self.wallet.deposit(D("10.00"))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, D("110.00"))
+
+    def test_lock_timeout_not_retried(self):
+        """Тест отказа без повторов, если блокировку кошелька не удалось получить"""
+        error = database_error(errors.LockNotAvailable())
+        with mock.patch.object(Wallet, "_change_balance", side_effect=error) as change:
+            with self.assertRaises(WalletBusyException) as raised:
+                self.wallet.deposit(D("10.00"))
+        self.assertEqual(change.call_count, 1)
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(raised.exception.wait, 1)
+
+    def test_other_database_errors_not_retried(self):
+        """Тест передачи остальных ошибок базы данных без повторов"""
+        error = database_error(errors.UniqueViolation())
+        with mock.patch.object(Wallet, "_change_balance", side_effect=error) as change:
+            with self.assertRaises(OperationalError):
+                self.wallet.deposit(D("10.00"))
+        self.assertEqual(change.call_count, 1)
+
+    @override_settings(WALLET_LOCK_QUEUE_SIZE=1)
+    def test_wallet_queue_full(self):
+        """Тест отказа операции, если очередь операций кошелька заполнена"""
+        with contention.wallet_queue(self.wallet.pk):
+            with self.assertRaises(WalletBusyException):
+                self.wallet.deposit(D("10.00"))
+            Wallet.objects.create().deposit(D("10.00"))
+        self.assertEqual(contention.wallet_queue.depth(self.wallet.pk), 0)
+
+        self.wallet.deposit(D("10.00"))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, D("110.00"))
+
+
 class WalletBalanceTest(TestCase):
     def test_balance_update_consistency(self):
         """Тест согласованности обновления баланса"""
@@ -135,3 +343,531 @@ class WalletBalanceTest(TestCase):
         wallet.deposit(D("0.20"))
 
         self.assertEqual(wallet.balance, D("0.30"))
+
+
+@override_settings(WALLET_COALESCE_ENABLED=True, WALLET_COALESCE_WINDOW=0.05)
+class WalletCoalescedOperationsTest(TransactionTestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create(balance=D("100.00"))
+
+    def _run_concurrently(self, task, num_threads):
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            futures = [executor.submit(task) for _ in range(num_threads)]
+            return [future.exception() for future in futures]
+
+    def test_coalesced_deposits(self):
+        """Тест группового проведения одновременных пополнений"""
+
+        def deposit_task():
+            wallet = Wallet(uuid=self.wallet.uuid)
+            wallet.deposit(D("10.00"))
+
+        errors = self._run_concurrently(deposit_task, 10)
+
+        self.assertEqual(errors, [None] * 10)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, D("200.00"))
+        self.assertEqual(self.wallet.transactions.count(), 10)
+
+    @override_settings(WALLET_LOCK_QUEUE_SIZE=2)
+    def test_queue_size_limits_groups(self):
+        """Тест, что очередь кошелька не ограничивает размер группы операций"""
+
+        def deposit_task():
+            wallet = Wallet(uuid=self.wallet.uuid)
+            wallet.deposit(D("10.00"))
+
+        errors = self._run_concurrently(deposit_task, 10)
+
+        self.assertEqual(errors, [None] * 10)
+        self.assertEqual(contention.wallet_queue.depth(self.wallet.pk), 0)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, D("200.00"))
+
+    def test_coalesced_withdraws_with_insufficient_funds(self):
+        """Тест, что отказ по недостаточности средств получают только лишние снятия"""
+
+        def withdraw_task():
+            wallet = Wallet(uuid=self.wallet.uuid)
+            wallet.withdraw(D("30.00"))
+
+        errors = self._run_concurrently(withdraw_task, 5)
+
+        rejected = [error for error in errors if error is not None]
+        self.assertEqual(len(rejected), 2)
+        for error in rejected:
+            self.assertIsInstance(error, InvalidAmountException)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, D("10.00"))
+        self.assertEqual(self.wallet.transactions.count(), 3)
+
+    def test_operation_inside_atomic_block_is_not_coalesced(self):
+        """Тест, что операция внутри внешней транзакции проводится отдельно"""
+        with transaction.atomic():
+            self.wallet.deposit(D("10.00"))
+
+        self.assertEqual(self.wallet.balance, D("110.00"))
+
+
+class WalletBucketTest(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create(balance=D("100.00"))
+
+    def test_enable_buckets(self):
+        """Тест включения режима корзин с переносом баланса в корзины"""
+        self.wallet.set_bucket_count(4)
+
+        self.assertEqual(self.wallet.bucket_count, 4)
+        self.assertEqual(self.wallet.balance, D("0.00"))
+        self.assertEqual(
+            sorted(self.wallet.buckets.values_list("balance", flat=True)),
+            [D("25.00")] * 4,
+        )
+        self.assertEqual(self.wallet.get_balance(), D("100.00"))
+
+    def test_operations_in_bucket_mode(self):
+        """Тест пополнений и снятий в режиме корзин"""
+        self.wallet.set_bucket_count(4)
+
+        for _ in range(5):
+            self.wallet.deposit(D("10.00"))
+        # Снятие больше баланса любой корзины проводится по всем корзинам.
+        self.wallet.withdraw(D("120.00"))
+
+        self.assertEqual(self.wallet.get_balance(), D("30.00"))
+        self.assertEqual(self.wallet.transactions.count(), 6)
+        with self.assertRaises(InvalidAmountException):
+            self.wallet.withdraw(D("30.01"))
+
+    def test_operation_with_stale_bucket_mode(self):
+        """Тест операций объекта, не знающего о смене режима кошелька"""
+        stale_wallet = Wallet.objects.get(pk=self.wallet.pk)
+        self.wallet.set_bucket_count(2)
+        stale_wallet.withdraw(D("100.00"))
+
+        self.wallet.set_bucket_count(0)
+        stale_wallet.deposit(D("10.00"))
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.bucket_count, 0)
+        self.assertEqual(self.wallet.balance, D("10.00"))
+        self.assertFalse(self.wallet.buckets.exists())
+
+    def test_disable_buckets(self):
+        """Тест выключения режима корзин"""
+        self.wallet.set_bucket_count(3)
+        self.wallet.deposit(D("0.01"))
+        self.wallet.set_bucket_count(0)
+
+        self.assertEqual(self.wallet.balance, D("100.01"))
+        self.assertFalse(self.wallet.buckets.exists())
+
+    def test_spread_remainder(self):
+        """Тест распределения баланса по корзинам с остатком от деления"""
+        self.wallet.set_bucket_count(3)
+
+        self.assertEqual(
+            list(self.wallet.buckets.order_by("index").values_list("balance", flat=True)),
+            [D("33.34"), D("33.33"), D("33.33")],
+        )
+        self.assertEqual(self.wallet.get_balance(), D("100.00"))
+
+    def test_batch_operations_in_bucket_mode(self):
+        """Тест пакетного проведения операций кошелька в режиме корзин"""
+        self.wallet.set_bucket_count(4)
+        operations = [
+            {"wallet_uuid": self.wallet.uuid, "operation_type": Transaction.WITHDRAW, "amount": D("90.00")},
+            {"wallet_uuid": self.wallet.uuid, "operation_type": Transaction.WITHDRAW, "amount": D("20.00")},
+        ]
+        results = Wallet.batch_transactions(operations)
+
+        self.assertEqual([result["status"] for result in results], ["success", "error"])
+        self.assertEqual(self.wallet.get_balance(), D("10.00"))
+
+
+@override_settings(WALLET_BALANCE_CACHE="wallet_balance")
+class WalletBalanceCacheTest(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create(balance=D("100.00"))
+        balance_cache.cache.clear()
+
+    def test_cached_balance_invalidated_on_commit(self):
+        """Тест сброса кешированного баланса после фиксации операции"""
+        self.assertEqual(Wallet.get_cached_balance(self.wallet.pk)[0], D("100.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wallet.deposit(D("50.00"))
+        with self.assertNumQueries(1):
+            self.assertEqual(Wallet.get_cached_balance(self.wallet.pk)[0], D("150.00"))
+        with self.assertNumQueries(0):
+            self.assertEqual(Wallet.get_cached_balance(self.wallet.pk)[0], D("150.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Wallet.batch_transactions(
+                [
+                    {
+                        "wallet_uuid": self.wallet.pk,
+                        "operation_type": Transaction.WITHDRAW,
+                        "amount": D("30.00"),
+                    }
+                ]
+            )
+        self.assertEqual(Wallet.get_cached_balance(self.wallet.pk)[0], D("120.00"))
+
+    def test_pinned_client_bypasses_local_cache(self):
+        """Тест чтения баланса мимо кеша процесса клиентом после изменяющего запроса"""
+        self.assertEqual(Wallet.get_cached_balance(self.wallet.pk)[0], D("100.00"))
+        # Баланс изменен другим воркером: сброс в кеш этого процесса не попал.
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=D("70.00"))
+        self.assertEqual(Wallet.get_cached_balance(self.wallet.pk)[0], D("100.00"))
+
+        token = replicas.pin(True)
+        try:
+            self.assertEqual(Wallet.get_cached_balance(self.wallet.pk)[0], D("70.00"))
+        finally:
+            replicas.unpin(token)
+
+    def test_fill_overlapping_invalidation_discarded(self):
+        """Тест отказа от записи в кеш баланса, сброшенного во время загрузки"""
+        balances = [D("1.00"), D("2.00")]
+
+        def loader():
+            balance = balances.pop(0)
+            # Изменение зафиксировано после чтения баланса, но до записи в кеш.
+            balance_cache.delete_many([self.wallet.pk])
+            return balance, None
+
+        self.assertEqual(balance_cache.get(self.wallet.pk, loader), (D("1.00"), None))
+        self.assertEqual(balance_cache.get(self.wallet.pk, loader), (D("2.00"), None))
+
+        # Значение, записанное до сброса, не читается после него.
+        self.assertEqual(balance_cache.get(self.wallet.pk, lambda: (D("3.00"), None))[0], D("3.00"))
+        balance_cache.delete_many([self.wallet.pk])
+        self.assertEqual(balance_cache.get(self.wallet.pk, lambda: (D("4.00"), None))[0], D("4.00"))
+
+    def test_concurrent_misses_load_once(self):
+        """Тест одной загрузки баланса при одновременных промахах"""
+        loads = []
+
+        def loader():
+            loads.append(None)
+            time.sleep(0.1)
+            return D("1.00"), None
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            futures = [
+                executor.submit(balance_cache.get, self.wallet.pk, loader)
+                for _ in range(10)
+            ]
+            results = [future.result() for future in futures]
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(results, [(D("1.00"), None)] * 10)
+
+
+class IdempotencyKeyTest(TransactionTestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create(balance=D("100.00"))
+
+    def test_concurrent_duplicates_run_once(self):
+        """Тест одного проведения операции при одновременных повторах"""
+
+        def handler():
+            self.wallet.deposit(D("10.00"))
+            time.sleep(0.1)
+            return 201, {"status": "success"}
+
+        def task():
+            return IdempotencyKey.execute("key-1", "hash", handler)
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = [future.result() for future in [executor.submit(task) for _ in range(5)]]
+
+        self.assertEqual(sorted(replayed for _, _, replayed in results), [False] + [True] * 4)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, D("110.00"))
+
+    def test_prune_expired_keys(self):
+        """Тест удаления просроченных ключей"""
+        IdempotencyKey.objects.create(key="old", request_hash="hash")
+        IdempotencyKey.objects.create(key="new", request_hash="hash")
+        IdempotencyKey.objects.filter(key="old").update(
+            date_created=timezone.now() - timedelta(days=2)
+        )
+
+        self.assertEqual(IdempotencyKey.prune(batch_size=1), 1)
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)), ["new"]
+        )
+
+
+@override_settings(WALLET_CHECKPOINT_LAG=0)
+class BalanceCheckpointTest(TestCase):
+    def setUp(self):
+        self.wallet = Wallet.objects.create()
+        for amount in ("100.00", "50.00"):
+            self.wallet.deposit(D(amount))
+        self.wallet.withdraw(D("30.00"))
+
+    def test_ledger_balance_from_checkpoint(self):
+        """Тест баланса по транзакциям после контрольной точки"""
+        self.assertIsNone(self.wallet.create_balance_checkpoint(min_transactions=10))
+        checkpoint = self.wallet.create_balance_checkpoint(min_transactions=1)
+        self.assertEqual(checkpoint.balance, D("120.00"))
+
+        self.wallet.deposit(D("5.00"))
+        self.assertEqual(self.wallet.get_ledger_balance(), D("125.00"))
+        self.assertEqual(
+            self.wallet.get_ledger_balance(as_of=checkpoint.as_of), D("120.00")
+        )
+
+        # Следующая точка учитывает только транзакции после предыдущей.
+        checkpoint = self.wallet.create_balance_checkpoint(min_transactions=1)
+        self.assertEqual(checkpoint.balance, D("125.00"))
+
+    def test_checkpoint_invalidated_on_transaction_change(self):
+        """Тест удаления контрольной точки при изменении учтенной транзакции"""
+        self.wallet.create_balance_checkpoint(min_transactions=1)
+        first = self.wallet.transactions.order_by("pk").first()
+
+        first.amount = D("200.00")
+        first.save()
+        self.assertFalse(self.wallet.checkpoints.exists())
+        self.assertEqual(self.wallet.get_ledger_balance(), D("220.00"))
+
+        self.wallet.create_balance_checkpoint(min_transactions=1)
+        first.delete()
+        self.assertFalse(self.wallet.checkpoints.exists())
+        self.assertEqual(self.wallet.get_ledger_balance(), D("20.00"))
+
+    def test_checkpoint_as_of(self):
+        """Тест контрольной точки на заданный момент времени"""
+        boundary = timezone.now()
+        self.wallet.transactions.update(date_created=boundary - timedelta(days=1))
+        self.wallet.deposit(D("5.00"))
+
+        checkpoint = self.wallet.create_balance_checkpoint(
+            min_transactions=1, as_of=boundary - timedelta(microseconds=1)
+        )
+        self.assertEqual(checkpoint.balance, D("120.00"))
+        self.assertLess(checkpoint.as_of, boundary)
+
+        # Изменение транзакции после точки ее не сбрасывает.
+        last = self.wallet.transactions.order_by("pk").last()
+        last.amount = D("10.00")
+        last.save()
+        self.assertTrue(self.wallet.checkpoints.exists())
+        self.assertEqual(self.wallet.get_ledger_balance(), D("130.00"))
+
+
+class ImportLedgerTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.wallet_uuid = str(uuid.uuid4())
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with gzip.open(path, "wt") if name.endswith(".gz") else open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def test_import_ledger(self):
+        """Тест загрузки кошельков и транзакций с пересчетом баланса"""
+        wallets = self.write("wallets.csv", f"uuid,date_created\n{self.wallet_uuid},\n")
+        transactions = self.write(
+            "transactions.ndjson.gz",
+            "".join(
+                json.dumps(
+                    {
+                        "wallet": self.wallet_uuid,
+                        "type": operation_type,
+                        "amount": amount,
+                        "timestamp": "2025-04-03T05:21:56+00:00",
+                    }
+                )
+                + "\n"
+                for operation_type, amount in (("DEPOSIT", "155.00"), ("withdraw", "120.00"))
+            ),
+        )
+        call_command(
+            "import_ledger", wallets=wallets, transactions=transactions, stdout=io.StringIO()
+        )
+
+        wallet = Wallet.objects.get(pk=self.wallet_uuid)
+        self.assertEqual(wallet.balance, D("35.00"))
+        self.assertEqual(wallet.transactions.filter(uuid__isnull=False).count(), 2)
+
+    def test_import_repeated(self):
+        """Тест повторной загрузки того же файла без дублирования транзакций"""
+        Wallet.objects.create(uuid=self.wallet_uuid)
+        transactions = self.write(
+            "transactions.csv",
+            "uuid,wallet,type,amount,timestamp\n"
+            f"{uuid.uuid4()},{self.wallet_uuid},deposit,10.00,2025-04-03T05:21:56+00:00\n"
+            f",{self.wallet_uuid},deposit,5.00,2025-04-03T05:21:56+00:00\n"
+            f",{self.wallet_uuid},deposit,5.00,2025-04-03T05:21:56+00:00\n",
+        )
+        call_command("import_ledger", transactions=transactions, stdout=io.StringIO())
+        stdout = io.StringIO()
+        call_command("import_ledger", transactions=transactions, stdout=stdout)
+
+        self.assertIn("пропущено уже загруженных: 3", stdout.getvalue())
+        self.assertIn("транзакций: 0", stdout.getvalue())
+        wallet = Wallet.objects.get(pk=self.wallet_uuid)
+        self.assertEqual(wallet.transactions.count(), 3)
+        self.assertEqual(wallet.balance, D("20.00"))
+
+    def test_import_rejects_excess_precision(self):
+        """Тест отмены загрузки суммы точнее минимальной единицы валюты"""
+        Wallet.objects.create(uuid=self.wallet_uuid)
+        transactions = self.write(
+            "transactions.csv",
+            "uuid,wallet,type,amount,timestamp\n"
+            f",{self.wallet_uuid},deposit,10.005,2025-04-03T05:21:56+00:00\n",
+        )
+        with self.assertRaisesMessage(CommandError, "точнее минимальной единицы"):
+            call_command("import_ledger", transactions=transactions, stdout=io.StringIO())
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_import_aborted_for_unknown_wallet(self):
+        """Тест отмены загрузки транзакций несуществующего кошелька"""
+        transactions = self.write(
+            "transactions.csv",
+            "uuid,wallet,type,amount,timestamp\n"
+            f",{self.wallet_uuid},deposit,10.00,2025-04-03T05:21:56+00:00\n",
+        )
+        with self.assertRaises(CommandError):
+            call_command("import_ledger", transactions=transactions, stdout=io.StringIO())
+        self.assertFalse(Transaction.objects.exists())
+
+
+@skipUnless(connection.vendor == "postgresql", "Партиции транзакций есть только в PostgreSQL")
+class TransactionPartitionTest(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def detach_legacy(self):
+        """Отсоединение партиции старых транзакций; после теста она присоединяется снова."""
+        bound = partitions.get_upper_bound(connection, partitions.LEGACY_PARTITION)
+        call_command(
+            "detach_transaction_partitions", "--before", f"{bound:%Y-%m}", stdout=io.StringIO()
+        )
+
+        def attach():
+            with connection.cursor() as cursor:
+                cursor.execute(f"TRUNCATE {partitions.LEGACY_PARTITION}")
+                cursor.execute(
+                    f"ALTER TABLE {partitions.TABLE} ATTACH PARTITION {partitions.LEGACY_PARTITION} "
+                    f"FOR VALUES FROM (MINVALUE) TO ({partitions.bound(bound)})"
+                )
+
+        self.addCleanup(attach)
+        return bound
+
+    def test_import_after_detach(self):
+        """Тест загрузки в кошелек, часть транзакций которого отсоединена с партицией"""
+        wallet = Wallet.objects.create()
+        wallet.deposit(D("100.00"))
+        bound = self.detach_legacy()
+
+        path = os.path.join(self.directory, "transactions.csv")
+        with open(path, "w") as file:
+            file.write(
+                "uuid,wallet,type,amount,timestamp\n"
+                f",{wallet.pk},deposit,10.00,{bound + timedelta(days=1):%Y-%m-%dT%H:%M:%S}+00:00\n"
+            )
+        call_command("import_ledger", transactions=path, stdout=io.StringIO())
+
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, D("110.00"))
+        self.assertEqual(wallet.get_ledger_balance(), D("110.00"))
+
+        # Транзакции отсоединенных месяцев учтены контрольной точкой и не загружаются.
+        with open(path, "w") as file:
+            file.write(
+                "uuid,wallet,type,amount,timestamp\n"
+                f",{wallet.pk},deposit,10.00,{bound - timedelta(days=1):%Y-%m-%dT%H:%M:%S}+00:00\n"
+            )
+        with self.assertRaisesMessage(CommandError, "партиции отсоединены"):
+            call_command("import_ledger", transactions=path, stdout=io.StringIO())
+
+    def test_import_after_last_partition(self):
+        """Тест загрузки транзакции месяца, партиция которого еще не создана"""
+        self.assertFalse(partitions.has_default_partition(connection))
+        until = partitions.get_partitioned_until(connection)
+        wallet = Wallet.objects.create()
+
+        path = os.path.join(self.directory, "transactions.csv")
+        with open(path, "w") as file:
+            file.write(
+                "uuid,wallet,type,amount,timestamp\n"
+                f",{wallet.pk},deposit,10.00,{until:%Y-%m-%dT%H:%M:%S}+00:00\n"
+            )
+        with self.assertRaisesMessage(CommandError, "партиции не созданы"):
+            call_command("import_ledger", transactions=path, stdout=io.StringIO())
+
+    def test_create_partition_moves_default_rows(self):
+        """Тест создания партиции месяца, строки которого уже в партиции по умолчанию"""
+        if not partitions.has_default_partition(connection):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TABLE {partitions.DEFAULT_PARTITION} "
+                    f"PARTITION OF {partitions.TABLE} DEFAULT"
+                )
+            self.addCleanup(self.drop_tables, partitions.DEFAULT_PARTITION)
+        month = partitions.add_months(partitions.get_partitions(connection)[-1][0], 1)
+        wallet = Wallet.objects.create()
+        wallet.deposit(D("10.00"))
+        wallet.transactions.update(date_created=month + timedelta(days=1))
+
+        created = partitions.create_partitions(connection, partitions.add_months(month, 1))
+        self.addCleanup(self.drop_tables, *created)
+
+        self.assertEqual(created, [partitions.partition_name(month)])
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {created[0]}")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute(f"SELECT count(*) FROM {partitions.DEFAULT_PARTITION}")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(wallet.get_ledger_balance(), D("10.00"))
+
+    def drop_tables(self, *names):
+        with connection.cursor() as cursor:
+            for name in names:
+                cursor.execute(f"DROP TABLE IF EXISTS {name}")
+
+
+class ReconcileWalletsTest(TestCase):
+    def setUp(self):
+        self.wallets = [Wallet.objects.create() for _ in range(3)]
+        for wallet in self.wallets:
+            wallet.deposit(D("10.10"))
+            wallet.withdraw(D("0.10"))
+        self.wallets[0].create_balance_checkpoint(min_transactions=1, as_of=timezone.now())
+        self.wallets[0].deposit(D("5.00"))
+        self.wallets[1].set_bucket_count(2)
+        Wallet.objects.filter(pk=self.wallets[2].pk).update(balance=D("1.00"))
+
+    def test_find_balance_mismatches(self):
+        """Тест поиска кошельков с балансом, расходящимся с транзакциями"""
+        self.assertEqual(
+            Wallet.find_balance_mismatches(),
+            [(self.wallets[2].pk, D("1.00"), D("10.00"))],
+        )
+        # Конец диапазона uuid в него не входит.
+        self.assertEqual(Wallet.find_balance_mismatches(end=self.wallets[2].pk), [])
+
+    def test_reconcile_and_repair(self):
+        """Тест сверки балансов с исправлением расхождений"""
+        report = io.StringIO()
+        call_command(
+            "reconcile_wallets", workers=1, repair=True, stdout=report, stderr=io.StringIO()
+        )
+        self.assertIn(f"{self.wallets[2].pk},1.00,10.00,-9.00", report.getvalue())
+
+        self.assertEqual(Wallet.objects.get(pk=self.wallets[2].pk).balance, D("10.00"))
+        self.assertEqual(Wallet.find_balance_mismatches(), [])
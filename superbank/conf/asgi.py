@@ -10,8 +10,13 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 import os
 from decouple import config
 
-from django.core.asgi import get_asgi_application
+from apps.wallet.handlers import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", config("DJANGO_SETTINGS_MODULE"))
 
 application = get_asgi_application()
+
+# Соединения пула открываются при старте воркера, а не на первых запросах.
+from apps.wallet.db.pool import warm_up  # noqa: E402
+
+warm_up()
@@ -1 +1,96 @@
+# Валюта реестра (код ISO 4217). Суммы хранятся в ее минимальных единицах
+# (apps.wallet.money): смена валюты с другим числом знаков требует пересчета сумм.
 DEFAULT_CURRENCY = "RUB"
+
+# Максимальное количество операций в одном запросе пакетного проведения.
+WALLET_BATCH_MAX_OPERATIONS = 10000
+
+# Групповое проведение одновременных операций одного кошелька (apps.wallet.coalescer).
+# Операции, пришедшие за WALLET_COALESCE_WINDOW секунд, проводятся под одной блокировкой.
+WALLET_COALESCE_ENABLED = False
+WALLET_COALESCE_WINDOW = 0.005
+WALLET_COALESCE_MAX_OPERATIONS = 500
+
+# Количество корзин баланса при включении режима корзин из админ-панели.
+WALLET_BUCKET_COUNT = 8
+
+# Сколько кошельков в режиме корзин процесс помнит без чтения кошелька перед операцией;
+# лишними вытесняются давно использованные.
+WALLET_BUCKET_COUNT_HINTS_SIZE = 10000
+
+# Пул асинхронных соединений PostgreSQL для асинхронных эндпоинтов (apps.wallet.db.async_pool).
+WALLET_ASYNC_POOL_MIN_SIZE = 2
+WALLET_ASYNC_POOL_MAX_SIZE = 20
+WALLET_ASYNC_POOL_TIMEOUT = 5
+
+# Псевдоним кеша балансов кошельков из CACHES (apps.wallet.cache), None — без кеша.
+# Общий кеш (Redis) видит сбросы всех воркеров; кеш в памяти процесса wallet_balance
+# отстает от изменений других воркеров не больше чем на свой TIMEOUT.
+WALLET_BALANCE_CACHE = None
+
+# Через сколько секунд ключ идемпотентности удаляется командой prune_idempotency_keys.
+WALLET_IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Размер страницы истории транзакций кошелька по умолчанию и максимальный.
+WALLET_HISTORY_DEFAULT_LIMIT = 50
+WALLET_HISTORY_MAX_LIMIT = 500
+
+# Сколько транзакций выгрузка читает из базы за одну выборку серверного курсора.
+WALLET_EXPORT_CHUNK_SIZE = 2000
+
+# Контрольные точки баланса (create_balance_checkpoints): точка создается, если после
+# предыдущей накопилось WALLET_CHECKPOINT_MIN_TRANSACTIONS транзакций, и учитывает только
+# транзакции старше WALLET_CHECKPOINT_LAG секунд.
+WALLET_CHECKPOINT_MIN_TRANSACTIONS = 10000
+WALLET_CHECKPOINT_LAG = 60
+
+# На сколько месяцев вперед create_transaction_partitions создает партиции транзакций.
+WALLET_TRANSACTION_PARTITIONS_AHEAD = 3
+
+# Профилирование запросов к API (apps.wallet.profiling): заголовок Server-Timing и
+# сохранение медленных запросов. Запрос дольше WALLET_PROFILING_SLOW_THRESHOLD секунд
+# сохраняется с вероятностью WALLET_PROFILING_SAMPLE_RATE, хранятся последние
+# WALLET_PROFILING_KEEP. Доля WALLET_PROFILING_CPROFILE_RATE запросов выполняется под cProfile.
+WALLET_PROFILING = False
+WALLET_PROFILING_SLOW_THRESHOLD = 0.5
+WALLET_PROFILING_SAMPLE_RATE = 1.0
+WALLET_PROFILING_KEEP = 100
+WALLET_PROFILING_CPROFILE_RATE = 0.0
+
+# Конкуренция за строку кошелька (apps.wallet.contention). Операция ждет блокировку
+# не дольше WALLET_LOCK_TIMEOUT секунд (PostgreSQL; None — без ограничения, 0 — не ждет)
+# и затем отклоняется с ответом 503 и Retry-After: WALLET_LOCK_RETRY_AFTER секунд.
+# Процесс проводит или ждет не больше WALLET_LOCK_QUEUE_SIZE операций одного кошелька
+# (0 — без ограничения; группа операций apps.wallet.coalescer считается одной).
+# Ошибки сериализации и взаимоблокировки повторяются WALLET_SERIALIZATION_RETRIES раз.
+WALLET_LOCK_TIMEOUT = 1
+WALLET_LOCK_RETRY_AFTER = 1
+WALLET_LOCK_QUEUE_SIZE = 16
+WALLET_SERIALIZATION_RETRIES = 3
+
+# Кеш успешных проверок пароля Basic-аутентификации в памяти процесса
+# (apps.wallet.api.authentication.CredentialCache): не больше WALLET_AUTH_CACHE_SIZE
+# записей, каждая не дольше WALLET_AUTH_CACHE_TTL секунд. 0 — кеш выключен.
+WALLET_AUTH_CACHE_SIZE = 10000
+WALLET_AUTH_CACHE_TTL = 300
+
+# Сети, из которых GET /metrics доступен без аутентификации (сервер Prometheus);
+# остальным — только администраторам, как статистика пулов соединений.
+WALLET_METRICS_ALLOWED_NETWORKS = ["127.0.0.0/8", "::1/128"]
+
+# Чтение с реплик (apps.wallet.db.replicas): псевдонимы реплик из DATABASES. После
+# изменяющего запроса клиент читает основную базу WALLET_REPLICA_PIN_SECONDS секунд.
+# Реплика, отстающая больше WALLET_REPLICA_MAX_LAG секунд, не используется; отставание
+# проверяется не чаще раза в WALLET_REPLICA_LAG_CHECK_INTERVAL секунд.
+WALLET_DB_REPLICAS = []
+WALLET_REPLICA_PIN_SECONDS = 5
+WALLET_REPLICA_MAX_LAG = 1
+WALLET_REPLICA_LAG_CHECK_INTERVAL = 1
+
+# Шардирование кошельков (apps.wallet.db.shards): псевдонимы шардов из DATABASES, пустой
+# список — все кошельки в основной базе. Кошелек принадлежит слоту
+# crc32(uuid) % WALLET_SHARD_SLOTS; карта слотов перечитывается не чаще раза
+# в WALLET_SHARD_MAP_TTL секунд. Количество слотов после заполнения карты не меняется.
+WALLET_SHARDS = []
+WALLET_SHARD_SLOTS = 1024
+WALLET_SHARD_MAP_TTL = 5
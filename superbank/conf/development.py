@@ -18,5 +18,29 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        # Файловая тестовая база: у in-memory базы с общим кешем блокировки
+        # таблиц не ждут освобождения, и конкурентные тесты падают случайно.
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+    },
+    # Та же база под вторым псевдонимом: в тестах — реплика для чтения
+    # (WALLET_DB_REPLICAS = ["replica"], apps.wallet.db.replicas).
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    },
+    # Шарды кошельков для тестов и проверки reshard (WALLET_SHARDS, apps.wallet.db.shards).
+    "shard1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "shard1.sqlite3",
+        "TEST": {"NAME": BASE_DIR / "test_shard1.sqlite3"},
+    },
+    "shard2": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "shard2.sqlite3",
+        "TEST": {"NAME": BASE_DIR / "test_shard2.sqlite3"},
+    },
 }
+
+# SQLite создает индекс истории транзакций без INCLUDE-полей, это нормально.
+SILENCED_SYSTEM_CHECKS = ["models.W040"]
@@ -0,0 +1,7 @@
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Режим multiprocess prometheus_client: значения gauge завершившегося воркера
+    # больше не учитываются.
+    multiprocess.mark_process_dead(worker.pid)
@@ -17,11 +17,36 @@ ALLOWED_HOSTS = ["*"]
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "apps.wallet.db.backends.postgresql",
         "NAME": os.getenv("DB_NAME"),
         "USER": os.getenv("DB_USER"),
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": "db",
         "PORT": "5432",
+        # Соединения берутся из пула воркера (apps.wallet.db.backends.postgresql)
+        # и проверяются перед выдачей.
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {"pool": {"min_size": 2, "max_size": 10, "timeout": 5}},
     }
 }
+
+# Кеш балансов в памяти воркера (conf.settings.CACHES["wallet_balance"]): баланс,
+# измененный другим воркером, виден не позже чем через секунду. При общем кеше
+# (Redis) достаточно указать здесь его псевдоним.
+WALLET_BALANCE_CACHE = "wallet_balance"
+
+# Реплики для чтения (apps.wallet.db.replicas): DB_REPLICA_HOSTS="replica1,replica2".
+for number, host in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), 1):
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+WALLET_DB_REPLICAS = [alias for alias in DATABASES if alias.startswith("replica")]
+
+# Шарды кошельков (apps.wallet.db.shards): DB_SHARD_HOSTS="shard1,shard2". Основная база —
+# первый шард. Перед добавлением шарда карту нужно заполнить командой reshard --init.
+WALLET_SHARDS = []
+for number, host in enumerate(filter(None, os.getenv("DB_SHARD_HOSTS", "").split(",")), 1):
+    DATABASES[f"shard{number}"] = {**DATABASES["default"], "HOST": host.strip()}
+    WALLET_SHARDS = [*(WALLET_SHARDS or ["default"]), f"shard{number}"]
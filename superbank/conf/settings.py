@@ -30,6 +30,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "apps.wallet.middleware.ProfilingMiddleware",
+    "apps.wallet.middleware.MetricsMiddleware",
+    "apps.wallet.middleware.ReplicaPinMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -39,6 +42,17 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Запросы к API кошелька (пути с префиксами WALLET_API_PATHS) conf.wsgi и conf.asgi
+# обрабатывают без middleware админ-панели (apps.wallet.handlers).
+WALLET_API_PATHS = ["/api/", "/metrics"]
+WALLET_API_MIDDLEWARE = [
+    "apps.wallet.middleware.ProfilingMiddleware",
+    "apps.wallet.middleware.MetricsMiddleware",
+    "apps.wallet.middleware.ReplicaPinMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    "django.middleware.common.CommonMiddleware",
+]
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -60,11 +74,47 @@ ROOT_URLCONF = "conf.urls"
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly"
-    ]
+    ],
+    # JSON и MessagePack через msgspec (apps.wallet.api.renderers).
+    "DEFAULT_RENDERER_CLASSES": [
+        "apps.wallet.api.renderers.JSONRenderer",
+        "apps.wallet.api.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "apps.wallet.api.parsers.JSONParser",
+        "apps.wallet.api.parsers.MessagePackParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 WSGI_APPLICATION = "conf.wsgi.application"
 
+# Запросы кошельков идут в их шарды WALLET_SHARDS (apps.wallet.db.shards), чтения
+# внутри read_from_replica — на реплики WALLET_DB_REPLICAS (apps.wallet.db.replicas).
+DATABASE_ROUTERS = [
+    "apps.wallet.db.shards.ShardRouter",
+    "apps.wallet.db.replicas.ReplicaRouter",
+]
+
+# Кеш балансов кошельков (WALLET_BALANCE_CACHE, по умолчанию выключен). LocMemCache
+# хранится в памяти воркера и подходит только для одного процесса; для нескольких
+# воркеров нужен общий кеш (Redis).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Кеш балансов в памяти процесса (apps.wallet.cache): сбросы других воркеров
+    # в нем не видны, поэтому значения живут не дольше секунды.
+    "wallet_balance": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "wallet-balance",
+        "TIMEOUT": 1,
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
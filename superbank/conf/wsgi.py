@@ -10,8 +10,13 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 import os
 from decouple import config
 
-from django.core.wsgi import get_wsgi_application
+from apps.wallet.handlers import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", config("DJANGO_SETTINGS_MODULE"))
 
 application = get_wsgi_application()
+
+# Соединения пула открываются при старте воркера, а не на первых запросах.
+from apps.wallet.db.pool import warm_up  # noqa: E402
+
+warm_up()